@@ -0,0 +1,82 @@
+"""
+Micro benchmark of Cleanser.map_values against the former np.select implementation.
+
+Usage:
+    python benchmarks/bench_map_values.py [--rows 1000000] [--input-dir data_in]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from crba_project.cleanse import Cleanser
+from crba_project.mappings import import_mapping_script
+
+
+def map_values_np_select(cleansed_data, value_mapping_dict):
+    """
+    The former implementation: One boolean mask per mapped value, combined with np.select
+    """
+    for key in value_mapping_dict:
+        if key not in cleansed_data.columns:
+            continue
+        original_values = []
+        mapped_values = []
+        for sub_key in value_mapping_dict[key]:
+            for list_element in range(len(value_mapping_dict[key][sub_key])):
+                original_values += [cleansed_data[key] == value_mapping_dict[key][sub_key][list_element]]
+            mapped_values += len(value_mapping_dict[key][sub_key]) * [sub_key]
+        original_values += [cleansed_data[key].isnull()]
+        original_values += [cleansed_data[key] == ""]
+        original_values += [cleansed_data[key] == "_T"]
+        mapped_values += [np.nan, np.nan, "_T"]
+        cleansed_data[key] = np.select(original_values, mapped_values, "UNMAPPED VALUE - PLEASE MAP")
+    return cleansed_data
+
+
+def synthetic_frame(value_mapper, rows, seed=0):
+    """
+    Frame with all columns of the value_mapper. Mostly mapped values, some unmapped, empty and NaN values
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for key, targets in value_mapper.items():
+        values = [value for values in targets.values() for value in values]
+        values += ["NOT MAPPED", "", "_T", np.nan]
+        data[key] = np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+    return pd.DataFrame(data)
+
+
+def timeit(function, frame, repeat):
+    timings = []
+    for _ in range(repeat):
+        copy = frame.copy()
+        start = time.perf_counter()
+        result = function(copy)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--input-dir", default="data_in")
+    args = parser.parse_args()
+
+    value_mapper = import_mapping_script(f"{args.input_dir}/value_mapping.py").value_mapper
+
+    frame = synthetic_frame(value_mapper, args.rows)
+    value_lookup = Cleanser.compile_value_mapping(value_mapper)
+
+    old_time, old = timeit(lambda df: map_values_np_select(df, value_mapper), frame, args.repeat)
+    new_time, new = timeit(lambda df: Cleanser.map_values(df, value_lookup=value_lookup), frame, args.repeat)
+
+    # np.select turned the NaN targets into the string "nan"
+    old = old.replace("nan", np.nan)
+    assert old.equals(new.astype(object)), "Results differ"
+
+    print(f"{args.rows} rows, {len(value_mapper)} columns")
+    print(f"np.select:   {old_time:.3f}s")
+    print(f"Series.map:  {new_time:.3f}s ({old_time / new_time:.1f}x)")
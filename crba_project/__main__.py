@@ -6,6 +6,12 @@ from pathlib import Path
 
 from crba_project.conf import Config
 import crba_project.etl
+import crba_project.scenarios
+from crba_project.executor import EXECUTOR_TYPES
+from crba_project.extractor.cache import CACHE_MODES
+from crba_project.output import OUTPUT_FORMATS, PARQUET_COMPRESSIONS
+from crba_project.output.star import OUTPUT_LAYOUTS
+from crba_project.validation import VALIDATION_MODES, VALIDATORS
 from crba_project.log import configure_exception_log_handler, configure_exception_log_handler_short, configure_log_flow_full, configure_log_flow_stdout
 
 def parse_args():
@@ -41,16 +47,158 @@ def parse_args():
     parser.add_argument(
         "-c",
         "--caching",
-        help="If the request should be cached",
+        help="If the request should be cached. Same as --cache-mode read",
         default=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--cache-mode",
+        help="off: no cache. read: use cached payloads, revalidate the stale ones. refresh: download everything and update the cache. offline: only use the cache",
+        choices=CACHE_MODES,
+        default="off",
+        dest="cache_mode",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the payload cache. Default ~/.cache/crba_project/payloads",
+        default=None,
+        dest="cache_dir",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        help="Hours a cached payload is used without asking the server. Sources can override it with the CACHE_TTL_HOURS column",
+        type=float,
+        default=24,
+        dest="cache_ttl",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        help="Maximum size of the payload cache in MB. The least recently used payloads get evicted",
+        type=int,
+        default=2048,
+        dest="cache_max_size",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of sources which get extracted in parallel",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--executor",
+        help="How the sources get parallelised. Thread is best for the download heavy sources",
+        choices=EXECUTOR_TYPES,
+        default="thread",
+    )
+    parser.add_argument(
+        "--prefetch-per-host",
+        help="Maximum number of parallel downloads per host while prefetching the API sources",
+        type=int,
+        default=4,
+        dest="prefetch_per_host",
+    )
+    parser.add_argument(
+        "--http-timeout",
+        help="Seconds to wait for a connection or a response of an API",
+        type=float,
+        default=120,
+        dest="http_timeout",
+    )
+    parser.add_argument(
+        "--http-retries",
+        help="How often a failed request (connection error, 429, 5xx) is retried with exponential backoff",
+        type=int,
+        default=5,
+        dest="http_retries",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Directory or run id (e.g. latest) of a previous run. Sources with unchanged config and payload reuse its outputs",
+        default=None,
+        metavar="PREVIOUS_RUN",
+    )
+    parser.add_argument(
+        "--output-format",
+        help="Format of the datasets of the run. Parquet keeps the dtypes and is faster to load, but needs pyarrow",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        dest="output_format",
+    )
+    parser.add_argument(
+        "--compression",
+        help="Compression of the parquet files. Default snappy",
+        choices=PARQUET_COMPRESSIONS,
+        default=None,
+    )
+    parser.add_argument(
+        "--output-layout",
+        help="Layout of crba_final. wide: One table with all attributes and scores. star: Fact table plus indicator, source, country and score tables. both: Both",
+        choices=OUTPUT_LAYOUTS,
+        default="wide",
+        dest="output_layout",
+    )
+    parser.add_argument(
+        "--browsers",
+        help="Maximum number of headless browsers per process for the scraped sources (ILO)",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--static-html-first",
+        help="Try to find the tables of the scraped sources in the static HTML before starting a browser",
+        default=False,
+        action="store_true",
+        dest="static_html_first",
+    )
+    parser.add_argument(
+        "--validation",
+        help="Validate every source as soon as it is extracted: all rows (full), a random sample of the rows (sample) or not at all (off)",
+        choices=VALIDATION_MODES,
+        default="full",
+    )
+    parser.add_argument(
+        "--validator",
+        help="native: Evaluate the expectation suite with pandas, Great Expectations only for unsupported expectation types. gx: Run the Great Expectations checkpoint (stores the results and data docs)",
+        choices=VALIDATORS,
+        default="native",
+    )
+    parser.add_argument(
+        "--no-snapshot-cache",
+        help="Parse the Excel files of the input dir on every run instead of using the snapshots of former runs",
+        default=True,
+        action="store_false",
+        dest="snapshot_cache",
+    )
     parser.add_argument(
         "-dry-run",
         help="do not run the etls",
         default=False,
         action="store_true",
     )
+    subparsers = parser.add_subparsers(dest="command")
+    scenarios = subparsers.add_parser(
+        "scenarios",
+        help="Evaluate aggregation/normalization variants on the combined_normalized dataset of a former run, without extracting the sources",
+    )
+    scenarios.add_argument(
+        "scenarios_path",
+        help="JSON list of scenarios. See crba_project/scenarios.py",
+    )
+    scenarios.add_argument(
+        "--run",
+        help="Directory or run id (e.g. latest) of the run with the combined_normalized dataset",
+        default="latest",
+        dest="scenarios_run",
+    )
+    scenarios.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes the scenarios get evaluated in. Default the number of CPUs",
+        type=int,
+        default=None,
+        dest="scenario_jobs",
+    )
 
     return parser.parse_args()
 
@@ -70,7 +218,9 @@ if __name__ == "__main__":
         print(config.run_id)
 
     atexit.register(exit_handler)
-    atexit.register(create_symlink_latest,config)
+    if args.command != "scenarios":
+        # latest stays the last run with extracted data
+        atexit.register(create_symlink_latest,config)
     #Configure global Logging
     configure_log_flow_stdout(args.LogLevel)
     configure_exception_log_handler(config)
@@ -84,7 +234,10 @@ if __name__ == "__main__":
     # BEGIN OF ETL
     #
     if not args.dry_run:
-        crba_project.etl.run(config)
+        if args.command == "scenarios":
+            crba_project.scenarios.run(config, args.scenarios_run, args.scenarios_path, jobs=args.scenario_jobs)
+        else:
+            crba_project.etl.run(config)
     
 
 
@@ -0,0 +1,235 @@
+"""
+Aggregation of the indicator scores into category, issue, index and overall scores.
+
+The scores are computed level by level, each level from the groups of the level below:
+
+* Category score: Mean of the SCALED_OBS_VALUE per country, category, issue and index
+* Issue score: Weighted mean of the category scores per country, issue and index
+* Index score: Weighted mean of the issue scores per country and index
+* Overall score: Weighted mean of the index scores per country
+
+The weights, the mean (arithmetic or geometric) and the risk thresholds are defined by the AggregationSchema,
+see crba_project.aggregate.schema.
+
+The groups are numbered with integer codes and reduced with np.bincount. The results are joined back
+to the groups of the level below and to the rows of the combined dataset by these codes, without merges.
+Missing scores are skipped like in pandas' mean. The codes are computed once per dataset by the
+ScoreAggregator, evaluating another schema only repeats the reductions.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from crba_project.aggregate.schema import MEAN_TYPES, RISK_QUANTILES, AggregationSchema
+
+log = logging.getLogger(__name__)
+
+EXCLUDED_COUNTRIES = ("XKX",)
+
+CATEGORY_KEYS = ["COUNTRY_ISO_3", "INDICATOR_CATEGORY", "INDICATOR_ISSUE", "INDICATOR_INDEX"]
+# Order of the rows of the aggregated scores
+CATEGORY_ORDER = ["COUNTRY_ISO_3", "INDICATOR_INDEX", "INDICATOR_ISSUE", "INDICATOR_CATEGORY"]
+ISSUE_KEYS = ["COUNTRY_ISO_3", "INDICATOR_ISSUE", "INDICATOR_INDEX"]
+INDEX_KEYS = ["COUNTRY_ISO_3", "INDICATOR_INDEX"]
+COUNTRY_KEYS = ["COUNTRY_ISO_3"]
+
+
+def group_codes(frame: pd.DataFrame, keys, mask=None):
+    """
+    Number the groups of the key columns like DataFrame.groupby(keys, sort=True) does.
+
+    Parameters:
+    frame (pd.DataFrame): Dataframe with the key columns
+    keys (list): Key columns
+    mask (np.ndarray): Optional boolean array. Rows where it is False get no group
+
+    Return:
+    Tuple of the group code per row (-1 for rows without group, e.g. with a missing key)
+    and a dataframe with the keys of each group, in the order of the codes
+    """
+    key_codes = []
+    levels = []
+    for key in keys:
+        column = frame[key]
+        # Categorical columns are factorized on their codes, in the order of the categories
+        if isinstance(column.dtype, pd.CategoricalDtype) and not column.cat.categories.is_monotonic_increasing:
+            column = column.cat.reorder_categories(column.cat.categories.sort_values())
+        codes, uniques = pd.factorize(column, sort=True)
+        key_codes.append(codes)
+        levels.append(uniques)
+
+    missing = np.zeros(len(frame), dtype=bool) if mask is None else ~np.asarray(mask, dtype=bool)
+    for codes in key_codes:
+        missing |= codes < 0
+
+    shape = tuple(max(len(level), 1) for level in levels)
+    flat = np.ravel_multi_index([np.where(missing, 0, codes) for codes in key_codes], shape)
+    # np.unique sorts, so the groups are in the lexicographic order of the keys
+    group_flat, group_of_row = np.unique(flat[~missing], return_inverse=True)
+
+    row_codes = np.full(len(frame), -1, dtype=np.int64)
+    row_codes[~missing] = group_of_row
+    group_keys = pd.DataFrame(
+        {key: level.take(codes) for key, level, codes in zip(keys, levels, np.unravel_index(group_flat, shape))}
+    )
+    return row_codes, group_keys
+
+
+def grouped_mean(codes, values, n_groups, weights=None, mean="arithmetic"):
+    """
+    (Weighted) mean of the values per group. Missing values and rows without group (-1) are skipped.
+    NaN for groups without values or with a total weight of 0
+
+    Parameters:
+    codes (np.ndarray): Group code per value, see group_codes
+    values (np.ndarray): Values
+    n_groups (int): Number of groups
+    weights (np.ndarray): Optional weight per value
+    mean (str): One of MEAN_TYPES. The geometric mean of a group containing 0 is 0
+
+    Return:
+    np.ndarray with the mean per group
+    """
+    if mean not in MEAN_TYPES:
+        raise ValueError(f"Unknown mean:{mean}. Choose one of {MEAN_TYPES}")
+    values = np.asarray(values, dtype="float64")
+    valid = (codes >= 0) & ~np.isnan(values)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype="float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if mean == "geometric":
+            values = np.log(values)
+        # 0 * -inf (weight 0 and value 0 of a geometric mean) must not turn the group into NaN
+        weighted = np.where(weights[valid] > 0, values[valid] * weights[valid], 0.0)
+        total = np.bincount(codes[valid], weights=weighted, minlength=n_groups)
+        count = np.bincount(codes[valid], weights=weights[valid], minlength=n_groups)
+        result = np.where(count > 0, total / count, np.nan)
+        return np.exp(result) if mean == "geometric" else result
+
+
+def risk_category(scores, quantiles=RISK_QUANTILES):
+    """
+    High, medium or low risk per score, by the quantiles of all scores.
+    Scores equal to one of the thresholds and missing scores get no category (NaN)
+    """
+    scores = pd.Series(scores, dtype="float64")
+    lower, upper = scores.quantile(quantiles[0]), scores.quantile(quantiles[1])
+    categories = np.full(len(scores), np.nan, dtype=object)
+    categories[(scores < lower).to_numpy()] = "High risk"
+    categories[(scores > upper).to_numpy()] = "Low risk"
+    categories[((scores > lower) & (scores < upper)).to_numpy()] = "Medium risk"
+    return categories
+
+
+def _take(values, codes):
+    """
+    values[codes], NaN where the code is -1
+    """
+    return pd.Series(values).reindex(codes).to_numpy()
+
+
+class ScoreAggregator:
+    """
+    Aggregates the scores of one combined dataset with any number of AggregationSchemas.
+
+    The group codes of all levels are computed once in the constructor. Usage:
+
+        aggregator = ScoreAggregator(combined_normalized, crba_country_list)
+        for schema in schemas:
+            aggregated_scores = aggregator.aggregated_scores(schema)
+    """
+
+    def __init__(self, combined_normalized, crba_country_list, excluded_countries=EXCLUDED_COUNTRIES):
+        """
+        :param combined_normalized: Normalized data of all sources
+        :param crba_country_list: Countries of the CRBA. Only their scores are part of the aggregated scores
+        :param excluded_countries: Countries without scores
+        """
+        self.combined_normalized = combined_normalized
+        self.row_codes, self.category = group_codes(
+            combined_normalized,
+            CATEGORY_ORDER,
+            mask=~combined_normalized["COUNTRY_ISO_3"].isin(excluded_countries).to_numpy(),
+        )
+        self.values = combined_normalized["SCALED_OBS_VALUE"].to_numpy(dtype="float64", na_value=np.nan)
+        self.category_to_issue, self.issue = group_codes(self.category, ISSUE_KEYS)
+        self.issue_to_index, self.index = group_codes(self.issue, INDEX_KEYS)
+        self.index_to_country, self.country = group_codes(self.index, COUNTRY_KEYS)
+        self.category_to_index = self.issue_to_index[self.category_to_issue]
+        self.category_to_country = self.index_to_country[self.category_to_index]
+        self.in_crba = self.category["COUNTRY_ISO_3"].isin(crba_country_list["COUNTRY_ISO_3"]).to_numpy()
+
+    def scores(self, schema=None):
+        """
+        The scores of all groups of the category level, also of the countries which are not part of the CRBA
+
+        :param schema: AggregationSchema. Default the default schema
+        """
+        schema = schema or AggregationSchema()
+        mean = schema.mean
+
+        category_score = grouped_mean(self.row_codes, self.values, len(self.category), mean=mean)
+
+        weights = self.category["INDICATOR_CATEGORY"].map(schema.category_weights).fillna(1.0).to_numpy(dtype="float64")
+        issue_score = grouped_mean(self.category_to_issue, category_score, len(self.issue), weights=weights, mean=mean)
+
+        weights = self.issue["INDICATOR_ISSUE"].map(schema.issue_weights).fillna(1.0).to_numpy(dtype="float64")
+        index_score = grouped_mean(self.issue_to_index, issue_score, len(self.index), weights=weights, mean=mean)
+
+        weights = self.index["INDICATOR_INDEX"].map(schema.index_weights).fillna(1.0).to_numpy(dtype="float64")
+        overall_score = grouped_mean(self.index_to_country, index_score, len(self.country), weights=weights, mean=mean)
+
+        # Join the levels by their codes
+        scores = self.category[CATEGORY_KEYS].copy()
+        scores["CATEGORY_ISSUE_SCORE"] = category_score
+        scores["ISSUE_INDEX_SCORE"] = issue_score[self.category_to_issue]
+        scores["ISSUE_INDEX_RISK_CATEGORY"] = risk_category(issue_score, schema.risk_quantiles)[self.category_to_issue]
+        scores["INDEX_SCORE"] = index_score[self.category_to_index]
+        scores["INDEX_RISK_CATEGORY"] = risk_category(index_score, schema.risk_quantiles)[self.category_to_index]
+        scores["OVERALL_SCORE"] = overall_score[self.category_to_country]
+        return scores
+
+    def aggregated_scores(self, schema=None, scores=None):
+        """
+        One row per country, category, issue and index. Only the countries of the CRBA
+
+        :param scores: Result of scores(schema), if already computed
+        """
+        scores = self.scores(schema) if scores is None else scores
+        return scores[self.in_crba].reset_index(drop=True)
+
+    def crba_final(self, schema=None, scores=None):
+        """
+        The combined dataset, each row with the scores of its group.
+        Duplicate rows of the combined dataset are dropped, the scores of their group are the same
+
+        :param scores: Result of scores(schema), if already computed
+        """
+        scores = self.scores(schema) if scores is None else scores
+        unique_rows = ~self.combined_normalized.duplicated().to_numpy()
+        row_codes = self.row_codes[unique_rows]
+        if len(scores):
+            row_codes = np.where(row_codes >= 0, np.where(self.in_crba, np.arange(len(scores)), -1)[row_codes], -1)
+        score_columns = [column for column in scores.columns if column not in CATEGORY_KEYS]
+        return self.combined_normalized[unique_rows].assign(
+            **{column: _take(scores[column].to_numpy(), row_codes) for column in score_columns}
+        )
+
+
+def aggregate_scores(combined_normalized, crba_country_list, schema=None, excluded_countries=EXCLUDED_COUNTRIES):
+    """
+    Compute the category, issue, index and overall scores in one hierarchical pass.
+
+    Parameters:
+    combined_normalized (pd.DataFrame): Normalized data of all sources
+    crba_country_list (pd.DataFrame): Countries of the CRBA. Only their scores are part of the aggregated scores
+    schema (AggregationSchema): Weights, mean and risk thresholds. Default the default schema
+    excluded_countries (list): Countries without scores
+
+    Return:
+    Tuple of the aggregated scores (one row per country, category, issue and index) and crba_final
+    (combined_normalized without duplicate rows, with the scores of its group)
+    """
+    aggregator = ScoreAggregator(combined_normalized, crba_country_list, excluded_countries=excluded_countries)
+    scores = aggregator.scores(schema)
+    return aggregator.aggregated_scores(scores=scores), aggregator.crba_final(scores=scores)
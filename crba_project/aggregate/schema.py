@@ -0,0 +1,114 @@
+"""
+Aggregation schema: weights of the categories, issues and indices, the mean and the risk thresholds.
+
+Loaded from the Input_Lists sheet of the indicator dictionary. All columns are optional:
+
+* CATEGORY_WEIGHT, ISSUE_WEIGHT, INDEX_WEIGHT: Weight of the category/issue/index in the same row.
+  Empty cells have the weight 1. Without a CATEGORY_WEIGHT column Outcome and Enforcement count double
+* AGGREGATION_MEAN: arithmetic or geometric. Default arithmetic
+* RISK_QUANTILE_HIGH, RISK_QUANTILE_LOW: Scores below the first quantile are high risk, above the second one low risk.
+  Default 0.333 and 0.667
+"""
+import logging
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+MEAN_TYPES = ["arithmetic", "geometric"]
+
+# Outcome and Enforcement count double in the issue score. Categories which are not listed have the weight 1
+CATEGORY_WEIGHTS = {"Outcome": 2.0, "Enforcement": 2.0}
+# Scores below the first quantile are high risk, above the second one low risk. Scores in between medium risk
+RISK_QUANTILES = (0.333, 0.667)
+
+
+class AggregationSchema:
+    def __init__(
+        self,
+        category_weights=None,
+        issue_weights=None,
+        index_weights=None,
+        mean="arithmetic",
+        risk_quantiles=RISK_QUANTILES,
+        name="default",
+    ):
+        """
+        :param category_weights: Category -> weight in the issue score. Default CATEGORY_WEIGHTS
+        :param issue_weights: Issue -> weight in the index score. Not listed issues have the weight 1
+        :param index_weights: Index -> weight in the overall score. Not listed indices have the weight 1
+        :param mean: One of MEAN_TYPES. Used on all levels
+        :param risk_quantiles: Quantiles of the thresholds between high/medium and medium/low risk
+        """
+        if mean not in MEAN_TYPES:
+            raise ValueError(f"Unknown mean:{mean}. Choose one of {MEAN_TYPES}")
+        if not 0 <= risk_quantiles[0] <= risk_quantiles[1] <= 1:
+            raise ValueError(f"Risk quantiles must be ascending and between 0 and 1: {risk_quantiles}")
+        self.name = name
+        self.category_weights = dict(CATEGORY_WEIGHTS if category_weights is None else category_weights)
+        self.issue_weights = dict(issue_weights or {})
+        self.index_weights = dict(index_weights or {})
+        for weights in (self.category_weights, self.issue_weights, self.index_weights):
+            for key, weight in weights.items():
+                if not weight >= 0:
+                    raise ValueError(f"Weight of {key} must not be negative: {weight}")
+        self.mean = mean
+        self.risk_quantiles = tuple(float(quantile) for quantile in risk_quantiles)
+
+    def __repr__(self):
+        return f"AggregationSchema({self.to_dict()})"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "category_weights": self.category_weights,
+            "issue_weights": self.issue_weights,
+            "index_weights": self.index_weights,
+            "mean": self.mean,
+            "risk_quantiles": list(self.risk_quantiles),
+        }
+
+    @classmethod
+    def from_dict(cls, spec, base=None):
+        """
+        :param spec: Keys of to_dict. Missing keys are taken from base
+        :param base: AggregationSchema. Default the default schema
+        """
+        values = (base or cls()).to_dict()
+        values.update(spec)
+        return cls(**values)
+
+    @classmethod
+    def from_input_lists(cls, input_lists: pd.DataFrame):
+        """
+        Read the schema from the Input_Lists sheet. See the module docstring for the columns
+        """
+
+        def weights(key_column, weight_column):
+            if weight_column not in input_lists.columns:
+                return None
+            rows = input_lists[[key_column, weight_column]]
+            rows = rows[(rows[key_column].astype(str).str.strip() != "") & (rows[weight_column].astype(str).str.strip() != "")]
+            return {key: float(weight) for key, weight in zip(rows[key_column], rows[weight_column])}
+
+        def setting(column, default):
+            if column not in input_lists.columns:
+                return default
+            values = [value for value in input_lists[column] if str(value).strip() not in ("", "nan")]
+            return values[0] if values else default
+
+        category_weights = weights("CATEGORY", "CATEGORY_WEIGHT")
+        schema = cls(
+            # The sheet defines all category weights. Not listed ones count once
+            category_weights=CATEGORY_WEIGHTS if category_weights is None else category_weights,
+            issue_weights=weights("ISSUE", "ISSUE_WEIGHT"),
+            index_weights=weights("INDEX", "INDEX_WEIGHT"),
+            mean=str(setting("AGGREGATION_MEAN", "arithmetic")).strip().lower(),
+            risk_quantiles=(
+                float(setting("RISK_QUANTILE_HIGH", RISK_QUANTILES[0])),
+                float(setting("RISK_QUANTILE_LOW", RISK_QUANTILES[1])),
+            ),
+            name="Input_Lists",
+        )
+        log.info(f"Aggregation schema: {schema}")
+        return schema
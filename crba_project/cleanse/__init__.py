@@ -1,16 +1,133 @@
+import functools
 import logging
 
-import warnings
 import pandas as pd
+from pandas.api.types import union_categoricals
 import datetime
 import numpy as np
 import re
-from statistics import median
+
+from crba_project.cleanse.countries import CountryIndex, CountryNameMatcher
 
 
 log = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def parse_encoding_string(encoding_string, sep_character=";", assign_character="="):
+    """Parse an encoding string (e.g. 'Yes=1; No=2') into a lookup
+
+    Memoized, every encoding string is only parsed once per run. The returned dict is shared, don't modify it.
+
+    Parameters:
+    encoding_string (str): String containing the Encoded-value/original-value pairs
+    sep_character (str): Character by which Encoded-value/original-value pairs are separated
+    assign_character (str): Character assigning Encoded-value and original-values
+
+    Return:
+    Dict <original value> : <encoded value>. If an original value appears several times, the first pair wins
+    """
+    lookup = {}
+    for pair in re.split(sep_character, encoding_string):
+        mapping_pair = re.split(assign_character, pair)
+        lookup.setdefault(mapping_pair[1].strip(), mapping_pair[0].strip())
+    return lookup
+
+
+def hashable_values(series):
+    """Lists and dicts of the raw data (e.g. of JSON sources) as strings, so the column can be grouped
+
+    Parameters:
+    series (pd.Series): Column of the raw data
+
+    Return:
+    The column, with the unhashable values converted to strings. Other values are kept as they are
+    """
+    if series.dtype != object:
+        return series
+    try:
+        pd.unique(series)
+    except TypeError:
+        return series.map(lambda value: str(value) if isinstance(value, (list, dict, set)) else value)
+    return series
+
+
+def constant_columns(dataframe, values):
+    """Add columns with the same value in every row
+
+    All columns are built at once and joined with a single pd.concat, instead of inserting them one by one
+    (which fragments the dataframe). Columns which already exist are overwritten in place.
+
+    Parameters:
+    dataframe (obj): Dataframe to add the columns to
+    values (dict): Column name -> value. Numbers (e.g. years) keep their dtype. Strings and missing values
+        are stored as categorical with one category, every row only holds a code instead of a copy of the string
+
+    Return:
+    Dataframe with the added columns
+    """
+    length = len(dataframe)
+    columns = {}
+    for column, value in values.items():
+        if isinstance(value, (int, float, np.number)) and not pd.isnull(value):
+            columns[column] = np.full(length, value)
+        elif pd.isnull(value):
+            columns[column] = pd.Categorical.from_codes(np.full(length, -1, dtype=np.int8), categories=[])
+        else:
+            columns[column] = pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+
+    existing = [column for column in columns if column in dataframe.columns]
+    for column in existing:
+        dataframe[column] = columns.pop(column)
+    if not columns:
+        return dataframe
+    return pd.concat([dataframe, pd.DataFrame(columns, index=dataframe.index)], axis=1)
+
+
+def concat_sources(dataframes):
+    """Concatenate the dataframes of the sources
+
+    pd.concat falls back to object columns if the categories of a categorical column differ, e.g. the indicator
+    names of the sources (see constant_columns). Here the categorical columns are combined with union_categoricals,
+    so they stay categorical. Sources with the shared dtypes of crba_project.cleanse.schema only get their codes
+    concatenated.
+
+    Parameters:
+    dataframes (list): Dataframes of the sources. None is skipped
+
+    Return:
+    Combined dataframe with a new index
+    """
+    dataframes = [dataframe for dataframe in dataframes if dataframe is not None]
+    columns = list(dict.fromkeys(column for dataframe in dataframes for column in dataframe.columns))
+    categorical = [
+        column for column in columns
+        if any(isinstance(dataframe[column].dtype, pd.CategoricalDtype) for dataframe in dataframes if column in dataframe.columns)
+    ]
+    combined = pd.concat(
+        [dataframe.drop(columns=[column for column in categorical if column in dataframe.columns]) for dataframe in dataframes],
+        axis=0,
+        ignore_index=True,
+    )
+    for column in categorical:
+        parts = []
+        for dataframe in dataframes:
+            if column not in dataframe.columns:
+                # Source without the column
+                parts.append(pd.Categorical.from_codes(np.full(len(dataframe), -1, dtype=np.int8), categories=[]))
+            elif isinstance(dataframe[column].dtype, pd.CategoricalDtype):
+                parts.append(dataframe[column].array)
+            else:
+                # Source with plain values in a categorical column of the others
+                parts.append(pd.Categorical(dataframe[column].to_numpy(dtype=object)))
+        try:
+            combined[column] = union_categoricals(parts)
+        except TypeError:
+            # Categories of different types, e.g. numbers and strings
+            combined[column] = pd.Categorical(np.concatenate([np.asarray(part, dtype=object) for part in parts]))
+    return combined[columns]
+
+
 class Cleanser:
     @classmethod
     def extract_who_raw_data(
@@ -226,6 +343,7 @@ class Cleanser:
         time_cols,
         attr_cols,
         obs_val_col="RAW_OBS_VALUE",
+        keep="last",
     ):
         """Retrieve latest observation for each country in a raw dataset
 
@@ -240,6 +358,8 @@ class Cleanser:
         country_cols (list): List of all country columns as name in the final SDMX dataframe (iso2, iso3, name)
         time_cols (list): List of all time columns as name in the final SDMX dataframe
         attr_cols (list): List of all attribute columns as name in the final SDMX dataframe
+        obs_val_col (str): Column of the observation value. Rows without value are skipped
+        keep (str): Which observation is kept if a group has several of the latest time: "last" or "first" in the order of the raw data
 
         Return:
         pd.DataFrame with only one observation per country (and dimension subgroup, if a raw dataframe contains dimensions as part of a primary composite key)
@@ -260,32 +380,43 @@ class Cleanser:
         # Define available attribute columns in dataset
         available_attr_list = [col for col in renamed_data.columns if col in attr_cols]
 
-        # Prep for 3: Cast dim and attr cols as string for groupby
-        # (sometimes values are [...] which Python interprets as list which can't be joined because hashable)
-        renamed_data[available_dims_list] = renamed_data[available_dims_list].astype(
-            str
-        )
-
-        renamed_data[available_attr_list] = renamed_data[available_attr_list].astype(
-            str
-        )
+        if keep not in ("last", "first"):
+            raise ValueError(f"Unknown keep:{keep}. Choose last or first")
 
         # 3. Retrieve the latest available data for each group, where group is 'col_list_gb'
-        # In some DFs, there are NA value as the latest observation. Drop those
-        renamed_data = renamed_data.dropna(subset=[obs_val_col])
-
-        grouped_data = renamed_data[
-            renamed_data[available_time_list[0]]
-            == renamed_data.groupby(by=available_dims_list + available_country_list)[
-                available_time_list[0]
-            ].transform("max")
-        ]
+        # In some DFs, there are NA value as the latest observation. Those rows are skipped
+        valid = renamed_data[obs_val_col].notna().to_numpy()
+
+        # Number the groups. Missing dimension values are a value of their own, rows without country or time have no group
+        time_codes, _ = pd.factorize(renamed_data[available_time_list[0]], sort=True)
+        valid &= time_codes >= 0
+        group_keys = np.zeros(len(renamed_data), dtype=np.int64)
+        for col in available_dims_list + available_country_list:
+            try:
+                codes, uniques = pd.factorize(renamed_data[col], use_na_sentinel=col in available_country_list)
+            except TypeError:
+                # Lists and dicts (e.g. of JSON sources) can't be hashed, they are grouped by their string
+                renamed_data[col] = hashable_values(renamed_data[col])
+                codes, uniques = pd.factorize(renamed_data[col], use_na_sentinel=col in available_country_list)
+            valid &= codes >= 0
+            group_keys, _ = pd.factorize(group_keys * (len(uniques) + 1) + codes)
+
+        # Sort by time, the latest observation of each group is its last row. Ties are broken by the position
+        # in the raw data, so the kept row of a group doesn't depend on the sort
+        rows = np.flatnonzero(valid)
+        rows = rows[np.lexsort((rows if keep == "last" else -rows, time_codes[rows]))]
+        latest = rows[~pd.Series(group_keys[rows]).duplicated(keep="last").to_numpy()]
+
+        # In the order of the raw data
+        grouped_data = renamed_data.iloc[np.sort(latest)].copy()
+        for col in available_attr_list:
+            grouped_data[col] = hashable_values(grouped_data[col])
 
         return grouped_data
 
     @classmethod
     def add_and_discard_countries(
-        cls, grouped_data, crba_country_list, country_list_full
+        cls, grouped_data, crba_country_list=None, country_list_full=None, country_index=None
     ):
         """Add and discard countries (i.e. rows) in raw data set
 
@@ -303,9 +434,10 @@ class Cleanser:
         * adds counries to a raw dataframe if they aren't present in there already (to later show NA values)
         * discards countries/ regions of the raw dataframe is they aren't in the crba_country_list
 
-        The functioncan deal with data frames irrespetive of
-        what the column name for the country column is in the raw data or what type of country
-        data it contains (iso2, iso3, or simply country name).
+        The countries are resolved with the CountryIndex from the first country column of the raw data
+        (COUNTRY_ISO_3, COUNTRY_ISO_2 or COUNTRY_NAME), whatever kind of country data it contains (iso2, iso3,
+        or any country name variation). The rows are in the order of the crba_country_list, the column _merge
+        tells the rows of the raw data ("both") from the added ones ("right_only").
 
         Note: The columns names in both crba_country_list and country_list_full must be:
 
@@ -315,87 +447,42 @@ class Cleanser:
         grouped_data (obj): Return of retrieve_latest_observation method
         crba_country_list (obj): DataFrame containing the list of those countries included in the final CRBA SDMX df
         country_list_full (obj): DataFrame containing all possible country name variations
+        country_index (CountryIndex): Prebuilt index over both lists (Config.country_index). Used instead of
+            crba_country_list and country_list_full
 
         return:
         DataFrame which contains at least one row for each country (or more if there dimensions
-        in the dataset), and only those countries which are supposed to be in the final CRBA SDMX dataframe.
+        in the dataframe), and only those countries which are supposed to be in the final CRBA SDMX dataframe.
         """
-        # TO DO: Refactor code; This function can be set up more elegantly now,
-        # since we renamed all country cols before and it is clear which country
-        # column is in the dataframe
         #log.info("\n Calling function 'add_and_discard_countries'...")
+        if country_index is None:
+            country_index = CountryIndex(country_list_full, crba_country_list)
 
-        # Determine intersection of country key col in CRBA country list and raw data
-        country_col_right_join = [
-            col for col in crba_country_list.columns if col in grouped_data.columns
-        ]
-
-        # Cast as single string rather than list in case there is only one column
-        if len(country_col_right_join) == 1:
-            country_col_right_join = country_col_right_join[0]
-
-        # prepare 4: Determine if the country col in the raw dataframe is ISO2, ISO3 or the actual country name
-        # TO DO What if country_col_right_join is a list of > 1 element?
-        med_country_col_len = median(
-            crba_country_list[country_col_right_join].apply(lambda x: len(x))
-        )
-
-        # 4. Discard countries that aren't part of the final CRBA master list
-        # Determine what kind of country column is in the raw data and do the right join accordingly
-        if med_country_col_len < 1.5:
+        country_cols = [col for col in CountryIndex.KEY_COLUMNS if col in grouped_data.columns]
+        if not country_cols:
             raise Exception(
                 "Country column in the dataframe seems to be wrong. Check column and adjust code if necessary"
             )
-        elif (med_country_col_len > 1.5) & (med_country_col_len < 3.5):
-            # Column in raw dataframe is ISO2 or ISO3, so can just join directly
-            with warnings.catch_warnings():
-                #TODO
-                #DataFrame is highly fragmented.  This is usually the result of calling `frame.insert` many times, which has poor performance.  Consider joining all columns at once using pd.concat(axis=1) instead. To get a de-fragmented frame, use `newframe = frame.copy()`
-                #grouped_data_iso_filt = grouped_data.merge
-                warnings.simplefilter("ignore")
-                grouped_data_iso_filt = grouped_data.merge(
-                    right=crba_country_list[[country_col_right_join]],
-                    how="right",
-                    on=country_col_right_join,
-                    indicator=True,
-                    validate="many_to_one",
-                    suffixes=("_source_data", None),
-                )
-        elif med_country_col_len > 3.5:
-            # The raw data only contains country names. Assign ISO codes to these country names.
-            # Source S-155 and S-156 Contain leading whitespaces. Delete those, or else join will fail
-            grouped_data["COUNTRY_NAME"] = (
-                grouped_data["COUNTRY_NAME"].astype(str).apply(lambda x: x.strip())
-            )
 
-            # Use country full list to make sure each country name variation is captured
-            grouped_data_iso = grouped_data.merge(
-                right=country_list_full,
-                how="left",
-                on="COUNTRY_NAME",
-                validate="many_to_one",
-            )
+        # Source S-155 and S-156 Contain leading whitespaces. Delete those
+        if country_cols[0] == "COUNTRY_NAME" and grouped_data["COUNTRY_NAME"].dtype == object:
+            grouped_data["COUNTRY_NAME"] = grouped_data["COUNTRY_NAME"].str.strip()
 
-            # Discard countries that aren't part of the final CRBA master list
-            grouped_data_iso_filt = grouped_data_iso.merge(
-                right=crba_country_list[["COUNTRY_ISO_3"]],
-                how="right",
-                on="COUNTRY_ISO_3",
-                indicator=True,
-                validate="many_to_one",
-            )
+        ids = country_index.resolve(grouped_data[country_cols[0]])
+        if not (ids >= 0).any():
+            log.info(f"None of the countries in the column {country_cols[0]} is known. Check column and adjust code if necessary")
 
-        # Force COUNTY_ISO_3 codes to be present, this is for sources which work only with ISO2 country codes
-        if "COUNTRY_ISO_3" not in grouped_data_iso_filt.columns:
-            log.info(
-                "Source didn't have ISO3 country codes, presumably because it works with ISO2 codes. Now adding ISO3 codes"
-            )
-            grouped_data_iso_filt = grouped_data_iso_filt.merge(
-                right=crba_country_list[["COUNTRY_ISO_2", "COUNTRY_ISO_3"]],
-                on="COUNTRY_ISO_2",
-                how="left",
-                indicator=False,
-            )
+        # 4. Discard countries that aren't part of the final CRBA master list and add an empty row for the missing ones
+        rows, country_ids = country_index.crba_rows(ids)
+        grouped_data_iso_filt = grouped_data.reset_index(drop=True).reindex(rows).reset_index(drop=True)
+
+        # The ISO codes of the countries. Sources with ISO2 codes or names get both
+        if country_cols[0] != "COUNTRY_ISO_3":
+            grouped_data_iso_filt["COUNTRY_ISO_2"] = country_index.iso2[country_ids]
+        grouped_data_iso_filt["COUNTRY_ISO_3"] = country_index.iso3[country_ids]
+        grouped_data_iso_filt["_merge"] = pd.Categorical(
+            np.where(rows >= 0, "both", "right_only"), categories=["left_only", "right_only", "both"]
+        )
 
         return grouped_data_iso_filt
 
@@ -491,10 +578,8 @@ class Cleanser:
             col for col in grouped_data_iso_filt.columns if col in time_cols
         ]
 
-        # UN Treaty and ILO NORMLEX data does not have a column for TIME_PERIOD, add here
-        if len(available_time_list) == 0:
-            grouped_data_iso_filt[time_period_col] = datetime.datetime.now().year
-            available_time_list += [time_period_col]
+        # UN Treaty and ILO NORMLEX data does not have a column for TIME_PERIOD, it is added with the other columns
+        current_year = datetime.datetime.now().year
 
         # 5a Fill in _T For each dimension, where it is NaN
         grouped_data_iso_filt[available_dims_list] = grouped_data_iso_filt[
@@ -502,59 +587,64 @@ class Cleanser:
         ].fillna(value="_T")
 
         # 5b Fill in current year for time variable
-        grouped_data_iso_filt[available_time_list[0]] = grouped_data_iso_filt[
-            available_time_list[0]
-        ].fillna(value=datetime.datetime.now().year)
+        if available_time_list:
+            grouped_data_iso_filt[available_time_list[0]] = grouped_data_iso_filt[
+                available_time_list[0]
+            ].fillna(value=current_year)
 
         # # # Add additional columns
-        # Indicator name
-        grouped_data_iso_filt[indicator_name_col] = indicator_name_string
-
-        # Index name
-        grouped_data_iso_filt[index_name_col] = index_name_string
-
-        # Issue name
-        grouped_data_iso_filt[issue_name_col] = issue_name_string
-
-        # Category name
-        grouped_data_iso_filt[category_name_col] = category_name_string
-
-        # Create column indicator code
-        grouped_data_iso_filt[indicator_code_col] = indicator_code_string
-
-        # Create column to indicate source
-        grouped_data_iso_filt[indicator_source_col] = indicator_source_string
-
-        # Create column to indicate source body
-        grouped_data_iso_filt[indicator_source_body_col] = indicator_source_body_string
-
-        # Create column to indicate indicator description
-        grouped_data_iso_filt[indicator_description_col] = indicator_description_string
-
-        # Create column to indicate indicator explanation
-        grouped_data_iso_filt[indicator_explanation_col] = indicator_explanation_string
+        # The values are the same in all rows of the source. Stored as categoricals, every row only holds a code
+        # instead of a copy of e.g. the indicator description. Built in one block, see constant_columns
+        constants = {
+            **({} if available_time_list else {time_period_col: current_year}),
+            indicator_name_col: indicator_name_string,
+            index_name_col: index_name_string,
+            issue_name_col: issue_name_string,
+            category_name_col: category_name_string,
+            indicator_code_col: indicator_code_string,
+            indicator_source_col: indicator_source_string,
+            indicator_source_body_col: indicator_source_body_string,
+            indicator_description_col: indicator_description_string,
+            indicator_explanation_col: indicator_explanation_string,
+            attribute_unit_col: attribute_unit_string,
+            indicator_data_extraction_methodology_col: indicator_data_extraction_methodology_string,
+            source_title_col: source_title_string,
+            source_api_link_col: source_api_link_string,
+            # YEAR_CRBA_RELEASE with current year
+            crba_release_year_col: current_year,
+        }
 
-        # Create column to indicate unit measurement
-        grouped_data_iso_filt[attribute_unit_col] = attribute_unit_string
+        return constant_columns(grouped_data_iso_filt, constants)
 
-        # Create column to indicate dataa extraction methdology
-        grouped_data_iso_filt[
-            indicator_data_extraction_methodology_col
-        ] = indicator_data_extraction_methodology_string
+    @classmethod
+    def compile_value_mapping(cls, value_mapping_dict):
+        """Compile the value_mapping_dict into one lookup per column
 
-        # Create column to indicate source title
-        grouped_data_iso_filt[source_title_col] = source_title_string
+        Turns {<target value> : <list of values>} into {<value> : <target value>}, so the values of a column
+        can be mapped with a single Series.map. Done once when the Config gets loaded.
 
-        # Create column to indicate api/ endpoint link
-        grouped_data_iso_filt[source_api_link_col] = source_api_link_string
+        If a value is listed for several target values, the first one wins. Empty strings are mapped to NaN
+        and "_T" to "_T", unless the value_mapping_dict maps them itself.
 
-        # YEAR_CRBA_RELEASE with current year
-        grouped_data_iso_filt[crba_release_year_col] = datetime.datetime.now().year
+        Parameters:
+        value_mapping_dict (dict): Dictionary containing the mappings from raw data values --> desired value
 
-        return grouped_data_iso_filt
+        Return:
+        Dict <column name> : {<value> : <target value>}
+        """
+        value_lookup = {}
+        for key, targets in value_mapping_dict.items():
+            lookup = {}
+            for target, values in targets.items():
+                for value in values:
+                    lookup.setdefault(value, target)
+            lookup.setdefault("", np.nan)
+            lookup.setdefault("_T", "_T")
+            value_lookup[key] = lookup
+        return value_lookup
 
     @classmethod
-    def map_values(cls, cleansed_data, value_mapping_dict):
+    def map_values(cls, cleansed_data, value_mapping_dict=None, value_lookup=None):
         """Map column values (assign consistent values)
 
         Different sources may have different values for a certain variable, but may actually mean the
@@ -570,59 +660,42 @@ class Cleanser:
             }
         }
 
+        NaN and empty values become NaN, "_T" stays "_T" and all values without mapping
+        become "UNMAPPED VALUE - PLEASE MAP".
+
         Paramteres:
         cleansed_data (obj): Cleansed raw data frame (after columns have been renamed!!!)
         value_mapping_dict (dict): Dictionary containing the mappings from raw data values --> desired value
+        value_lookup (dict): value_mapping_dict compiled with compile_value_mapping. Used instead of value_mapping_dict,
+            saves compiling it for every source
 
         Return:
         Dataframe with converted cell values as stipulated in value_mapping_dict
 
         """
         #log.info("\n Calling function 'map_values'...")
+        if value_lookup is None:
+            value_lookup = cls.compile_value_mapping(value_mapping_dict)
 
         # Loop through all possible columns as defined for the final SDMX structure
-        for key in value_mapping_dict:
-            try:
-                # Define emtpy lists to be mapped to each other
-                original_values = []
-                mapped_values = []
-
-                # Loop obtain all possible original/ mapped value variations mappings
-                for sub_key in value_mapping_dict[key]:
-                    # Obtain boolean arrays for each possible original value
-                    for list_element in range(len(value_mapping_dict[key][sub_key])):
-                        original_values += [
-                            cleansed_data[key]
-                            == value_mapping_dict[key][sub_key][list_element]
-                        ]
-
-                    # Define the target value if original_values evaluates to true
-                    mapped_values += len(value_mapping_dict[key][sub_key]) * [sub_key]
-
-                # Encode NaN values
-                original_values += [cleansed_data[key].isnull()]
-                original_values += [cleansed_data[key] == ""]
-                original_values += [cleansed_data[key] == "_T"]
-
-                # Target value of NaN values
-                mapped_values += [np.nan, np.nan, "_T"]
-
-                # Convert (map) the values
-                cleansed_data[key] = np.select(
-                    original_values, mapped_values, "UNMAPPED VALUE - PLEASE MAP"
-                )
+        for key, lookup in value_lookup.items():
+            # Not all sources provide all columns
+            if key not in cleansed_data.columns:
+                continue
+
+            column = cleansed_data[key]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype(object)
+
+            # Convert (map) the values
+            mapped = column.map(lookup)
+            cleansed_data[key] = mapped.where(
+                column.isin(lookup.keys()) | column.isnull(), "UNMAPPED VALUE - PLEASE MAP"
+            )
 
-                # log info for user
-                log.info("\n Successfully mapped values of column: {}".format(key))
+            # log info for user
+            log.info("\n Successfully mapped values of column: {}".format(key))
 
-            # If column is not presnt (or if there are other issues)
-   
-            except:
-                log.info(
-                    "Values of column: {} couldn't be mapped. If column {} is present, there is an error with the code. ".format(
-                        key, key
-                    )
-                )
         return cleansed_data
 
     @classmethod
@@ -679,42 +752,18 @@ class Cleanser:
         #log.info("\n Calling function 'encode_categorical_variables'...")
 
         if encoding_string != "Continuous variable":
-            # Split string into mapping pairs
-            mapping_pairs = re.split(sep_character, encoding_string)
-
-            # Create nested list with encoded value and original value packed in a sublist
-            mapping_pairs_listed = []
-            for pair in mapping_pairs:
-                mapping_pairs_listed += [re.split(assign_character, pair)]
-                # log.info(mapping_pairs_listed)
-
-            # Define conditions
-            raw_values = []
-            encodings = []
-
-            # Extract raw values and encodings from mapping pairs listed
-            for mapping_sublist in range(len(mapping_pairs_listed)):
-                raw_values += [
-                    dataframe[obs_raw_value_source].astype(
-                        str
-                    )  # convert to string in case raw value is numeric
-                    == mapping_pairs_listed[mapping_sublist][1].rstrip().lstrip()
-                ]  # delete str and after [1] aprentheses again
-                encodings += [
-                    mapping_pairs_listed[mapping_sublist][0].rstrip().lstrip()
-                ]
-
-            # Encode NaN values
-            raw_values += [dataframe[obs_raw_value_source].isnull()]
-            raw_values += [dataframe[obs_raw_value_source] == ""]
-
-            # Target value of NaN values
-            encodings += [na_encodings, na_encodings]
-
-            dataframe[obs_raw_value_target] = np.select(
-                condlist=raw_values,
-                choicelist=encodings,
-                default="VALUE WITHOUT MAPPING - PLEASE MAP",
+            lookup = parse_encoding_string(encoding_string, sep_character, assign_character)
+
+            # One pass over the column. Convert to string in case raw value is numeric
+            raw_values = dataframe[obs_raw_value_source]
+            encoded_values = raw_values.astype(str).map(lookup)
+
+            # Encode NaN values. All other values without mapping get flagged
+            # The encodings are strings, so the NaN encoding is a string as well
+            is_na = raw_values.isnull() | (raw_values == "")
+            dataframe[obs_raw_value_target] = encoded_values.where(
+                encoded_values.notna(),
+                np.where(is_na, str(na_encodings), "VALUE WITHOUT MAPPING - PLEASE MAP"),
             )
 
             if encoding_labels != False:
@@ -782,9 +831,10 @@ class Cleanser:
     def decompose_country_footnote_ilo_normlex(
         cls,
         dataframe,
-        country_name_list,
+        country_name_list=None,
         footnote_col="ATTR_FOOTNOTE_OF_SOURCE",
         country_col="COUNTRY_NAME",
+        country_name_matcher=None,
     ):
         """Extract country and store additional info in footnotes from ILO NORMLEX
 
@@ -799,40 +849,31 @@ class Cleanser:
         country_name_list (list-like): List containing all possible country name variations
         footnote_col (str): Name of column in final SDMX structure containing source footnotes
         country_col (str): Name of column containing country name
+        country_name_matcher (CountryNameMatcher): Prebuilt matcher over the country names (Config.country_name_matcher).
+            Used instead of country_name_list
 
         Return:
         DataFrame, with country column content decomposed.
         """
-        # Define function to extract country name to be applied with .apply
-        def extract_country_name(cell, country_name_list_temp=country_name_list):
-            # Determine which country in the full country list is contained in string
-            subset_list = [x in cell for x in country_name_list_temp]
-
-            # Sometimes several country names match, but we need exactly one
-            if sum(subset_list) == 0:
-                log.info("No country name match")
-                country_name = ""
-            elif sum(subset_list) == 1:
-                # Retrieve the actual country name
-                country_name = country_name_list_temp[subset_list].item()
-            else:
-                # Some country naes contain other country names (Nigeria contains Niger)
-                # Extract the longest string
-                country_name = max(country_name_list_temp[subset_list], key=len)
-
-            # Return result
-            return country_name
+        if country_name_matcher is None:
+            country_name_matcher = CountryNameMatcher(country_name_list)
 
         # Create footnote column that store footnotes
         dataframe[footnote_col] = dataframe[country_col]
 
-        #  extract country name
-        dataframe[country_col] = dataframe[country_col].apply(extract_country_name)
-
-        # Purge footnotes from the country
-        dataframe[footnote_col] = dataframe.apply(
-            lambda x: re.sub(x[country_col], "", x[footnote_col]), 1
-        )
+        # Extract country name. Some country names contain other country names (Nigeria contains Niger),
+        # the longest one wins. Many rows share the same cell, so each cell is only matched once
+        cells = dataframe[country_col].unique()
+        country_names = {cell: country_name_matcher.find(cell) for cell in cells}
+        if "" in country_names.values():
+            log.info("No country name match")
+        dataframe[country_col] = dataframe[country_col].map(country_names)
+
+        # Purge footnotes from the country. The country names are no regular expressions
+        dataframe[footnote_col] = [
+            footnote.replace(country_name, "") if isinstance(footnote, str) else footnote
+            for footnote, country_name in zip(dataframe[footnote_col], dataframe[country_col])
+        ]
 
         return dataframe
 
@@ -0,0 +1,159 @@
+"""
+Country lookups, built once per Config:
+
+* CountryNameMatcher: Find country names inside of free text cells, e.g. "Niger (ratified with reservations)"
+* CountryIndex: Resolve country names, ISO2 and ISO3 codes to one integer id per country
+"""
+import collections
+import logging
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+
+class CountryNameMatcher:
+    """
+    Aho-Corasick automaton over all country name variations.
+
+    Finds all names contained in a text in one pass over the text, independent of the number of names.
+    Built once per Config when first needed, see Config.country_name_matcher.
+    """
+
+    def __init__(self, country_names):
+        """
+        :param country_names: List-like with all country name variations. Empty names are ignored
+        """
+        self.names = [name for name in dict.fromkeys(country_names) if isinstance(name, str) and name]
+        # State 0 is the root. goto[state][character] -> state
+        self._goto = [{}]
+        self._fail = [0]
+        # Index of the best name ending in the state (incl. the ones reached via the fail links) or -1
+        self._best = [-1]
+
+        for index, name in enumerate(self.names):
+            state = 0
+            for character in name:
+                if character not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(-1)
+                    self._goto[state][character] = len(self._goto) - 1
+                state = self._goto[state][character]
+            self._best[state] = self._better(self._best[state], index)
+
+        # Breadth first, so the fail state of a state is always finished before the state itself
+        # The fail state of the states directly below the root is the root
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and character not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(character, 0)
+                self._best[next_state] = self._better(self._best[next_state], self._best[self._fail[next_state]])
+                queue.append(next_state)
+
+    def _better(self, index, other):
+        """
+        The longer name wins. With the same length the one first in the list
+        """
+        if index < 0:
+            return other
+        if other < 0:
+            return index
+        if len(self.names[other]) > len(self.names[index]) or (
+            len(self.names[other]) == len(self.names[index]) and other < index
+        ):
+            return other
+        return index
+
+    def find(self, text):
+        """
+        The longest country name contained in the text. Some country names contain other
+        country names (Nigeria contains Niger), so the longest one is the actual country.
+
+        Return:
+        The country name or "" if the text does not contain any
+        """
+        if not isinstance(text, str):
+            return ""
+        best = -1
+        state = 0
+        for character in text:
+            while state and character not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(character, 0)
+            if self._best[state] >= 0:
+                best = self._better(best, self._best[state])
+        return self.names[best] if best >= 0 else ""
+
+
+class CountryIndex:
+    """
+    One hash map from every country name variation, ISO2 and ISO3 code to a canonical integer id per country.
+
+    The countries of the CRBA country list get the ids 0 .. n_crba - 1, in the order of the list. The other
+    countries of the full list follow. Built once per Config, see Config.country_index.
+    """
+
+    # The country columns of a source, in the order they are used to resolve the countries
+    KEY_COLUMNS = ["COUNTRY_ISO_3", "COUNTRY_ISO_2", "COUNTRY_NAME"]
+
+    def __init__(self, country_full_list, crba_country_list):
+        """
+        :param country_full_list: DataFrame with all country name variations. Columns COUNTRY_NAME, COUNTRY_ISO_2 and COUNTRY_ISO_3
+        :param crba_country_list: DataFrame with the countries of the CRBA. Column COUNTRY_ISO_3, optionally COUNTRY_ISO_2 and COUNTRY_NAME
+        """
+        crba_iso3 = pd.unique(crba_country_list["COUNTRY_ISO_3"].dropna())
+        self.n_crba = len(crba_iso3)
+        self.iso3 = pd.Index(crba_iso3).append(pd.Index(country_full_list["COUNTRY_ISO_3"].dropna())).unique()
+
+        lookup = {code: country_id for country_id, code in enumerate(self.iso3)}
+        iso2 = np.full(len(self.iso3), np.nan, dtype=object)
+        # Names and ISO2 codes of the CRBA list first. With a conflict the first one wins
+        for country_list in (crba_country_list, country_full_list):
+            country_ids = self.iso3.get_indexer(country_list["COUNTRY_ISO_3"])
+            for column in ["COUNTRY_ISO_2", "COUNTRY_NAME"]:
+                if column not in country_list.columns:
+                    continue
+                for key, country_id in zip(country_list[column], country_ids):
+                    if isinstance(key, str) and key.strip() and country_id >= 0:
+                        lookup.setdefault(key.strip(), country_id)
+                        if column == "COUNTRY_ISO_2" and not isinstance(iso2[country_id], str):
+                            iso2[country_id] = key.strip()
+        self.iso2 = pd.Index(iso2)
+        self._keys = pd.Index(list(lookup), dtype=object)
+        self._ids = np.fromiter(lookup.values(), dtype=np.int64, count=len(lookup))
+
+    def resolve(self, values):
+        """
+        Country id per value, -1 for values which are no known country. Leading and trailing whitespace is ignored
+
+        :param values: List-like of country names, ISO2 or ISO3 codes
+        """
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        keys = [value.strip() if isinstance(value, str) else value for value in uniques]
+        positions = self._keys.get_indexer(keys)
+        # The last one is for the missing values (code -1)
+        ids = np.append(np.where(positions >= 0, self._ids[positions], -1), -1)
+        return ids[codes]
+
+    def crba_rows(self, ids):
+        """
+        Rows of the CRBA countries in the order of the CRBA country list. The rows of a country keep their order
+
+        :param ids: Country id per row, see resolve
+
+        Return:
+        Tuple of the row numbers, -1 for a CRBA country without rows, and the country id of each of them
+        """
+        ids = np.asarray(ids)
+        rows = np.flatnonzero((ids >= 0) & (ids < self.n_crba))
+        missing = np.setdiff1d(np.arange(self.n_crba), ids[rows])
+        country_ids = np.concatenate([ids[rows], missing])
+        rows = np.concatenate([rows, np.full(len(missing), -1)])
+        order = np.argsort(country_ids, kind="stable")
+        return rows[order], country_ids[order]
@@ -0,0 +1,108 @@
+"""
+Categorical dtypes of the SDMX columns.
+
+The country, dimension and indicator columns hold few distinct values in many rows. As categoricals every row
+only holds an integer code. The categories are shared by all sources of a run and derived from:
+
+* the column mapping: The dimension columns (sdmx_df_columns_dims)
+* the value mapping: The target values of each dimension, plus "_T" and the flag of unmapped values
+* the CRBA country list: COUNTRY_ISO_3
+* the source config: SOURCE_ID, INDICATOR_CODE and the index, issue and category of the indicators
+
+Sources with the same dtypes are concatenated as they are (see concat_sources) and the groupbys of the
+aggregation work on the codes. Values which are not part of the shared categories, e.g. of a dimension without
+value mapping, are added to the categories of the source. concat_sources unifies them.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+TOTAL = "_T"
+UNMAPPED_VALUE = "UNMAPPED VALUE - PLEASE MAP"
+# Values the normalization sets, see crba_project.normalize.scaler
+OBS_STATUS_VALUES = ["O"]
+# Column of the source config -> column of the SDMX dataframe
+SOURCE_CONFIG_COLUMNS = {
+    "SOURCE_ID": "SOURCE_ID",
+    "INDICATOR_CODE": "INDICATOR_CODE",
+    "INDEX": "INDICATOR_INDEX",
+    "ISSUE": "INDICATOR_ISSUE",
+    "CATEGORY": "INDICATOR_CATEGORY",
+}
+
+
+def _categories(values):
+    """
+    Sorted distinct values. The groupbys sort the groups in the order of the categories
+    """
+    return pd.Index(sorted({value for value in values if isinstance(value, str)}), dtype=object)
+
+
+class ColumnSchema:
+    """
+    Categorical dtype per column, built once per Config (Config.column_schema). Usage:
+
+        dataframe = config.column_schema.apply(dataframe)
+    """
+
+    def __init__(self, categories):
+        """
+        :param categories: Column -> values of its categories
+        """
+        self.dtypes = {column: pd.CategoricalDtype(_categories(values)) for column, values in categories.items()}
+
+    @classmethod
+    def build(cls, dim_cols, value_mapper=None, country_list=None, source_config=None):
+        """
+        Parameters:
+        dim_cols (list): sdmx_df_columns_dims of the column mapping
+        value_mapper (dict): value_mapper of the value mapping, <column> : {<target value> : <list of values>}
+        country_list (pd.DataFrame): Optional, the CRBA country list with the column COUNTRY_ISO_3
+        source_config (pd.DataFrame): Optional, the source config. See SOURCE_CONFIG_COLUMNS
+
+        Return:
+        ColumnSchema
+        """
+        value_mapper = value_mapper or {}
+        categories = {column: [*value_mapper.get(column, {}), TOTAL, UNMAPPED_VALUE] for column in dim_cols}
+        categories["OBS_STATUS"] = OBS_STATUS_VALUES
+        if country_list is not None:
+            categories["COUNTRY_ISO_3"] = country_list["COUNTRY_ISO_3"]
+        if source_config is not None:
+            for source_column, column in SOURCE_CONFIG_COLUMNS.items():
+                if source_column in source_config.columns:
+                    categories[column] = source_config[source_column]
+        return cls(categories)
+
+    def apply(self, dataframe):
+        """
+        Convert the columns of the schema, which are part of the dataframe, to their categorical dtype
+
+        Parameters:
+        dataframe (pd.DataFrame): Data of a source
+
+        Return:
+        The dataframe, its columns are converted in place
+        """
+        for column, dtype in self.dtypes.items():
+            if column not in dataframe.columns:
+                continue
+            series = dataframe[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                if series.dtype == dtype:
+                    continue
+                codes, values = series.cat.codes.to_numpy(), series.cat.categories
+            else:
+                codes, values = pd.factorize(series)
+            # Position of each value in the categories. The last one is for the missing values (code -1)
+            positions = np.append(dtype.categories.get_indexer(values), -1)
+            extra = values[np.intersect1d(np.flatnonzero(positions[:-1] < 0), codes)]
+            if len(extra):
+                log.debug(f"Column {column} has values without shared category: {list(extra)[:10]}")
+                dtype = pd.CategoricalDtype(dtype.categories.union(extra))
+                positions = np.append(dtype.categories.get_indexer(values), -1)
+            dataframe[column] = pd.Categorical.from_codes(positions[codes], dtype=dtype)
+        return dataframe
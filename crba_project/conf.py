@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import List, Union
 import uuid
 import logging
@@ -8,8 +9,6 @@ import csv
 
 from pathlib import Path
 import pandas as pd
-import requests_cache
-import great_expectations as gx
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -17,17 +16,34 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 
+from crba_project.aggregate.schema import AggregationSchema
+from crba_project.cleanse.countries import CountryIndex, CountryNameMatcher
+from crba_project.cleanse.schema import ColumnSchema
+from crba_project.mappings import Mappings
+from crba_project.snapshot import SnapshotCache
 from crba_project.utils import utils
 
 
 log = logging.getLogger(__name__)
 
+
+def mapping(name):
+    """
+    Property of the Config returning the value of the name in the mapping scripts, see Config.mappings
+    """
+    def get(self):
+        if name not in self.mappings:
+            raise AttributeError(f"The mapping scripts of {self.input_dir} don't define {name}")
+        return self.mappings[name]
+    return property(get, doc=f"{name} of the mapping scripts")
+
+
 class Config:
     """
     Make Config Gloabal Sigelton?!?!?!?
     """
 
-    def __init__(self, output_dir,input_dir, run_id=None,filter=None, caching=False, remote_source_config=False,**kwargs):
+    def __init__(self, output_dir,input_dir, run_id=None,filter=None, caching=False, remote_source_config=False, workers=1, executor="thread", prefetch_per_host=4, http_timeout=120, http_retries=5, cache_mode="off", cache_dir=None, cache_ttl=24, cache_max_size=2048, incremental=None, output_format="csv", compression=None, output_layout="wide", browsers=2, static_html_first=False, snapshot_cache=True, validation="full", validator="native",**kwargs):
         
         if run_id==None:
         #TODO replace by datetime string
@@ -36,23 +52,109 @@ class Config:
         self.input_dir = Path(input_dir) # Path(args.InputDir)
         self.output_dir =Path(output_dir)  # Path(args.OutputDir)
         self.run_id = run_id
+        # Number of sources extracted in parallel and how. See crba_project.executor
+        self.workers = workers
+        self.executor = executor
+        # Maximum number of parallel downloads per host of the prefetch stage
+        self.prefetch_per_host = prefetch_per_host
+        # Settings of the shared HTTP session. See crba_project.extractor.session
+        self.http_timeout = http_timeout
+        self.http_retries = http_retries
+        # Headless browsers per process for the scraped sources (ILO). See crba_project.extractor.browser
+        self.browsers = browsers
+        # Try a plain HTTP download before rendering a page with a browser
+        self.static_html_first = static_html_first
+        # Cache of the raw payloads between runs. See crba_project.extractor.cache
+        # --caching is kept as a shortcut for the read mode
+        if caching and cache_mode == "off":
+            cache_mode = "read"
+        self.cache_mode = cache_mode
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".cache" / "crba_project" / "payloads"
+        self.cache_ttl = cache_ttl
+        self.cache_max_size = cache_max_size
+        # Directory or id of a previous run. Its outputs get reused for unchanged sources. See crba_project.incremental
+        self.incremental = incremental
+        # off, sample or full. See crba_project.validation
+        self.validation = validation
+        self.validator = validator
+        # Snapshots of the reference data parsed from the Excel files. See crba_project.snapshot
+        self.snapshots = SnapshotCache(Path.home() / ".cache" / "crba_project" / "snapshots") if snapshot_cache else None
+        self.configure_http_session()
+        self.configure_browsers()
         self.kwargs = kwargs
 
-        self.bootstrap(caching=caching)
+        self.output_format = output_format
+        self.compression = compression
+        # Layout of crba_final: wide, star or both. See crba_project.output.star
+        self.output_layout = output_layout
+
+        self.bootstrap()
         if not remote_source_config:
             self.build_source_config(source_configuration_excel= self.input_dir / "indicator_dictionary_CRBA.xlsx",filter=filter)
         else: 
             self.build_source_config(source_configuration_excel= self.download_file(real_file_id="1mhjOdObYEOt35xxy2T7hm-4zDxIz0LkKHa-XRjn7LF4"),filter=filter)
         print(f"Configuration initialized with run_id:{run_id}")
 
-    def bootstrap(self, caching=False):
+    @cached_property
+    def output_writer(self):
+        # Writer of the datasets. The schema of the parquet files is derived from the columns of the column mapping
+        from crba_project.output import create_writer
+        return create_writer(self.output_format, sdmx_columns=self.sdmx_df_columns_all, compression=self.compression)
+
+    @cached_property
+    def aggregation_schema(self):
+        # Weights, mean and risk thresholds of the scores. See crba_project.aggregate.schema
+        def read_input_lists():
+            excel = self.source_configuration_excel
+            if isinstance(excel, io.BytesIO):
+                excel.seek(0)
+            return pd.read_excel(excel, sheet_name="Input_Lists", keep_default_na=False)
+
+        if isinstance(self.source_configuration_excel, Path):
+            input_lists = self.load_snapshot("input_lists", [self.source_configuration_excel], read_input_lists)
+        else:
+            input_lists = read_input_lists()
+        return AggregationSchema.from_input_lists(input_lists)
+
+    def __getstate__(self):
+        # The Great Expectation context can't be pickled. It is only needed in the main process
+        state = self.__dict__.copy()
+        state.pop("ge_context", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # A worker process has its own session manager and browsers
+        self.configure_http_session()
+        self.configure_browsers()
+
+    def configure_http_session(self):
+        # Imported here, the extractor package itself imports the Config
+        from crba_project.extractor.cache import PayloadCache
+        from crba_project.extractor.session import get_session_manager
+        cache = None
+        if self.cache_mode != "off":
+            cache = PayloadCache(self.cache_dir, mode=self.cache_mode, default_ttl=self.cache_ttl, max_size=self.cache_max_size)
+        get_session_manager().configure(timeout=self.http_timeout, retries=self.http_retries, cache=cache)
+
+    def load_snapshot(self, name, inputs, build):
+        """
+        The dataframe build() derives from the inputs. Taken from the snapshot cache if the inputs are unchanged
+        """
+        if self.snapshots is None:
+            return build()
+        return self.snapshots.load(name, inputs, build)
+
+    def configure_browsers(self):
+        # Imported here, the extractor package itself imports the Config
+        from crba_project.extractor.browser import get_webdriver_pool
+        get_webdriver_pool().configure(size=self.browsers)
+
+    def bootstrap(self):
+        # The reference data (country lists, UN population, mappings, Great Expectations context)
+        # is loaded when it is first used. See load_dependencies
         self.create_output_dir()
         self.input_files()
-        self.load_country_list_and_mapping_dictionary()
-        self.load_un_pop_tot()
-        self.load_ge_context()
-        if caching:
-            self.use_caching()
 
 
     def create_output_dir(self):
@@ -91,47 +193,107 @@ class Config:
         self.data_sources_raw_manual_human = self.input_dir / 'data_in' / 'data_raw_manually_extracted' / 'human_entered'
         self.data_sources_raw_manual_human.mkdir(parents=True, exist_ok=True)
 
-    def load_country_list_and_mapping_dictionary(self):
-        # Load the list of countries which contains all different variations of country names 
-
-
-        self.country_full_list = pd.read_excel(
-            self.input_dir / "all_countrynames_list.xlsx",
-            keep_default_na=False).drop_duplicates()
-
+    @cached_property
+    def country_full_list(self):
+        # The list of countries which contains all different variations of country names
+        return self.load_snapshot(
+            "country_full_list",
+            [self.input_dir / "all_countrynames_list.xlsx"],
+            lambda: pd.read_excel(
+                self.input_dir / "all_countrynames_list.xlsx",
+                keep_default_na=False).drop_duplicates())
+
+    @cached_property
+    def country_name_matcher(self):
+        # Finds the country names inside of free text, e.g. the ILO NORMLEX country column
+        return CountryNameMatcher(self.country_full_list["COUNTRY_NAME"])
+
+    @cached_property
+    def country_index(self):
+        # Resolves the country names, ISO2 and ISO3 codes of the sources to the CRBA countries
+        return CountryIndex(self.country_full_list, self.country_crba_list)
+
+    @cached_property
+    def country_iso_list(self):
         # Create a version of the list with unique ISO2 and ISO3 codes
-        self.country_iso_list = self.country_full_list.drop_duplicates(subset='COUNTRY_ISO_2')
+        return self.country_full_list.drop_duplicates(subset='COUNTRY_ISO_2')
 
+    @cached_property
+    def country_crba_list(self):
         # Country CRBA list, this is the list of the countries that should be in the final CRBA indicator list
-        self.country_crba_list = pd.read_excel(
-            self.input_dir / 'crba_country_list.xlsx',
-            header=None,
-            usecols=[0, 1],
-            names=['COUNTRY_ISO_3', 'COUNTRY_NAME']).merge(
+        return self.load_snapshot(
+            "crba_country_list",
+            [self.input_dir / 'crba_country_list.xlsx'],
+            lambda: pd.read_excel(
+                self.input_dir / 'crba_country_list.xlsx',
+                header=None,
+                usecols=[0, 1],
+                names=['COUNTRY_ISO_3', 'COUNTRY_NAME'])
+            ).merge(
             right=self.country_iso_list[['COUNTRY_ISO_2', 'COUNTRY_ISO_3']],
             how='left',
             on='COUNTRY_ISO_3',
             validate='one_to_one')
 
-        # Run the column mapper script to load the mapping dictionary
-        locals_ = list(locals().keys())
-        with open(self.input_dir / 'column_mapping.py') as file:
-            exec(file.read())
-
-        # Run the column mapper script to load the mapping dictionary
-        with open(self.input_dir / 'value_mapping.py') as file:
-            exec(file.read())
+    @cached_property
+    def mappings(self) -> Mappings:
+        """
+        The mapping scripts of the input dir, e.g. mapping_dict, sdmx_df_columns_all or value_mapper.
+        The names the extractors use are properties of the Config, the others are in mappings.names
+        """
+        return Mappings.load(self.input_dir)
+
+    # Column mapping
+    mapping_dict = mapping("mapping_dict")
+    sdmx_df_columns_all = mapping("sdmx_df_columns_all")
+    sdmx_df_columns_attr = mapping("sdmx_df_columns_attr")
+    sdmx_df_columns_country = mapping("sdmx_df_columns_country")
+    sdmx_df_columns_dims = mapping("sdmx_df_columns_dims")
+    sdmx_df_columns_obs = mapping("sdmx_df_columns_obs")
+    sdmx_df_columns_time = mapping("sdmx_df_columns_time")
+    # Value mapping
+    value_mapper = mapping("value_mapper")
+    value_mapper_sdmx_encoding = mapping("value_mapper_sdmx_encoding")
+
+    @cached_property
+    def column_schema(self):
+        # Categorical dtypes of the SDMX columns, shared by all sources. See crba_project.cleanse.schema
+        return ColumnSchema.build(
+            self.sdmx_df_columns_dims,
+            value_mapper=self.mappings.names.get("value_mapper"),
+            country_list=self.country_crba_list,
+            source_config=self.source_config,
+        )
 
-        # Run the column mapper script to load the mapping dictionary
-        with open(self.input_dir / 'value_mapping_sdmx_encoding.py') as file:
-            exec(file.read())
+    @property
+    def value_lookup(self):
+        # Compiled once, instead of for every source
+        return self.mappings.value_lookup
+
+    @cached_property
+    def un_pop_tot(self):
+        return self.load_snapshot(
+            "un_pop_tot",
+            [
+                self.input_dir / "WPP2019_POP_F01_1_TOTAL_POPULATION_BOTH_SEXES.xlsx",
+                self.input_dir / "all_countrynames_list.xlsx",
+            ],
+            self.build_un_pop_tot,
+        )
 
-        keys_to_add = locals().keys() - locals_
+    def load_dependencies(self, extractor_classes):
+        """
+        Load the reference data the extractors need, see Extractor.config_dependencies.
 
-        for key in keys_to_add:
-            setattr(Config, key, locals()[key])
+        Everything else stays unloaded. Called before the extraction starts, so the workers of a
+        process pool get the loaded data with the pickled Config instead of loading it each.
+        """
+        names = sorted({name for extractor_class in extractor_classes for name in extractor_class.config_dependencies})
+        for name in names:
+            getattr(self, name)
+        log.debug(f"Loaded reference data: {names}")
 
-    def load_un_pop_tot(self):
+    def build_un_pop_tot(self):
         un_pop_tot = pd.read_excel(
             io=self.input_dir / "WPP2019_POP_F01_1_TOTAL_POPULATION_BOTH_SEXES.xlsx",
             sheet_name="ESTIMATES",
@@ -156,10 +318,8 @@ class Config:
             var_name="year",
             value_name="population",
         )
-        # Load the list of countries which contains all different variations of country names
-        country_full_list = pd.read_excel(
-            self.input_dir / "all_countrynames_list.xlsx", keep_default_na=False
-        ).drop_duplicates()
+        # The list of countries which contains all different variations of country names. Already loaded
+        country_full_list = self.country_full_list
 
         # Add ISO3 code to the list to prepare for join
         un_pop_tot = un_pop_tot.merge(
@@ -171,7 +331,7 @@ class Config:
         un_pop_tot = un_pop_tot[un_pop_tot['COUNTRY_ISO_3'].notnull()]
 
         # Discard unnecessary columns
-        self.un_pop_tot = un_pop_tot[["year", "population", "COUNTRY_ISO_3"]]
+        return un_pop_tot[["year", "population", "COUNTRY_ISO_3"]]
 
     def build_source_config(self, source_configuration_excel:Union[io.BytesIO, Path],filter: Union[Path, List[str]]):
         """
@@ -183,6 +343,53 @@ class Config:
 
         :param filter: Kan be a path to an csv File where the first Column needs to be a Source ID or a List of Source Id's
         """
+        # Also the source of the aggregation schema
+        self.source_configuration_excel = source_configuration_excel
+        if isinstance(source_configuration_excel, Path):
+            source_config = self.load_snapshot(
+                "source_config",
+                [source_configuration_excel],
+                lambda: self.read_source_configuration(source_configuration_excel),
+            )
+        else:
+            # Downloaded remote config. Nothing to compare with
+            source_config = self.read_source_configuration(source_configuration_excel)
+
+        # All Input Files need to be in Folder defined by Input_dir
+        # The the relative Path in configuration file get adjusted
+        # TODO Exclude absolute Path
+        source_config["ENDPOINT_URL"] = source_config["ENDPOINT_URL"].apply(
+            lambda endpoint: endpoint.replace("file:data_in", f"file:{self.input_dir}"))
+
+        if filter:
+            if isinstance(filter, str):
+                filter = Path(filter)
+
+            if isinstance(filter, Path):
+                filter_df = pd.read_csv(filter, index_col=0, delimiter=";", quotechar="'")
+                include_source_id = list(filter_df.index)
+            elif isinstance(filter, List):
+                include_source_id = filter
+            else:
+                log.error(f"Filter is of no known type:{type(filter)}")
+
+            source_config = source_config[source_config['SOURCE_ID'].isin(include_source_id)]
+
+        self.source_config = source_config
+        
+        self.source_config.to_csv(
+            path_or_buf = self.output_dir / self.run_id / 'source_config.csv',
+            sep = ";",
+            quoting=csv.QUOTE_ALL
+        )
+
+        
+
+
+    def read_source_configuration(self, source_configuration_excel:Union[io.BytesIO, Path]):
+        """
+        Read and merge the sheets of the indicator dictionary. Without filter and input_dir adjustments
+        """
         # sources sheet
         crba_data_dictionary_source = pd.read_excel(
             source_configuration_excel,
@@ -284,49 +491,14 @@ class Config:
         #    f"The Source Config Loaded sucessfully. Numer of Sources{source_self.shape[0]}"
         # )
 
-        # All Input Files need to be in Folder defined by Input_dir
-        # The the relative Path in configuration file get adjusted
-        # TODO Exclude absolute Path
-        source_config["ENDPOINT_URL"] = source_config["ENDPOINT_URL"].apply(
-            lambda endpoint: endpoint.replace("file:data_in", f"file:{self.input_dir}"))
+        return source_config
 
-        if filter:
-            if isinstance(filter, str):
-                filter = Path(filter)
-
-            if isinstance(filter, Path):
-                filter_df = pd.read_csv(filter, index_col=0, delimiter=";", quotechar="'")
-                include_source_id = list(filter_df.index)
-            elif isinstance(filter, List):
-                include_source_id = filter
-            else:
-                log.error(f"Filter is of no known type:{type(filter)}")
-
-            source_config = source_config[source_config['SOURCE_ID'].isin(include_source_id)]
-
-        self.source_config = source_config
-        
-        self.source_config.to_csv(
-            path_or_buf = self.output_dir / self.run_id / 'source_config.csv',
-            sep = ";",
-            quoting=csv.QUOTE_ALL
-        )
-
-        
-
-    def use_caching(self):
-        """
-        Configure gloabl caching
-        TODO Move to Extractor?!?!
-        """
-        log.info("Use Cahcing for request lib")
-        requests_cache.install_cache(
-            "crba_downloads", backend="filesystem", use_cache_dir=True
-        )
-    
-    def load_ge_context(self):
+    @cached_property
+    def ge_context(self):
+        # Imported here, the native validator doesn't need Great Expectations
+        import great_expectations as gx
         with res_path("crba_project.resources","great_expectations") as p:
-            self.ge_context = gx.get_context(context_root_dir=p,runtime_environment={'output_dir':f"{os.path.abspath(self.output_dir)}"})
+            return gx.get_context(context_root_dir=p,runtime_environment={'output_dir':f"{os.path.abspath(self.output_dir)}"})
 
         #self.ge_context.variables.data_docs_sites["local_site"]["store_backend"]["base_directory"] = self.output_dir.resolve() / "data_docs"
         #self.ge_context.config.data_docs_sites["local_site"]["store_backend"]["base_directory"] = self.output_dir.resolve() / "data_docs"
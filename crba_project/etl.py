@@ -4,7 +4,9 @@ Module
 
 """
 import argparse
+import concurrent.futures
 import csv
+import functools
 import importlib
 import io
 import logging
@@ -14,16 +16,20 @@ import warnings
 from pathlib import Path
 from typing import Type
 
-import great_expectations as gx
 import pandas as pd
-from great_expectations.checkpoint.types.checkpoint_result import \
-    CheckpointResult
-from great_expectations.core.batch import RuntimeBatchRequest
 from tqdm.autonotebook import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
+from crba_project.aggregate import aggregate_scores
+from crba_project.cleanse import concat_sources
 from crba_project.conf import Config
+from crba_project.executor import create_executor
 from crba_project.extractor import ExtractionError
+from crba_project.extractor.prefetch import Prefetcher
+from crba_project.extractor.session import get_session_manager
+from crba_project.incremental import PreviousRun, shared_inputs_digest, source_fingerprint, store_fingerprints, store_output
+from crba_project.output.star import build_star, write_star
+from crba_project.validation import SourceValidator
 
 log = logging.getLogger(__name__)
 
@@ -34,65 +40,181 @@ def dynamic_load(class_path) -> Type:
     return getattr(module, _class)
 
 
+def prefetch(prefetcher, row):
+    """
+    Schedule the download of the URLs of the source which can be downloaded ahead
+
+    Return:
+    Tuple of the future of the responses and the URLs. The session keeps their responses until they are released
+    """
+    try:
+        extractor_class = dynamic_load(row["EXTRACTOR_CLASS"])
+        urls = list(extractor_class.prefetch_urls(**row))
+        return prefetcher.prefetch(urls, ttl=extractor_class.cache_ttl(**row)), urls
+    except Exception as ex:
+        # The extractor itself will fail with a proper ExtractionError
+        log.debug(f"No prefetch for source {row['SOURCE_ID']}: {ex}")
+        return prefetcher.prefetch([]), []
+
+
+def extractor_classes(rows):
+    """
+    The extractor classes of the sources. Classes which can't be loaded are skipped, the source fails on its own
+    """
+    classes = set()
+    for row in rows:
+        try:
+            classes.add(dynamic_load(row["EXTRACTOR_CLASS"]))
+        except Exception as ex:
+            log.debug(f"Extractor of source {row['SOURCE_ID']} can't be loaded: {ex}")
+    return classes
+
+
+def fingerprint(config, shared_digest, row, responses):
+    """
+    Fingerprint of the source for incremental runs. None if it can't be fingerprinted
+    """
+    try:
+        payload_fingerprint = dynamic_load(row["EXTRACTOR_CLASS"]).payload_fingerprint(config, responses, **row)
+    except Exception as ex:
+        log.debug(f"No fingerprint for source {row['SOURCE_ID']}: {ex}")
+        return None
+    return source_fingerprint(shared_digest, row, payload_fingerprint)
+
+
+def extract_source(config, row, responses=None):
+    """
+    Run the extractor of a single source.
+
+    This function runs inside the executor. Nothing is shared between the calls,
+    the results get collected by the caller.
+
+    :param responses: Prefetched responses of the source (url -> response)
+
+    Return:
+    Tuple of the dataframe and the stats of the source
+    """
+    responses = responses or {}
+    # In a worker process the prefetch used another session. The seeded responses are dropped after the extraction
+    session_manager = get_session_manager()
+    session_manager.seed(responses)
+    try:
+        extractor = dynamic_load(row["EXTRACTOR_CLASS"])(config,**row)
+        df = extractor.get()
+    finally:
+        session_manager.release(responses)
+    store_output(config, row["SOURCE_ID"], df)
+    buf = io.StringIO()
+    df.info(buf=buf)
+    return df, {"stats":buf.getvalue()}
+
+
+def validate(validator, source_id, future):
+    """
+    Done callback of a source. Its output is validated in the background, the failures are collected by the caller
+    """
+    if future.exception() is None:
+        validator.submit(source_id, future.result()[0])
+
+
+def reuse_source(config, row, previous_run, responses=None):
+    """
+    Take the normalized output of the source from the previous run. Runs inside the executor like extract_source.
+    If the output can't be loaded (truncated pickle, pickle of another pandas version, ...) the source is extracted
+
+    :param responses: Prefetched responses of the source, for the extraction
+    """
+    try:
+        df = previous_run.load(row["SOURCE_ID"])
+    except Exception as ex:
+        log.warning(f"Output of source {row['SOURCE_ID']} in {previous_run.normalized_dir} can't be loaded, extract it: {ex}")
+        return extract_source(config, row, responses)
+    # The categories of the previous run may differ
+    df = config.column_schema.apply(df)
+    store_output(config, row["SOURCE_ID"], df)
+    buf = io.StringIO()
+    df.info(buf=buf)
+    return df, {"stats":buf.getvalue(), "reused":str(previous_run.normalized_dir)}
+
+
 def build_combined_normalized_csv(config):
-    ##TODO Parallelisiere . Prozess vs Thread. Probably Thread because of heavy IO Tasks concurrent.futures
     extractions_data = []
     extraction_errors_source_ids =[]
 
-    validation_batches = []
-
     stats = {}
 
+    rows = [row.to_dict() for index, row in config.source_config.iterrows()]
+
+    # Only the reference data of the selected extractors. Loaded before the executor, so the workers share it
+    config.load_dependencies(extractor_classes(rows))
+
+    # Incremental run: Sources with the same fingerprint as in the previous run are not extracted again
+    previous_run = PreviousRun.resolve(config.output_dir, config.incremental) if config.incremental else None
+    shared_digest = shared_inputs_digest(config)
+    fingerprints = [None] * len(rows)
+    valid_fingerprints = {}
+
     with logging_redirect_tqdm():
         with warnings.catch_warnings():
             warnings.simplefilter("ignore") ## TODO:Store Warnings istead of jus upressing them
-            for index, row in tqdm(list(config.source_config.iterrows()), dynamic_ncols=True):
-                try:
-                    extractor = dynamic_load(row["EXTRACTOR_CLASS"])(config,**row)
-                    df = extractor.get()
-                    buf = io.StringIO()
-                    df.info(buf=buf)
-                    stats[row["SOURCE_ID"]] = {"stats":buf.getvalue()}
-                    # More IMportant then simple INFO logs but less importend the download infos
-                    log.log(
-                        level=25,
-                        msg=f"Source {row['SOURCE_ID']} extract with {df.shape if df is not None else 0}::: {extractor.__class__.__name__}",
+            # Each source is validated in the background as soon as it is collected
+            with SourceValidator(config, mode=config.validation, validator=config.validator) as validator, \
+                    create_executor(config.executor, config.workers) as executor, \
+                    Prefetcher(max_per_host=config.prefetch_per_host) as prefetcher, \
+                    tqdm(total=len(rows), dynamic_ncols=True) as progress:
+                # Stage 1: Download the payloads of the API sources ahead
+                fetches = {}
+                prefetched_urls = [None] * len(rows)
+                for i, row in enumerate(rows):
+                    fetch, prefetched_urls[i] = prefetch(prefetcher, row)
+                    fetches[fetch] = i
+                # Stage 2: Transform each source as soon as its payloads arrived
+                futures = [None] * len(rows)
+                for fetch in concurrent.futures.as_completed(fetches):
+                    # The responses are only referenced by the task of the source from here on
+                    i = fetches.pop(fetch)
+                    fingerprints[i] = fingerprint(config, shared_digest, rows[i], fetch.result())
+                    if previous_run is not None and previous_run.is_unchanged(rows[i]["SOURCE_ID"], fingerprints[i]):
+                        futures[i] = executor.submit(reuse_source, config, rows[i], previous_run, fetch.result())
+                    else:
+                        futures[i] = executor.submit(extract_source, config, rows[i], fetch.result())
+                    futures[i].add_done_callback(lambda future: progress.update())
+                    futures[i].add_done_callback(
+                        lambda future, urls=prefetched_urls[i]: get_session_manager().release(urls)
                     )
-                    extractions_data.append(df)
-
-                    validation_batches.append(
-                        {"batch_request": 
-                            RuntimeBatchRequest(
-                            datasource_name="default_datasource",
-                            data_connector_name="default_runtime_data_connector",
-                            data_asset_name=row["SOURCE_ID"],  # This can be anything that identifies this data_asset for you
-                            runtime_parameters={"batch_data": df},  # df is your dataframe
-                            batch_identifiers={"default_identifier_name": "default_identifier"},
+                    futures[i].add_done_callback(functools.partial(validate, validator, rows[i]["SOURCE_ID"]))
+                # Collect in the order of the source config. Keeps the output deterministic
+                for row, future, row_fingerprint in zip(rows, futures, fingerprints):
+                    try:
+                        df, stats[row["SOURCE_ID"]] = future.result()
+                        # More IMportant then simple INFO logs but less importend the download infos
+                        log.log(
+                            level=25,
+                            msg=f"Source {row['SOURCE_ID']} {'reused' if 'reused' in stats[row['SOURCE_ID']] else 'extract'} with {df.shape if df is not None else 0}::: {row['EXTRACTOR_CLASS'].split('.')[-1]}",
                         )
-                        }
-                    )
-
-                except ExtractionError as ex:
-                    extraction_errors_source_ids.append(row["SOURCE_ID"])
-                    stats[row["SOURCE_ID"]] = {"error":str(ex)}
-                    log.warning(
-                        f"{str(ex)}", exc_info=True
-                    )
-                except ValueError as ex:
-                    log.exception(ex)
-    # run GX validation
-    try:
-        result: CheckpointResult = config.ge_context.run_checkpoint(
-            checkpoint_name="indicator_sdmx_checkpoint",
-            validations=validation_batches,
-            run_name=f"{config.run_id}",
-        )
-        if not result["success"]:
-            log.warn("Validation failed!")
-    except gx.exceptions.exceptions.CheckpointError as ex:
-        log.warn(f"Checkint validation Failed by Exception:{ex}",exc_info=ex)
-
-    return pd.concat(extractions_data, axis=0, ignore_index=True) ,extraction_errors_source_ids,stats
+                        if row_fingerprint is not None:
+                            valid_fingerprints[row["SOURCE_ID"]] = row_fingerprint
+                        extractions_data.append(df)
+
+                    except ExtractionError as ex:
+                        extraction_errors_source_ids.append(row["SOURCE_ID"])
+                        stats[row["SOURCE_ID"]] = {"error":str(ex)}
+                        log.warning(
+                            f"{str(ex)}", exc_info=True
+                        )
+                    except ValueError as ex:
+                        log.exception(ex)
+    store_fingerprints(config, valid_fingerprints)
+    if previous_run is not None:
+        log.log(level=25, msg=f"Incremental run: {sum('reused' in source_stats for source_stats in stats.values())} of {len(rows)} sources reused")
+    cache = get_session_manager().cache
+    if cache is not None:
+        log.log(level=25, msg=f"Payload cache ({cache.mode}): {dict(cache.stats)}")
+    for source_id, success in validator.results.items():
+        stats[source_id]["validation"] = "passed" if success else "failed"
+
+    # Keeps the categorical columns of the sources categorical
+    return concat_sources(extractions_data) ,extraction_errors_source_ids,stats
 
 def aggregate_combined_normalized_csv(config,combined_normalized_csv):
    # Idenify all dimension columns in combined dataframe
@@ -105,7 +227,11 @@ def aggregate_combined_normalized_csv(config,combined_normalized_csv):
         if len(dim_col) == 1:
             available_dim_cols += dim_col
 
-    # Fill _T for all NA values of dimension columns
+    # Fill _T for all NA values of dimension columns. The categorical ones need _T as category
+    for col in available_dim_cols:
+        column = combined_normalized_csv[col]
+        if isinstance(column.dtype, pd.CategoricalDtype) and "_T" not in column.cat.categories:
+            combined_normalized_csv[col] = column.cat.add_categories("_T")
     combined_normalized_csv[available_dim_cols] = combined_normalized_csv[
         available_dim_cols
     ].fillna(value="_T")
@@ -120,199 +246,27 @@ def aggregate_combined_normalized_csv(config,combined_normalized_csv):
     # TODO Probably will allways fail as long there are any error with the sources
     # assert config.source_config.shape[0] == len(build_combined_normalized_csv.INDICATOR_CODE.unique())
 
-    # Create category score
-    aggregated_scores_dataset = combined_normalized_csv.loc[
-        combined_normalized_csv['COUNTRY_ISO_3'] != 'XKX', 
-        [
-            'COUNTRY_ISO_3',
-            'SCALED_OBS_VALUE',
-            'INDICATOR_INDEX',
-            'INDICATOR_ISSUE',
-            'INDICATOR_CATEGORY'
-        ]
-    ].groupby(
-        by = [
-            'COUNTRY_ISO_3',
-            'INDICATOR_CATEGORY', 
-            'INDICATOR_ISSUE',
-            'INDICATOR_INDEX'
-        ],
-        as_index = False
-    ).mean().rename(
-        columns={
-            'SCALED_OBS_VALUE' : 'CATEGORY_ISSUE_SCORE'
-        }
-    )
-
-    # # # # Introduce weighting: duplicate all index_issues who belong to category outcome or enforcement
-    aggregated_scores_dataset = aggregated_scores_dataset.append(
-        aggregated_scores_dataset.loc[
-            (aggregated_scores_dataset['INDICATOR_CATEGORY'] == 'Outcome') |
-            (aggregated_scores_dataset['INDICATOR_CATEGORY'] == 'Enforcement')
-        ]
-    )
-
-    # # # # # # # Issue score
-    temp = aggregated_scores_dataset.groupby(
-        by = [
-            'COUNTRY_ISO_3',
-            'INDICATOR_ISSUE',
-            'INDICATOR_INDEX'
-        ],
-        as_index = False
-    ).mean().rename(
-        columns={
-            'CATEGORY_ISSUE_SCORE' : 'ISSUE_INDEX_SCORE'
-        }
-    )
-
-    # Drop duplicates again
-    temp = temp.drop_duplicates()
-
-    # # Add risk category
-    # Define list of percentiles
-    percentile_33 = temp[
-        'ISSUE_INDEX_SCORE'
-    ].quantile(
-        0.333
-    )
-
-    percentile_66 = temp[
-        'ISSUE_INDEX_SCORE'
-    ].quantile(
-        0.667
-    )
-
-    # Add column indicating risk category
-    temp.loc[
-        temp['ISSUE_INDEX_SCORE'] < percentile_33,
-        'ISSUE_INDEX_RISK_CATEGORY'
-        ] = 'High risk' 
-
-    temp.loc[
-        temp['ISSUE_INDEX_SCORE'] > percentile_66,
-        'ISSUE_INDEX_RISK_CATEGORY'
-        ] = 'Low risk'
-
-    temp.loc[
-        (temp['ISSUE_INDEX_SCORE'] > percentile_33) & 
-        (temp['ISSUE_INDEX_SCORE'] < percentile_66),
-        'ISSUE_INDEX_RISK_CATEGORY'
-        ] = 'Medium risk'
-
-
-
-    # # # # # #  Index score
-    temp_2 = temp.groupby(
-        by = [
-            'COUNTRY_ISO_3',
-            'INDICATOR_INDEX'
-        ],
-        as_index = False
-    ).mean().rename(
-        columns={
-            'ISSUE_INDEX_SCORE' : 'INDEX_SCORE'
-        }
-    )
-
-    # # Add risk category
-    # Define list of percentiles
-    percentile_33 = temp_2[
-        'INDEX_SCORE'
-    ].quantile(
-        0.333
+    # Category, issue, index and overall scores. crba_final has the scores of its group in each row, without duplicate rows
+    aggregated_scores_dataset, crba_final = aggregate_scores(
+        combined_normalized_csv,
+        crba_country_list=config.country_crba_list,
+        schema=config.aggregation_schema,
     )
 
-    percentile_66 = temp_2[
-        'INDEX_SCORE'
-    ].quantile(
-        0.667
-    )
-
-    # Add column indicating risk category
-    temp_2.loc[
-        temp_2['INDEX_SCORE'] < percentile_33,
-        'INDEX_RISK_CATEGORY'
-        ] = 'High risk' 
-
-    temp_2.loc[
-        temp_2['INDEX_SCORE'] > percentile_66,
-        'INDEX_RISK_CATEGORY'
-        ] = 'Low risk'
-
-    temp_2.loc[
-        (temp_2['INDEX_SCORE'] > percentile_33) & 
-        (temp_2['INDEX_SCORE'] < percentile_66),
-        'INDEX_RISK_CATEGORY'
-        ] = 'Medium risk'
-
-    # # # # # Overall score
-    temp_3 = temp_2.groupby(
-        by = [
-            'COUNTRY_ISO_3',
-        ],
-        as_index = False
-    ).mean().rename(
-        columns={
-            'INDEX_SCORE' : 'OVERALL_SCORE'
-        }
-    )
-
-    # Join all aggregated score together
-    aggregated_scores_dataset = aggregated_scores_dataset.merge(
-        right = temp,
-        on = [
-            'COUNTRY_ISO_3',
-            'INDICATOR_ISSUE',
-            'INDICATOR_INDEX',
-        ]
-    ).merge(
-        right = temp_2,
-        on = [
-            'COUNTRY_ISO_3',
-            'INDICATOR_INDEX'
-        ]
-    ).merge(
-        right = temp_3,
-        on = [
-            'COUNTRY_ISO_3',
-        ]
-    ).merge(
-        right = config.country_crba_list,
-        on = 'COUNTRY_ISO_3'
-    ).drop(
-        [
-            'COUNTRY_NAME',
-            'COUNTRY_ISO_2'
-        ],
-        axis=1
-    )
-
-    crba_final = combined_normalized_csv.merge(
-        right=aggregated_scores_dataset,
-        on=[
-            'COUNTRY_ISO_3',
-            'INDICATOR_CATEGORY',
-            'INDICATOR_ISSUE',
-            'INDICATOR_INDEX'
-        ],
-        how='left' 
-    )
-
-
-    # Did not join on entire composite key on left, must drop dupliates
-    crba_final = crba_final.drop_duplicates()
-
     # Export combined cleansed dataframe as a sample
-    crba_final.to_csv(
-        path_or_buf = config.output_dir / config.run_id  / 'crba_final.csv',
-        sep = ";",
-        index=False
-    )
+    if config.output_layout in ("wide", "both"):
+        config.output_writer.write(
+            crba_final,
+            config.output_dir / config.run_id  / 'crba_final',
+            index=False
+        )
+    if config.output_layout in ("star", "both"):
+        tables, layout = build_star(crba_final, source_config=config.source_config, country_list=config.country_crba_list)
+        write_star(config.output_writer, tables, layout, config.output_dir / config.run_id / 'crba_final_star')
         
-    aggregated_scores_dataset.to_csv(
-        path_or_buf = config.output_dir / config.run_id / 'aggregated_scores.csv',
-        sep = ";",
+    config.output_writer.write(
+        aggregated_scores_dataset,
+        config.output_dir / config.run_id / 'aggregated_scores',
         quoting=csv.QUOTE_ALL
     )
 
@@ -325,9 +279,9 @@ def generate_stats(config,final_crba):
 def run(config):
     combined_normalized_csv, extraction_errors_source_ids,stats = build_combined_normalized_csv(config)
 
-    combined_normalized_csv.to_csv(
-        path_or_buf = config.output_dir / config.run_id / 'combined_normalized.csv',
-        sep = ";",
+    config.output_writer.write(
+        combined_normalized_csv,
+        config.output_dir / config.run_id / 'combined_normalized',
         quoting=csv.QUOTE_ALL
     )
 
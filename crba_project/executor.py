@@ -0,0 +1,59 @@
+"""
+Executors to run the sources of the ETL concurrently.
+
+All executors share the interface of concurrent.futures. So the ETL can submit
+the sources without knowing if they run in the calling thread, in a thread pool or in a process pool.
+
+* serial: Everything runs in the calling thread. Easiest to debug
+* thread: Thread pool. Best for the I/O heavy extractors (HTTP downloads, Selenium)
+* process: Process pool. Best when pandas transformations dominate. The Config gets pickled for every source
+"""
+import concurrent.futures
+import logging
+
+log = logging.getLogger(__name__)
+
+EXECUTOR_TYPES = ["serial", "thread", "process"]
+
+
+class SerialExecutor(concurrent.futures.Executor):
+    """
+    Executor which runs every submitted call directly in the calling thread.
+    The returned futures are allways already done.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as ex:
+            future.set_exception(ex)
+        return future
+
+
+def create_executor(executor_type="thread", workers=1):
+    """
+    Create the executor used to run the sources.
+
+    With one worker there is nothing to parallelise, so the serial executor is used
+    regardless of executor_type.
+
+    Parameters:
+    executor_type (str): One of EXECUTOR_TYPES
+    workers (int): Number of worker threads/ processes
+
+    Return:
+    concurrent.futures.Executor
+    """
+    if executor_type not in EXECUTOR_TYPES:
+        raise ValueError(f"Unknown executor type:{executor_type}. Choose one of {EXECUTOR_TYPES}")
+
+    if workers is None or workers <= 1 or executor_type == "serial":
+        return SerialExecutor()
+
+    log.info(f"Run sources with {workers} {executor_type} workers")
+    if executor_type == "thread":
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="crba-source"
+        )
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
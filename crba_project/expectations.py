@@ -0,0 +1,186 @@
+"""
+Native evaluation of the Great Expectations suites under crba_project/resources/great_expectations/expectations.
+
+The expectation types of the suites are simple column checks. They are evaluated here with pandas/NumPy,
+without loading a Great Expectations context. Like in Great Expectations the column map expectations
+ignore null values (except expect_column_values_to_not_be_null) and succeed if the share of the expected
+values is at least mostly (default 1.0).
+
+Expectation types without a native implementation are reported by ExpectationSuite.unsupported, the caller
+validates them with Great Expectations.
+"""
+import json
+import logging
+from importlib.resources import path as res_path
+from numbers import Number
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+
+def load_expectation_suite(name) -> dict:
+    """
+    The JSON of the expectation suite, as stored by Great Expectations
+    """
+    with res_path("crba_project.resources", "great_expectations") as p:
+        with open(Path(p) / "expectations" / f"{name}.json") as file:
+            return json.load(file)
+
+
+def _mostly(unexpected: pd.Series, element_count, mostly=1.0):
+    if element_count == 0:
+        return True
+    return (element_count - int(unexpected.sum())) / element_count >= mostly
+
+
+def expect_table_row_count_to_equal(dataframe, value, **kwargs):
+    return len(dataframe) == value
+
+
+def expect_table_columns_to_match_set(dataframe, column_set, exact_match=True, **kwargs):
+    if exact_match:
+        return set(dataframe.columns) == set(column_set)
+    return set(column_set) <= set(dataframe.columns)
+
+
+def expect_column_to_exist(dataframe, column, **kwargs):
+    return column in dataframe.columns
+
+
+def expect_column_values_to_not_be_null(dataframe, column, mostly=1.0, **kwargs):
+    values = dataframe[column]
+    return _mostly(values.isnull(), len(values), mostly)
+
+
+def expect_column_values_to_be_null(dataframe, column, mostly=1.0, **kwargs):
+    values = dataframe[column]
+    return _mostly(values.notnull(), len(values), mostly)
+
+
+def expect_column_values_to_be_in_set(dataframe, column, value_set, mostly=1.0, **kwargs):
+    values = dataframe[column].dropna()
+    return _mostly(~values.isin(value_set), len(values), mostly)
+
+
+def expect_column_values_to_not_be_in_set(dataframe, column, value_set, mostly=1.0, **kwargs):
+    values = dataframe[column].dropna()
+    return _mostly(values.isin(value_set), len(values), mostly)
+
+
+def expect_column_values_to_be_between(
+    dataframe, column, min_value=None, max_value=None, strict_min=False, strict_max=False, mostly=1.0, **kwargs
+):
+    values = dataframe[column].dropna()
+    # Values which are not numbers are unexpected, also numeric strings such as "2020"
+    if values.dtype == object:
+        values = values.where(values.map(lambda value: isinstance(value, Number)))
+    numbers = pd.to_numeric(values, errors="coerce")
+    unexpected = numbers.isnull()
+    if min_value is not None:
+        unexpected |= (numbers <= min_value) if strict_min else (numbers < min_value)
+    if max_value is not None:
+        unexpected |= (numbers >= max_value) if strict_max else (numbers > max_value)
+    return _mostly(unexpected, len(values), mostly)
+
+
+def expect_column_values_to_be_of_type(dataframe, column, type_, mostly=1.0, **kwargs):
+    values = dataframe[column]
+    expected_dtype = np.dtype(type_)
+    if values.dtype != object:
+        return values.dtype == expected_dtype
+    # Object column: The type of each value
+    values = values.dropna()
+
+    def unexpected(value):
+        try:
+            return np.dtype(type(value)) != expected_dtype
+        except TypeError:
+            return True
+
+    return _mostly(values.map(unexpected).astype(bool), len(values), mostly)
+
+
+def expect_compound_columns_to_be_unique(
+    dataframe, column_list, ignore_row_if="all_values_are_missing", mostly=1.0, **kwargs
+):
+    values = dataframe[list(column_list)]
+    if ignore_row_if == "all_values_are_missing":
+        values = values.dropna(how="all")
+    elif ignore_row_if == "any_value_is_missing":
+        values = values.dropna(how="any")
+    # Null values are compared as equal, e.g. rows without a dimension value
+    return _mostly(values.duplicated(keep=False), len(values), mostly)
+
+
+NATIVE_EXPECTATIONS = {
+    function.__name__: function
+    for function in [
+        expect_table_row_count_to_equal,
+        expect_table_columns_to_match_set,
+        expect_column_to_exist,
+        expect_column_values_to_not_be_null,
+        expect_column_values_to_be_null,
+        expect_column_values_to_be_in_set,
+        expect_column_values_to_not_be_in_set,
+        expect_column_values_to_be_between,
+        expect_column_values_to_be_of_type,
+        expect_compound_columns_to_be_unique,
+    ]
+}
+
+
+class ExpectationSuite:
+    def __init__(self, suite: dict):
+        """
+        :param suite: JSON of the expectation suite, see load_expectation_suite
+        """
+        self.name = suite.get("expectation_suite_name")
+        self.expectations = [
+            expectation for expectation in suite.get("expectations", [])
+            if expectation["expectation_type"] in NATIVE_EXPECTATIONS
+        ]
+        # Validated with Great Expectations
+        self.unsupported = [
+            expectation for expectation in suite.get("expectations", [])
+            if expectation["expectation_type"] not in NATIVE_EXPECTATIONS
+        ]
+        if self.unsupported:
+            log.info(
+                f"Suite {self.name}: No native implementation of "
+                f"{sorted({expectation['expectation_type'] for expectation in self.unsupported})}"
+            )
+
+    @classmethod
+    def load(cls, name):
+        return cls(load_expectation_suite(name))
+
+    def validate(self, dataframe: pd.DataFrame):
+        """
+        Evaluate the supported expectations
+
+        Return:
+        List of the failed expectations. Empty if all succeeded
+        """
+        failed = []
+        for expectation in self.expectations:
+            kwargs = expectation.get("kwargs", {})
+            try:
+                success = NATIVE_EXPECTATIONS[expectation["expectation_type"]](dataframe, **kwargs)
+            except KeyError:
+                # Missing column
+                success = False
+            if not success:
+                failed.append(expectation)
+        return failed
+
+
+def describe(expectation):
+    """
+    Short description of an expectation for the log, e.g. expect_column_values_to_not_be_null(INDICATOR_NAME)
+    """
+    kwargs = expectation.get("kwargs", {})
+    column = kwargs.get("column") or kwargs.get("column_list") or ""
+    return f"{expectation['expectation_type']}({column})"
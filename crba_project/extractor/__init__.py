@@ -1,13 +1,13 @@
 from abc import ABC, abstractmethod
+import hashlib
+import io
 import logging
 
-import requests
 import pandas as pd
-import great_expectations as gx
-from great_expectations.core.batch import RuntimeBatchRequest
-from great_expectations.checkpoint.types.checkpoint_result import CheckpointResult
 
 from crba_project.conf import Config
+from crba_project.extractor.session import get_session_manager
+from crba_project.incremental import file_digest
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.ERROR)
@@ -16,23 +16,91 @@ class ExtractionError(Exception):
     def __init__(self, message, SOURCE_ID):
         super().__init__(message)
         self.source_id = SOURCE_ID
-    pass
+
+    def __reduce__(self):
+        # Needed to get the error back from a worker process of the process pool
+        return (self.__class__, (str(self), self.source_id))
 
 class Extractor(ABC):
     """
     Maybe subcalss from Pandas Dataframe?!?!?
     """
 
+    # Reference data of the Config the extractor uses. Only these get loaded for a run, see Config.load_dependencies
+    config_dependencies = ("mappings", "country_full_list", "country_crba_list", "country_index", "column_schema", "output_writer")
+
     @classmethod
-    def api_request(cls, address, params=None, headers=None):
+    def api_request(cls, address, params=None, headers=None, ttl=None):
         """
         Dont catch exceptions. When erros occured the extraction should faile
+
+        The request goes through the shared session of the run. It reuses connections, retries
+        and shares the downloads of the same URL. See crba_project.extractor.session
+
+        :param ttl: Hours a cached payload is used without revalidation. See crba_project.extractor.cache
         """
-        response = requests.get(address, params=params, headers=headers)
+        response = get_session_manager().get(address, params=params, headers=headers, ttl=ttl)
         # If the response was successful, no Exception will be raised
         response.raise_for_status()
         # return response object
         return response
+
+    @classmethod
+    def prefetch_urls(cls, **source):
+        """
+        URLs the extractor requests with api_request.
+        The prefetch stage downloads them before the extractor runs.
+
+        :param source: Row of the source config
+        """
+        return []
+
+    @classmethod
+    def payload_fingerprint(cls, config, responses, ENDPOINT_URL="", **source):
+        """
+        Fingerprint of the raw payload of the source. Used by incremental runs, see crba_project.incremental
+
+        Covers the prefetched responses and local file endpoints. Extractors reading other inputs
+        have to add them. None if the payload is not known before the extractor runs (e.g. a failed prefetch),
+        then the source is always extracted.
+
+        :param responses: Prefetched responses of the source (url -> response)
+        """
+        digest = hashlib.sha256()
+        urls = cls.prefetch_urls(ENDPOINT_URL=ENDPOINT_URL, **source)
+        for url in urls:
+            if url not in responses:
+                return None
+            digest.update(f"{url}:{hashlib.sha256(responses[url].content).hexdigest()}\n".encode())
+
+        endpoint = Extractor.format_endpoint(ENDPOINT_URL, **source) if isinstance(ENDPOINT_URL, str) else ""
+        if endpoint.startswith("file:"):
+            endpoint_digest = file_digest(endpoint[len("file:"):])
+            if endpoint_digest is None:
+                return None
+            digest.update(f"{endpoint}:{endpoint_digest}\n".encode())
+        elif endpoint.strip() and not urls:
+            # Downloaded by the extractor itself
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def cache_ttl(CACHE_TTL_HOURS=None, **source):
+        """
+        Hours the payloads of the source are cached. Set with the optional CACHE_TTL_HOURS column of the source config.
+        None if not set, then the default of the cache is used.
+        """
+        if CACHE_TTL_HOURS is None or str(CACHE_TTL_HOURS).strip() in ("", "nan"):
+            return None
+        return float(CACHE_TTL_HOURS)
+
+    @staticmethod
+    def format_endpoint(ENDPOINT_URL, **source):
+        """
+        Fill the parameters of the endpoint with the urlparam_* values of the source
+        """
+        url_params = {key.replace("urlparam_",""):value for key, value in source.items() if key.startswith("urlparam_")}
+        return ENDPOINT_URL.format(**url_params)
     
     @abstractmethod
     def __init__(
@@ -82,8 +150,18 @@ class Extractor(ABC):
         self.invert_normalization = INVERT_NORMALIZATION
         self.indicator_id = INDICATOR_ID
         self.url_params = {key.replace("urlparam_",""):value for key, value in kwargs.items() if key.startswith("urlparam_")}
+        self.ttl = Extractor.cache_ttl(**kwargs)
                     
 
+    def open_endpoint(self):
+        """
+        Endpoint ready to be passed to pandas' read functions.
+        HTTP(S) endpoints are downloaded through api_request, local files are passed as they are.
+        """
+        if self.endpoint.startswith(("http://", "https://")):
+            return io.BytesIO(Extractor.api_request(self.endpoint, ttl=self.ttl).content)
+        return self.endpoint
+
     def download(self):
         self.endpoint = self.endpoint.format(**self.url_params)
         self.dataframe = self._download()
@@ -97,6 +175,8 @@ class Extractor(ABC):
         ##TODO do not reassign Dataframe but instead edit in place
         self.dataframe = self._transform()
         self.dataframe["SOURCE_ID"] = self.source_id
+        # The same categorical dtypes for all sources
+        self.dataframe = self.config.column_schema.apply(self.dataframe)
         return self
 
 
@@ -128,9 +208,9 @@ class Extractor(ABC):
             self.download() \
                 .transform()
 
-            self.dataframe.to_csv(
-                path_or_buf = self.config.output_dir / self.config.run_id / 'sample_{self.source_id}.csv',
-                sep = ";",
+            self.config.output_writer.write(
+                self.dataframe,
+                self.config.output_dir / self.config.run_id / f'sample_{self.source_id}',
                 quoting=1
             )
             #self.run_greate_expectation_checkpoint()
@@ -149,6 +229,8 @@ class Extractor(ABC):
 
 
 class EmptyExtractor(Extractor):
+    config_dependencies = ()
+
     def __init__(self, SOURCE_ID, **kwarg):
        self.source_id = SOURCE_ID
 
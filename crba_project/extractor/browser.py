@@ -0,0 +1,134 @@
+"""
+Process wide pool of headless Chrome browsers for the extractors which need to render a page (ILO).
+
+* Lazy: The first browser is started when it is needed. Runs without ILO sources never start Chrome
+* Bounded: At most size browsers per process. Further requests wait for a free browser
+* Reused: A browser serves many sources. The driver binary is only installed once
+* Clean shutdown: All browsers are quit when the process exits, also in the workers of a process pool
+"""
+import atexit
+import contextlib
+import logging
+import multiprocessing.util
+import os
+import queue
+import threading
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+log = logging.getLogger(__name__)
+
+
+class WebDriverPool:
+    def __init__(self, size=2):
+        """
+        :param size: Maximum number of browsers
+        """
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._driver_path = None
+        self._lock = threading.Lock()
+        self._shutdown_pid = None
+        # A forked worker process must not use the browsers of its parent
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._shutdown_pid = None
+
+    def _register_shutdown(self):
+        # Once per process. Workers of a process pool don't run the atexit handlers, but the finalizers of multiprocessing
+        if self._shutdown_pid != os.getpid():
+            self._shutdown_pid = os.getpid()
+            atexit.register(self.close)
+            multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def _create_driver(self):
+        if self._driver_path is None:
+            self._driver_path = ChromeDriverManager().install()
+        options = Options()
+        options.headless = True
+        log.info("Start headless Chrome")
+        return webdriver.Chrome(service=ChromeService(self._driver_path), options=options)
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if len(self._drivers) < self.size:
+                    self._register_shutdown()
+                    driver = self._create_driver()
+                    self._drivers.append(driver)
+                    return driver
+            # Wait for a free browser. Check again from time to time, a broken browser frees its slot
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as ex:
+            log.debug(f"Quitting a broken browser failed: {ex}")
+
+    @contextlib.contextmanager
+    def driver(self):
+        """
+        Borrow a browser. Usage:
+
+            with get_webdriver_pool().driver() as driver:
+                driver.get(url)
+        """
+        driver = self._acquire()
+        try:
+            yield driver
+        except WebDriverException:
+            # The browser may have crashed. Start a new one next time
+            self._discard(driver)
+            raise
+        except BaseException:
+            self._idle.put(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def configure(self, size=None):
+        if size is not None:
+            self.size = max(1, size)
+
+    def close(self):
+        """
+        Quit all browsers
+        """
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as ex:
+                log.debug(f"Quitting the browser failed: {ex}")
+        self._idle = queue.LifoQueue()
+
+
+_webdriver_pool = WebDriverPool()
+
+
+def get_webdriver_pool() -> WebDriverPool:
+    """
+    The process wide browser pool
+    """
+    return _webdriver_pool
@@ -0,0 +1,205 @@
+"""
+Cache of the raw payloads downloaded by the extractors.
+
+Layout of the cache directory:
+
+* entries/<request key>.json: One entry per request (URL, params and headers). Holds the hash of the payload,
+  the ETag/Last-Modified of the response and when it was fetched and last used
+* objects/<payload hash>.gz: The gzip compressed payloads. Content addressed, so the same payload is stored only once
+
+Modes:
+
+* off: No cache
+* read: Serve entries younger than their TTL. Older entries are revalidated with a conditional GET (If-None-Match/If-Modified-Since)
+* refresh: Always download and update the cache
+* offline: Only serve from the cache, never touch the network. Missing entries fail the source
+
+When the payloads get bigger than max_size, the least recently used entries get evicted.
+"""
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+
+CACHE_MODES = ["off", "read", "refresh", "offline"]
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class PayloadCache:
+    def __init__(self, directory, mode="read", default_ttl=24, max_size=2048):
+        """
+        :param directory: Directory of the cache
+        :param mode: One of CACHE_MODES except off
+        :param default_ttl: Hours an entry is served without revalidation. Sources can override it
+        :param max_size: Maximum size of the compressed payloads in MB
+        """
+        if mode not in CACHE_MODES or mode == "off":
+            raise ValueError(f"Unknown cache mode:{mode}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.default_ttl = default_ttl
+        self.max_size = max_size * 1024 * 1024
+        self.entries_dir = self.directory / "entries"
+        self.objects_dir = self.directory / "objects"
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        # hit, revalidated, miss, stored, evicted
+        self.stats = collections.Counter()
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params=None, headers=None):
+        raw = json.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def fetch(self, session: requests.Session, url, params=None, headers=None, timeout=None, ttl=None) -> requests.Response:
+        """
+        GET request through the cache.
+
+        :param ttl: Hours the entry is fresh. Default is default_ttl
+        """
+        key = self.key(url, params, headers)
+        entry = self._read_entry(key) if self.mode != "refresh" else None
+
+        if entry is not None:
+            age = (time.time() - entry["fetched_at"]) / 3600
+            if self.mode == "offline" or age < (self.default_ttl if ttl is None else ttl):
+                self.stats["hit"] += 1
+                return self._touch(key, entry)
+
+            # Stale: Ask the server if the payload changed
+            conditional_headers = dict(headers or {})
+            if entry.get("etag"):
+                conditional_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                conditional_headers["If-Modified-Since"] = entry["last_modified"]
+            response = session.get(url, params=params, headers=conditional_headers, timeout=timeout)
+            if response.status_code == 304:
+                self.stats["revalidated"] += 1
+                entry["fetched_at"] = time.time()
+                return self._touch(key, entry)
+        elif self.mode == "offline":
+            self.stats["miss"] += 1
+            raise CacheMiss(f"{url} is not in the cache ({self.directory}) and the cache mode is offline")
+        else:
+            self.stats["miss"] += 1
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+
+        if response.status_code == 200:
+            self._store(key, url, response)
+        return response
+
+    def _read_entry(self, key):
+        try:
+            with open(self.entries_dir / f"{key}.json") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not self._object_path(entry["content_hash"]).exists():
+            return None
+        return entry
+
+    def _touch(self, key, entry):
+        entry["accessed_at"] = time.time()
+        self._write_json(self.entries_dir / f"{key}.json", entry)
+        with gzip.open(self._object_path(entry["content_hash"]), "rb") as file:
+            content = file.read()
+
+        response = requests.Response()
+        response._content = content
+        response.status_code = 200
+        response.url = entry["url"]
+        response.encoding = entry.get("encoding")
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        return response
+
+    def _object_path(self, content_hash):
+        return self.objects_dir / f"{content_hash}.gz"
+
+    def _store(self, key, url, response):
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        object_path = self._object_path(content_hash)
+        if not object_path.exists():
+            self._write_bytes(object_path, gzip.compress(response.content))
+            with self._lock:
+                if self._size is not None:
+                    self._size += object_path.stat().st_size
+
+        now = time.time()
+        self._write_json(
+            self.entries_dir / f"{key}.json",
+            {
+                "url": url,
+                "content_hash": content_hash,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "encoding": response.encoding,
+                "headers": {
+                    name: response.headers[name]
+                    for name in ("Content-Type", "ETag", "Last-Modified")
+                    if name in response.headers
+                },
+                "fetched_at": now,
+                "accessed_at": now,
+            },
+        )
+        self.stats["stored"] += 1
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the payloads fit into max_size
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(path.stat().st_size for path in self.objects_dir.glob("*.gz"))
+            if self._size <= self.max_size:
+                return
+
+            entries = []
+            for path in self.entries_dir.glob("*.json"):
+                try:
+                    with open(path) as file:
+                        entries.append((path, json.load(file)))
+                except (OSError, ValueError):
+                    path.unlink(missing_ok=True)
+            entries.sort(key=lambda path_entry: path_entry[1].get("accessed_at", 0))
+            references = collections.Counter(entry["content_hash"] for _, entry in entries)
+
+            for path, entry in entries:
+                if self._size <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                self.stats["evicted"] += 1
+                references[entry["content_hash"]] -= 1
+                object_path = self._object_path(entry["content_hash"])
+                if references[entry["content_hash"]] == 0 and object_path.exists():
+                    self._size -= object_path.stat().st_size
+                    object_path.unlink()
+
+    @staticmethod
+    def _write_bytes(path, data):
+        # Write to a temporary file first, so other threads/ processes never read half written files
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _write_json(cls, path, data):
+        cls._write_bytes(path, json.dumps(data).encode())
@@ -14,6 +14,10 @@ class DefaultCSVExtractor(Extractor):
     def __init__( self,config,**kwarg):
         super().__init__(config,**kwarg)
 
+    @classmethod
+    def prefetch_urls(cls, **source):
+        return [Extractor.format_endpoint(**source)]
+
     def _download(self):
         csv_data = Extractor.api_request(self.endpoint).text
         raw_data = pd.read_csv(StringIO(csv_data), sep=",")
@@ -77,8 +81,7 @@ class DefaultCSVExtractor(Extractor):
 
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list=self.config.country_crba_list,
-            country_list_full=self.config.country_full_list,
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
@@ -101,7 +104,7 @@ class DefaultCSVExtractor(Extractor):
         )
 
         self.dataframe = Cleanser().map_values(
-            cleansed_data=self.dataframe, value_mapping_dict=self.config.value_mapper
+            cleansed_data=self.dataframe, value_lookup=self.config.value_lookup
         )
 
         self.dataframe = Cleanser().encode_categorical_variables(
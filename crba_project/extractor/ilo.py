@@ -1,31 +1,55 @@
+import logging
+
 import bs4 as bs
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 
 from crba_project.cleanse import Cleanser
 from crba_project.extractor import Extractor
+from crba_project.extractor.browser import get_webdriver_pool
 from crba_project.normalize import scaler
 
+log = logging.getLogger(__name__)
 
 
 class ILO_Extractor(Extractor):
-    
+    config_dependencies = Extractor.config_dependencies + ("country_name_matcher",)
+
     def __init__( self,config,**kwarg):
         super().__init__(config,**kwarg)
-        
-        options = Options()
-        options.headless = True
-        self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), chrome_options=options)
+
+    @classmethod
+    def payload_fingerprint(cls, config, responses, **source):
+        # Scraped with Selenium. Unknown until the page got rendered
+        return None
+
+    @staticmethod
+    def find_target_table(page_source):
+        """
+        The NORMLEX table of the page. None if the page does not contain it
+        """
+        soup = bs.BeautifulSoup(page_source,features="lxml")
+        tables = soup.find_all("table", {"cellspacing": "0", "class": "horizontalLine"})
+        if not tables:
+            return None
+        return str(tables)
 
     def _download(self):
-        response = self.driver.get(self.address)
-        soup = bs.BeautifulSoup(self.driver.page_source,features="lxml")
-        target_table = str(
-        soup.find_all("table", {"cellspacing": "0", "class": "horizontalLine"})
-        )
+        target_table = None
+        if self.config.static_html_first:
+            # Fast path: Some pages contain the table already in the static HTML
+            try:
+                target_table = ILO_Extractor.find_target_table(Extractor.api_request(self.address).text)
+            except Exception as ex:
+                log.info(f"Static download of {self.address} failed: {ex}")
+            if target_table is None:
+                log.info(f"No table in the static HTML of {self.address}. Render it with a browser")
+
+        if target_table is None:
+            with get_webdriver_pool().driver() as driver:
+                driver.get(self.address)
+                target_table = ILO_Extractor.find_target_table(driver.page_source)
+        if target_table is None:
+            raise ValueError(f"The page {self.address} contains no NORMLEX table")
 
         # Create dataframe with the data
         self.dataframe  = pd.read_html(io=target_table, header=0)[
@@ -55,13 +79,12 @@ class ILO_Extractor(Extractor):
 
         self.dataframe = Cleanser().decompose_country_footnote_ilo_normlex(
             dataframe = self.dataframe,
-            country_name_list = self.config.country_full_list["COUNTRY_NAME"]
+            country_name_matcher = self.config.country_name_matcher
         )
 
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list=self.config.country_crba_list,
-            country_list_full = self.config.country_full_list
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
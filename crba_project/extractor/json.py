@@ -1,5 +1,4 @@
 import pandas as pd
-import requests
 
 from crba_project.cleanse import Cleanser
 from crba_project.extractor import Extractor
@@ -13,16 +12,20 @@ class DefaultJsonExtractor(Extractor):
 
         self.na_encoding = NA_ENCODING
 
+    @classmethod
+    def prefetch_urls(cls, **source):
+        return [Extractor.format_endpoint(**source)]
     
     def _download(self):
         # Extract data and convert to pandas dataframe
+        json_data = Extractor.api_request(self.endpoint).json()
         try:
             # Most json data is from SDG; which deturn json with key "data" having the data as value
-            raw_data = pd.json_normalize(requests.get(self.endpoint).json()["data"])
+            raw_data = pd.json_normalize(json_data["data"])
         except:
             # However, some of the data is also from World Bank where the command returns list, which must be subset with list index
             raw_data = pd.json_normalize(
-                requests.get(self.endpoint).json()[1]
+                json_data[1]
             )  # 0 is metadata, 1 contains actual data)
 
         return raw_data
@@ -70,8 +73,7 @@ class DefaultJsonExtractor(Extractor):
 
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list=self.config.country_crba_list,
-            country_list_full = self.config.country_full_list
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
@@ -95,7 +97,7 @@ class DefaultJsonExtractor(Extractor):
 
         self.dataframe = Cleanser().map_values(
             cleansed_data = self.dataframe,
-            value_mapping_dict = self.config.value_mapper
+            value_lookup = self.config.value_lookup
         )
         
         self.dataframe = Cleanser().encode_categorical_variables(
@@ -1,13 +1,14 @@
 import datetime
 from io import StringIO
+import threading
 
-import requests
 import pandas as pd
 import numpy as np
 import re
 
 from crba_project.cleanse import Cleanser
 from crba_project.extractor import Extractor
+from crba_project.incremental import directory_digest
 from crba_project.normalize import scaler
 
 class ManuelExtractor(Extractor):
@@ -16,6 +17,21 @@ class ManuelExtractor(Extractor):
     Normal ETL-pipeline
     """
 
+    @classmethod
+    def prefetch_urls(cls, ENDPOINT_URL="", **source):
+        # Excel files which are downloaded with open_endpoint
+        if isinstance(ENDPOINT_URL, str) and ENDPOINT_URL.startswith(("http://", "https://")):
+            return [Extractor.format_endpoint(ENDPOINT_URL, **source)]
+        return []
+
+    @classmethod
+    def payload_fingerprint(cls, config, responses, **source):
+        fingerprint = super().payload_fingerprint(config, responses, **source)
+        if fingerprint is None:
+            return None
+        # Most of the manual extractors read files of the machine entered folder
+        return f"{fingerprint}:{directory_digest(config.data_sources_raw_manual_machine)}"
+
     def _transform(self):
         
         # Cleansing
@@ -66,8 +82,7 @@ class ManuelExtractor(Extractor):
         
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list= self.config.country_crba_list,
-            country_list_full = self.config.country_full_list
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
@@ -91,7 +106,7 @@ class ManuelExtractor(Extractor):
 
         self.dataframe = Cleanser().map_values(
             cleansed_data = self.dataframe,
-            value_mapping_dict = self.config.value_mapper
+            value_lookup = self.config.value_lookup
         )
         
         self.dataframe = Cleanser().encode_categorical_variables(
@@ -139,7 +154,7 @@ class HumanEnteredExtractor(ManuelExtractor):
 
 
     def _download(self):
-        self.dataframe = pd.read_excel( self.endpoint, sheet_name="Blueprint")
+        self.dataframe = pd.read_excel( self.open_endpoint(), sheet_name="Blueprint")
         raw_obs_value_col = "RAW_OBS_VALUE"
         if self.raw_obs_value_type == "categorical":
         # Delete trailing whitespace and numbers of parentheses in raw_OBS_VALUE
@@ -181,7 +196,10 @@ class IDMC_Extractor(ManuelExtractor):
     S-180, S-181, S-189, S-230
     """
 
+    config_dependencies = ManuelExtractor.config_dependencies + ("un_pop_tot",)
+
     IDMC_Extractor_Source = dict()
+    IDMC_Extractor_Source_Lock = threading.Lock()
 
     def __init__(self,config, ATTR_UNIT_MEASURE,**kwarg):
         super().__init__(config,**kwarg)
@@ -189,48 +207,50 @@ class IDMC_Extractor(ManuelExtractor):
 
 
     def _download(self):
-        if self.source_id not in IDMC_Extractor.IDMC_Extractor_Source.keys():
-            #TODO change loop into indicator Excel...
-            S_180_S_181_S189_S_230 = pd.read_excel(
-                self.config.data_sources_raw_manual_machine
-                / "S-180, S-181, S-189 S-230 idmc_displacement_all_dataset.xlsx"
-            ).drop(
-                0
-            )  # delete first row containing strings
-
-            # Cast year as string, required for merge command later
-            S_180_S_181_S189_S_230["Year"] = S_180_S_181_S189_S_230["Year"].astype(str)
-
-            # Join raw data and population data together
-            S_180_S_181_S189_S_230_raw = self.config.un_pop_tot.merge(
-                right=S_180_S_181_S189_S_230,
-                how="right",
-                # on="ISO3_YEAR"
-                left_on=["COUNTRY_ISO_3", "year"],
-                right_on=["ISO3", "Year"],
-            )
+        # All four sources share one file. With a thread pool only the first one reads it
+        with IDMC_Extractor.IDMC_Extractor_Source_Lock:
+            if self.source_id not in IDMC_Extractor.IDMC_Extractor_Source.keys():
+                #TODO change loop into indicator Excel...
+                S_180_S_181_S189_S_230 = pd.read_excel(
+                    self.config.data_sources_raw_manual_machine
+                    / "S-180, S-181, S-189 S-230 idmc_displacement_all_dataset.xlsx"
+                ).drop(
+                    0
+                )  # delete first row containing strings
+
+                # Cast year as string, required for merge command later
+                S_180_S_181_S189_S_230["Year"] = S_180_S_181_S189_S_230["Year"].astype(str)
+
+                # Join raw data and population data together
+                S_180_S_181_S189_S_230_raw = self.config.un_pop_tot.merge(
+                    right=S_180_S_181_S189_S_230,
+                    how="right",
+                    # on="ISO3_YEAR"
+                    left_on=["COUNTRY_ISO_3", "year"],
+                    right_on=["ISO3", "Year"],
+                )
 
-            # Create list to loop through
-            idmc_list = [
-                ["S-180", "Conflict Stock Displacement"],
-                ["S-181", "Conflict New Displacements"],
-                ["S-189", "Disaster New Displacements"],
-                ["S-230", "Disaster Stock Displacement"],
-            ]
+                # Create list to loop through
+                idmc_list = [
+                    ["S-180", "Conflict Stock Displacement"],
+                    ["S-181", "Conflict New Displacements"],
+                    ["S-189", "Disaster New Displacements"],
+                    ["S-230", "Disaster Stock Displacement"],
+                ]
 
-            # Loop through list
-            for element in idmc_list:
-                # Extract right columns
-                dataframe = S_180_S_181_S189_S_230_raw.loc[:,["ISO3", "Year", "population", element[1]]]
+                # Loop through list
+                for element in idmc_list:
+                    # Extract right columns
+                    dataframe = S_180_S_181_S189_S_230_raw.loc[:,["ISO3", "Year", "population", element[1]]]
 
-                # Calculate target kpi --> Normalize to per 100.000 persons
-                dataframe["RAW_OBS_VALUE"] = (
-                    dataframe[element[1]] / (dataframe["population"]) * 100
-                )  # Pop given inthousands, we want number per 100.000 pop
+                    # Calculate target kpi --> Normalize to per 100.000 persons
+                    dataframe["RAW_OBS_VALUE"] = (
+                        dataframe[element[1]] / (dataframe["population"]) * 100
+                    )  # Pop given inthousands, we want number per 100.000 pop
 
-                # Add unit measure
-                dataframe["ATTR_UNIT_MEASURE"] = self.attr_unit_measure
-                IDMC_Extractor.IDMC_Extractor_Source[element[0]] = dataframe
+                    # Add unit measure
+                    dataframe["ATTR_UNIT_MEASURE"] = self.attr_unit_measure
+                    IDMC_Extractor.IDMC_Extractor_Source[element[0]] = dataframe
 
         return IDMC_Extractor.IDMC_Extractor_Source[self.source_id]
             
@@ -238,20 +258,26 @@ class UN_SDG_UN_POP(ManuelExtractor):
     """""
     S-185, S-186, S-187, S-188
     """""
+    config_dependencies = ManuelExtractor.config_dependencies + ("un_pop_tot",)
 
     def __init__(self,config, ATTR_UNIT_MEASURE,**kwarg):
         super().__init__(config,**kwarg)
         self.attr_unit_measure = ATTR_UNIT_MEASURE
 
 
+    @classmethod
+    def prefetch_urls(cls, **source):
+        return [Extractor.format_endpoint(**source)]
+
     def _download(self):
+        json_data = Extractor.api_request(self.endpoint).json()
         try:
             # Most json data is from SDG; which deturn json with key "data" having the data as value
-            raw_data = pd.json_normalize(requests.get(self.endpoint).json()["data"])
+            raw_data = pd.json_normalize(json_data["data"])
         except:
             # However, some of the data is also from World Bank where the command returns list, which must be subset with list index
             raw_data = pd.json_normalize(
-                requests.get(self.endpoint).json()[1]
+                json_data[1]
             )  # 0 is metadata, 1 contains actual data)
 
         self.dataframe = raw_data
@@ -299,8 +325,15 @@ class UN_SDG_UN_POP(ManuelExtractor):
         return self.dataframe 
 
 class S_157(ManuelExtractor):
+
+    POPULATION_URL = "https://sdmx.data.unicef.org/ws/public/sdmxapi/rest/data/UNICEF,DM,1.0/.DM_POP_U5...?format=sdmx-csv&startPeriod=2015&endPeriod=2020"
+
     def __init__(self,config,**kwarg):
         super().__init__(config,**kwarg)
+
+    @classmethod
+    def prefetch_urls(cls, **source):
+        return [Extractor.format_endpoint(**source), S_157.POPULATION_URL]
     
     def _download(self):
         csv_data = Extractor.api_request(self.endpoint).text
@@ -310,7 +343,7 @@ class S_157(ManuelExtractor):
         dataframe = dataframe.loc[dataframe.SEX == "BTSX"]
 
         # Obtain population data
-        csv_data = Extractor.api_request("https://sdmx.data.unicef.org/ws/public/sdmxapi/rest/data/UNICEF,DM,1.0/.DM_POP_U5...?format=sdmx-csv&startPeriod=2015&endPeriod=2020").text
+        csv_data = Extractor.api_request(S_157.POPULATION_URL).text
         population_data = pd.read_csv(StringIO(csv_data), sep=",")
 
         # Extract ISO3 code from population data
@@ -403,7 +436,7 @@ class ICRC_Treaties(ManuelExtractor):
         try:
         # Try loading data from endpoint (preferred)
             self.dataframe = pd.read_excel(
-                self.endpoint,
+                self.open_endpoint(),
                 sheet_name="IHL and other related Treaties",
                 header=1,
             )
@@ -445,7 +478,7 @@ class CRIN_Treaties(ManuelExtractor):
         try:
             # Try loading data from endpoint (preferred)
             self.dataframe = pd.read_excel(
-                self.endpoint,
+                self.open_endpoint(),
                 sheet_name="All countries",
                 header=1,
             ).drop(
@@ -653,7 +686,7 @@ class Inform_Risk_Index_Data(ManuelExtractor):
         try:
             # Try and pull data from endpoint if possible
             self.dataframe = pd.read_excel(
-                self.endpoint,
+                self.open_endpoint(),
                 header=1,
                 sheet_name="INFORM Risk 2021 (a-z)",
             ).drop(0)
@@ -743,14 +776,19 @@ class EITI(ManuelExtractor):
     def __init__(self,config,**kwarg):
         super().__init__(config,**kwarg)
 
+    @classmethod
+    def prefetch_urls(cls, **source):
+        return [Extractor.format_endpoint(**source)]
+
     def _download(self):
+        json_data = Extractor.api_request(self.endpoint).json()
         try:
             # Most json data is from SDG; which deturn json with key "data" having the data as value
-            self.dataframe = pd.json_normalize(requests.get(self.endpoint).json()["data"])
+            self.dataframe = pd.json_normalize(json_data["data"])
         except:
             # However, some of the data is also from World Bank where the command returns list, which must be subset with list index
             self.dataframe = pd.json_normalize(
-                requests.get(self.endpoint).json()[1]
+                json_data[1]
             )  # 0 is metadata, 1 contains actual data)
 
         # Add time period
@@ -0,0 +1,93 @@
+"""
+Download stage of the ETL.
+
+The raw payloads of the API/CSV/JSON sources get downloaded ahead, while other sources
+are transformed. An asyncio event loop runs in a background thread and schedules the
+downloads. The blocking requests run in a thread pool and go through Extractor.api_request,
+so the responses end up in the shared session of the run (see crba_project.extractor.session). The number of parallel requests to one host is bounded
+to not get blocked by the APIs.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import threading
+from urllib.parse import urlsplit
+
+from crba_project.extractor import Extractor
+from crba_project.extractor.session import get_session_manager
+
+log = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Usage:
+
+        with Prefetcher(max_per_host=4) as prefetcher:
+            future = prefetcher.prefetch(urls)
+            # Dict url -> response of all downloads which succeeded
+            responses = future.result()
+            # Once the source is extracted. Until then the session keeps the responses
+            get_session_manager().release(urls)
+    """
+
+    def __init__(self, max_per_host=4, max_connections=16):
+        self.max_per_host = max(1, max_per_host)
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="crba-prefetch"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="crba-prefetch-loop", daemon=True
+        )
+        # Only used inside the event loop
+        self._host_semaphores = {}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._io_pool.shutdown(wait=True)
+
+    def prefetch(self, urls, ttl=None) -> concurrent.futures.Future:
+        """
+        Schedule the download of the urls. The session retains their responses, so the extractor of the source
+        gets them without another download. Release them when the source is done (SessionManager.release)
+
+        :param ttl: Hours a cached payload is used without revalidation. See crba_project.extractor.cache
+
+        Return:
+        Future resolving into a dict url -> response. Failed downloads are left out,
+        the extractor gets the same error from the session and fails with a proper ExtractionError.
+        """
+        get_session_manager().retain(urls)
+        return asyncio.run_coroutine_threadsafe(self._fetch_all(urls, ttl), self._loop)
+
+    async def _fetch_all(self, urls, ttl=None):
+        responses = await asyncio.gather(
+            *[self._fetch(url, ttl) for url in urls], return_exceptions=True
+        )
+        prefetched = {}
+        for url, response in zip(urls, responses):
+            if isinstance(response, Exception):
+                log.info(f"Prefetching {url} failed: {response}")
+            else:
+                prefetched[url] = response
+        return prefetched
+
+    async def _fetch(self, url, ttl=None):
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        async with self._host_semaphores[host]:
+            return await self._loop.run_in_executor(
+                self._io_pool, functools.partial(Extractor.api_request, url, ttl=ttl)
+            )
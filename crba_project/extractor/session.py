@@ -0,0 +1,174 @@
+"""
+Shared HTTP layer of the extractors.
+
+All requests of a run go through one SessionManager:
+
+* One requests.Session per host. The connections get reused (keep-alive), so there is only one TLS handshake per connection
+* Retries with exponential backoff on 429 and 5xx responses and on connection errors. A Retry-After header is respected
+* A timeout for every request. Without it a hanging API blocks the run forever
+* Concurrent requests for the same URL wait for the first one. Completed responses are only kept while they are
+  retained, e.g. the prefetched payloads of a source until its extractor ran (retain/release). So the payloads
+  are freed source by source and not held until the end of the run
+* Optional PayloadCache which keeps the payloads between runs (see crba_project.extractor.cache)
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class SessionManager:
+    def __init__(self, timeout=120, retries=5, backoff_factor=1, pool_maxsize=8):
+        """
+        :param timeout: Seconds to wait for the connection and for each read from the socket
+        :param retries: Maximum number of retries of a request
+        :param backoff_factor: Waits backoff_factor * 2^(retry - 1) seconds between the retries
+        :param pool_maxsize: Maximum number of connections kept open per host
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.cache = None
+        self._sessions = {}
+        # Key -> Future of the response. Only the requests in flight and the retained responses
+        self._responses = {}
+        # Key -> Number of retain calls without release
+        self._retained = Counter()
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            # Return the last response. The caller decides with raise_for_status
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session(self, url) -> requests.Session:
+        """
+        Session of the host of the url
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._create_session()
+            return self._sessions[host]
+
+    @staticmethod
+    def _key(url, params=None, headers=None):
+        return (
+            url,
+            tuple(sorted((params or {}).items())),
+            tuple(sorted((headers or {}).items())),
+        )
+
+    def get(self, url, params=None, headers=None, ttl=None) -> requests.Response:
+        """
+        GET request. Calls for the same request while it is in flight or retained
+        get the response (or the exception) of the first call.
+
+        :param ttl: Hours a cached payload is served without revalidation. Only used with a cache
+        """
+        key = self._key(url, params, headers)
+        with self._lock:
+            future = self._responses.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._responses[key] = future
+
+        if is_owner:
+            try:
+                if self.cache is not None:
+                    response = self.cache.fetch(
+                        self.session(url), url, params=params, headers=headers, timeout=self.timeout, ttl=ttl
+                    )
+                else:
+                    log.info(f"Download {url}")
+                    response = self.session(url).get(url, params=params, headers=headers, timeout=self.timeout)
+                future.set_result(response)
+            except Exception as ex:
+                future.set_exception(ex)
+            with self._lock:
+                if not self._retained[key]:
+                    self._responses.pop(key, None)
+        return future.result()
+
+    def retain(self, urls):
+        """
+        Keep the responses of the urls after their download, until release is called for them as often as retain
+        """
+        with self._lock:
+            for url in urls:
+                self._retained[self._key(url)] += 1
+
+    def release(self, urls):
+        """
+        Counterpart of retain and seed. The responses nobody retains any more are dropped
+        """
+        with self._lock:
+            for url in urls:
+                key = self._key(url)
+                self._retained[key] -= 1
+                if self._retained[key] > 0:
+                    continue
+                del self._retained[key]
+                future = self._responses.get(key)
+                if future is not None and future.done():
+                    del self._responses[key]
+
+    def seed(self, responses):
+        """
+        Add responses which got downloaded somewhere else, e.g. by the prefetch stage in the main process.
+        They are retained, call release with the same urls when they are consumed
+
+        :param responses: Dict url -> response
+        """
+        with self._lock:
+            for url, response in responses.items():
+                key = self._key(url)
+                self._retained[key] += 1
+                if key not in self._responses:
+                    future = Future()
+                    future.set_result(response)
+                    self._responses[key] = future
+
+    def configure(self, timeout=None, retries=None, cache=None):
+        """
+        Change the settings. Only affects sessions created afterwards (retries) and new requests (timeout, cache)
+
+        :param cache: PayloadCache or None to download everything
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if retries is not None:
+            self.retries = retries
+        self.cache = cache
+
+
+_session_manager = SessionManager()
+
+
+def get_session_manager() -> SessionManager:
+    """
+    The process wide session manager
+    """
+    return _session_manager
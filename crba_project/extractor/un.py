@@ -11,6 +11,10 @@ class UnTreaties(Extractor):
     
     def __init__(self, config,**kwarg):
         super().__init__(config,**kwarg)
+
+    @classmethod
+    def prefetch_urls(cls, ADDRESS, **source):
+        return [ADDRESS.strip()]
     
     def _download(self):
         # Get http request
@@ -61,8 +65,7 @@ class UnTreaties(Extractor):
 
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list= self.config.country_crba_list,
-            country_list_full = self.config.country_full_list
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
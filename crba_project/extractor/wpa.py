@@ -1,59 +1,72 @@
+import threading
+
 import pandas as pd
 
 from crba_project.cleanse import Cleanser
 from crba_project.extractor import Extractor
+from crba_project.incremental import directory_digest
 from crba_project.normalize import scaler
 
 class WPA_Extractor(Extractor):
+
+    wpa_combined = None
+    wpa_combined_lock = threading.Lock()
      
     def __init__(self,config, WPA_YEAR_COL,WPA_OBS_RAW_COL,**kwarg):
         super().__init__(config,**kwarg)
 
         self.wpa_year_col = WPA_YEAR_COL
         self.wpa_obs_raw_col = WPA_OBS_RAW_COL
+
+    @classmethod
+    def payload_fingerprint(cls, config, responses, **source):
+        return directory_digest(config.data_sources_raw_manual_machine)
     
     def _download(self):
-        if not hasattr(WPA_Extractor, 'wpa_combined') or WPA_Extractor.wpa_combined is None:
-            # 1. Create a flat file of all WPA sources
-            # Read and join all world policy analysis centre data
-            wpa_child_labor = pd.read_excel(
-                io = self.config.data_sources_raw_manual_machine / 'S_8, S_9' / 'WORLD_child_labor.xls'
-            )
+        # All WPA sources share the same files. With a thread pool only the first one reads them
+        with WPA_Extractor.wpa_combined_lock:
+            if WPA_Extractor.wpa_combined is None:
+                # 1. Create a flat file of all WPA sources
+                # Read and join all world policy analysis centre data
+                wpa_child_labor = pd.read_excel(
+                    io = self.config.data_sources_raw_manual_machine / 'S_8, S_9' / 'WORLD_child_labor.xls'
+                )
 
-            wpa_childhood = pd.read_excel(
-                io = self.config.data_sources_raw_manual_machine / 'S_10, S_13, S_36, S_45, S_49' / 'WORLD_Dataset_Childhood_4.16.15.xls'
-            )
+                wpa_childhood = pd.read_excel(
+                    io = self.config.data_sources_raw_manual_machine / 'S_10, S_13, S_36, S_45, S_49' / 'WORLD_Dataset_Childhood_4.16.15.xls'
+                )
 
-            wpa_adult_labor = pd.read_excel(
-                io = self.config.data_sources_raw_manual_machine / 'S_40, S_41, S_63, S_64, S_65, S_66, S_67, S_68' / 'WORLD_Dataset_Adult_Labor_9.17.2018.xls'
-            )
+                wpa_adult_labor = pd.read_excel(
+                    io = self.config.data_sources_raw_manual_machine / 'S_40, S_41, S_63, S_64, S_65, S_66, S_67, S_68' / 'WORLD_Dataset_Adult_Labor_9.17.2018.xls'
+                )
 
-            wpa_discrimination = pd.read_excel(
-                io = self.config.data_sources_raw_manual_machine / 'S_42, S_43, S_44' / 'WORLD_discrimination_at_work.xls'
-            )
-            
-            # Create list to write a loop
-            wpa_combined_list=[
-                #wpa_child_labor,
-                wpa_childhood,
-                wpa_adult_labor,
-                wpa_discrimination
-            ]
-
-            # Loop to join all dataframes
-            wpa_combined = wpa_child_labor
-
-            for df in wpa_combined_list:
-                wpa_combined = wpa_combined.merge(
-                    right=df,
-                    on=['iso2', 'iso3']
+                wpa_discrimination = pd.read_excel(
+                    io = self.config.data_sources_raw_manual_machine / 'S_42, S_43, S_44' / 'WORLD_discrimination_at_work.xls'
                 )
-            WPA_Extractor.wpa_combined=wpa_combined
-            # Hope this do the same ....
-            #WPA_Extractor.wpa_combined_list = pd.concat(wpa_combined_list,
-            #axis=1, # Concat columns not rows aka merge 
-            #)
-        return WPA_Extractor.wpa_combined
+                
+                # Create list to write a loop
+                wpa_combined_list=[
+                    #wpa_child_labor,
+                    wpa_childhood,
+                    wpa_adult_labor,
+                    wpa_discrimination
+                ]
+
+                # Loop to join all dataframes
+                wpa_combined = wpa_child_labor
+
+                for df in wpa_combined_list:
+                    wpa_combined = wpa_combined.merge(
+                        right=df,
+                        on=['iso2', 'iso3']
+                    )
+                WPA_Extractor.wpa_combined=wpa_combined
+                # Hope this do the same ....
+                #WPA_Extractor.wpa_combined_list = pd.concat(wpa_combined_list,
+                #axis=1, # Concat columns not rows aka merge 
+                #)
+        # Shallow copy, so the sources don't add columns to the shared dataframe
+        return WPA_Extractor.wpa_combined.copy(deep=False)
 
     def _transform(self):
 
@@ -82,8 +95,7 @@ class WPA_Extractor(Extractor):
 
         self.dataframe = Cleanser().add_and_discard_countries(
             grouped_data=self.dataframe,
-            crba_country_list=self.config.country_crba_list,
-            country_list_full = self.config.country_full_list
+            country_index=self.config.country_index,
         )
 
         self.dataframe = Cleanser().add_cols_fill_cells(
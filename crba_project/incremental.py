@@ -0,0 +1,157 @@
+"""
+Incremental runs.
+
+Every source gets a fingerprint of everything its normalized output depends on:
+
+* Its row of the source config
+* The shared inputs: mapping scripts, country lists and population data of the input dir
+* The code of the crba_project package
+* Its raw payload. See Extractor.payload_fingerprint
+
+The normalized output of every source is stored with its fingerprint in the data_normalized folder of the run.
+With --incremental the next run compares the fingerprints with the ones of a previous run
+and reuses the stored output of the unchanged sources. Only the changed ones get extracted again.
+Sources without a payload fingerprint (e.g. scraped with Selenium) are always extracted.
+"""
+import functools
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+FINGERPRINTS_FILE = "fingerprints.json"
+
+SHARED_INPUT_FILES = [
+    "column_mapping.py",
+    "value_mapping.py",
+    "value_mapping_sdmx_encoding.py",
+    "all_countrynames_list.xlsx",
+    "crba_country_list.xlsx",
+    "WPP2019_POP_F01_1_TOTAL_POPULATION_BOTH_SEXES.xlsx",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """
+    sha256 of the content of the file. Only read again when size or modification time changed.
+    None if the file does not exist.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return None
+    stat = path.stat()
+    return _file_digest(str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def files_digest(paths):
+    """
+    Digest of several files. Missing files are part of the digest as well
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(f"{path}:{file_digest(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def directory_digest(directory):
+    """
+    Digest of all files below the directory
+    """
+    directory = Path(directory)
+    return files_digest(sorted(path for path in directory.rglob("*") if path.is_file()))
+
+
+@functools.lru_cache(maxsize=None)
+def code_digest():
+    """
+    Digest of the python code of the package. Changed transformations invalidate all sources
+    """
+    package_dir = Path(__file__).parent
+    return files_digest(sorted(package_dir.rglob("*.py")))
+
+
+def shared_inputs_digest(config):
+    """
+    Digest of everything all sources depend on
+    """
+    return hashlib.sha256(
+        (files_digest([config.input_dir / name for name in SHARED_INPUT_FILES]) + code_digest()).encode()
+    ).hexdigest()
+
+
+def source_fingerprint(shared_digest, row, payload_fingerprint):
+    """
+    Fingerprint of a source. None if the payload can't be fingerprinted
+
+    :param shared_digest: See shared_inputs_digest
+    :param row: Row of the source config as dict
+    :param payload_fingerprint: See Extractor.payload_fingerprint
+    """
+    if payload_fingerprint is None:
+        return None
+    raw = json.dumps([shared_digest, payload_fingerprint, row], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class PreviousRun:
+    """
+    Normalized outputs of a previous run
+    """
+
+    def __init__(self, run_dir):
+        self.normalized_dir = Path(run_dir) / "data_normalized"
+        try:
+            with open(self.normalized_dir / FINGERPRINTS_FILE) as file:
+                self.fingerprints = json.load(file)
+        except (OSError, ValueError) as ex:
+            log.warning(f"No fingerprints found in {run_dir}. All sources get extracted: {ex}")
+            self.fingerprints = {}
+        log.info(f"Incremental run based on {run_dir} with {len(self.fingerprints)} fingerprints")
+
+    @classmethod
+    def resolve(cls, output_dir, previous_run):
+        """
+        :param previous_run: Directory of the run or run id inside the output_dir (e.g. latest)
+        """
+        run_dir = Path(previous_run)
+        if not run_dir.is_dir():
+            run_dir = Path(output_dir) / previous_run
+        return cls(run_dir)
+
+    def output_path(self, source_id):
+        return self.normalized_dir / f"{source_id}.pkl"
+
+    def is_unchanged(self, source_id, fingerprint):
+        return (
+            fingerprint is not None
+            and self.fingerprints.get(source_id) == fingerprint
+            and self.output_path(source_id).is_file()
+        )
+
+    def load(self, source_id) -> pd.DataFrame:
+        return pd.read_pickle(self.output_path(source_id))
+
+
+def store_output(config, source_id, dataframe):
+    """
+    Store the normalized output of the source, so a later incremental run can reuse it
+    """
+    dataframe.to_pickle(config.data_sources_normalized / f"{source_id}.pkl")
+
+
+def store_fingerprints(config, fingerprints):
+    with open(config.data_sources_normalized / FINGERPRINTS_FILE, "w") as file:
+        json.dump(fingerprints, file, indent=2, sort_keys=True)
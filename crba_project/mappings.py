@@ -0,0 +1,101 @@
+"""
+The mapping scripts of the input dir: column_mapping.py, value_mapping.py and value_mapping_sdmx_encoding.py.
+
+The scripts are imported as modules, so Python caches their bytecode in the __pycache__ folder of the input dir.
+The names they define are frozen (dict -> FrozenDict, list -> tuple, set -> frozenset). The lookups derived
+from them are built once per Config and are shared read only by all sources, also by the workers of a process pool.
+"""
+import hashlib
+import importlib.util
+import logging
+import types
+from pathlib import Path
+
+from crba_project.cleanse import Cleanser
+
+log = logging.getLogger(__name__)
+
+MAPPING_SCRIPTS = ["column_mapping.py", "value_mapping.py", "value_mapping_sdmx_encoding.py"]
+
+
+class FrozenDict(dict):
+    """
+    Read only dict. A dict subclass, so it can be passed wherever pandas expects a dict (rename, map)
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # Pickle would restore the items with __setitem__
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value):
+    """
+    Read only copy of nested dicts, lists and sets
+    """
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+def import_mapping_script(path) -> types.ModuleType:
+    """
+    Import a mapping script as module. Not registered in sys.modules, every input dir gets its own module
+    """
+    path = Path(path).resolve()
+    module_name = f"_crba_mapping_{path.stem}_{hashlib.sha1(str(path).encode()).hexdigest()[:8]}"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None:
+        raise ImportError(f"Can't import the mapping script {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Mappings:
+    """
+    The names defined by the mapping scripts plus the lookups derived from them:
+
+    * column_lookup: Raw column name -> SDMX column (mapping_dict)
+    * sdmx_columns: Set of all columns of the final SDMX dataframe (sdmx_df_columns_all)
+    * value_lookup: value_mapper compiled with Cleanser.compile_value_mapping
+    """
+
+    def __init__(self, names):
+        """
+        :param names: Name -> value of the mapping scripts
+        """
+        self.names = freeze(names)
+        self.column_lookup = self.names.get("mapping_dict", FrozenDict())
+        self.sdmx_columns = frozenset(self.names.get("sdmx_df_columns_all", ()))
+        self.value_lookup = freeze(Cleanser.compile_value_mapping(self.names.get("value_mapper", {})))
+
+    @classmethod
+    def load(cls, input_dir, scripts=MAPPING_SCRIPTS):
+        """
+        Import the mapping scripts of the input dir. A later script overrides the names of the former ones
+        """
+        names = {}
+        for script in scripts:
+            module = import_mapping_script(Path(input_dir) / script)
+            names.update(
+                (name, value) for name, value in vars(module).items()
+                if not name.startswith("_") and not isinstance(value, types.ModuleType)
+            )
+            log.debug(f"Imported mapping script {script}")
+        return cls(names)
+
+    def __getitem__(self, name):
+        return self.names[name]
+
+    def __contains__(self, name):
+        return name in self.names
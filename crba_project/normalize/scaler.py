@@ -1,6 +1,169 @@
+import logging
+
 import pandas as pd
 import numpy as np
 
+log = logging.getLogger(__name__)
+
+CONTINUOUS_VARIABLE = "Continuous variable"
+# Observations older than this year are not normalized
+MIN_TIME_PERIOD = 2010
+
+
+def subgroup_mask(data, sql_subset_query_string):
+    """
+    Boolean array of the rows of the dimension-subgroup, see normalizer. All rows without query string
+    """
+    if not sql_subset_query_string:
+        return np.ones(len(data), dtype=bool)
+    return np.asarray(data.eval(sql_subset_query_string), dtype=bool)
+
+
+def _fsm_double_rows(groups, countries, raw, country_iso_3_col):
+    """
+    Rows to drop from the groups which contain two values for Federated States of Micronesia (ISO3 code 'FSM').
+    In some sources, e.g. S-161 and S-186 country_iso_3 "FSM" has two data points.
+    Simply take one of the values so as to not break the pipeline. Only applies to groups where FSM is the
+    only duplicate country (on average one value per other country) or all 194 other countries are present
+    """
+    if not (countries == "FSM").any():
+        return np.zeros(len(groups), dtype=bool)
+    members = pd.DataFrame({"group": groups, country_iso_3_col: countries, "raw": raw})[groups >= 0]
+    is_fsm = (members[country_iso_3_col] == "FSM").to_numpy()
+    fsm_double_len = members[is_fsm].groupby("group").size()
+    if not (fsm_double_len == 2).any():
+        return np.zeros(len(groups), dtype=bool)
+
+    not_fsm = members[~is_fsm]
+    # Rows with a value and countries, excluding FSM
+    values_not_fsm = not_fsm.groupby("group")["raw"].count()
+    countries_per_group = not_fsm.groupby("group")[country_iso_3_col].nunique()
+    countries_not_fsm = not_fsm.groupby("group").size()
+    # Average number of values per country without FSM --> Should be 1
+    average_country_number = values_not_fsm / countries_per_group.replace(0, np.nan)
+    fsm_double = fsm_double_len[
+        (fsm_double_len == 2)
+        & (
+            average_country_number.reindex(fsm_double_len.index).eq(1)
+            | countries_not_fsm.reindex(fsm_double_len.index).eq(194)
+        )
+    ].index
+    if len(fsm_double):
+        log.info(
+            f"{len(fsm_double)} subgroups contain two values for Federated States of Micronesia (ISO3 code 'FSM'). Taking the first value for FSM"
+        )
+    in_fsm_double = members["group"].isin(fsm_double)
+    drop = np.zeros(len(groups), dtype=bool)
+    drop[members.index[in_fsm_double & members[["group", country_iso_3_col]].duplicated()]] = True
+    return drop
+
+
+def normalize_groups(
+    data,
+    groups,
+    variable_types,
+    inversions,
+    whisker_factor=1.5,
+    raw_data_col="RAW_OBS_VALUE",
+    maximum_score=10,
+    log_info=False,
+    country_iso_3_col="COUNTRY_ISO_3",
+    time_col="TIME_PERIOD",
+):
+    """
+    Normalize the raw values of any number of dimension-subgroups at once.
+
+    The bounds of the continuous groups (min, max, 1st and 3rd quartile) are computed in one groupby pass,
+    the categories of the categorical groups with one groupby rank. See normalizer for the rules.
+
+    Parameters:
+    data (obj): DataFrame with the raw values. The raw data col must be numeric
+    groups (np.ndarray): Group code per row, -1 for rows which are not normalized
+    variable_types (list): Variable type per group code, "Continuous variable" or any other string if categorical
+    inversions (list): "inverted" or "not inverted" per group code. Only used by continuous groups
+    whisker_factor (num): Value to take as whisker factor to define outliers in a distribution
+    raw_data_col (str): column name containing raw data
+    maximum_score (num): Maximum score of the normalized data, typically 10
+    log_info (bool): Print the bounds of the continuous groups
+
+    Return:
+    Tuple of the normalized values (np.ndarray, NaN for rows without group) and a dict
+    group code -> exception of the groups which can't be normalized. Their rows are NaN
+    """
+    groups = np.asarray(groups, dtype=np.int64).copy()
+    raw = data[raw_data_col].to_numpy(dtype="float64", na_value=np.nan)
+    countries = data[country_iso_3_col].to_numpy()
+
+    groups[_fsm_double_rows(groups, countries, raw, country_iso_3_col)] = -1
+    # Exclude observations older than 10 years
+    groups[~(data[time_col].to_numpy(dtype="float64", na_value=np.nan) >= MIN_TIME_PERIOD)] = -1
+
+    members = pd.DataFrame({"group": groups, country_iso_3_col: countries, "raw": raw})[groups >= 0]
+    errors = {}
+
+    # A row in the subgroup must be uniquely defined by the dimensions and country
+    for group in members.loc[members[["group", country_iso_3_col]].duplicated(), "group"].unique():
+        errors[group] = AssertionError("There are duplicated countries in the defined dimension-subgroup dataframe.")
+
+    is_continuous = np.array([variable_type == CONTINUOUS_VARIABLE for variable_type in variable_types], dtype=bool)
+    is_inverted = np.array([inversion == "inverted" for inversion in inversions], dtype=bool)
+    for group in np.flatnonzero(is_continuous & ~is_inverted):
+        if inversions[group] != "not inverted" and group not in errors:
+            errors[group] = ValueError("This is a numeric indicator, so you must specify whether or not it is inverted")
+
+    scaled = np.full(len(data), np.nan)
+    member_groups = members["group"].to_numpy()
+    member_raw = members["raw"].to_numpy()
+
+    # Continuous variables
+    continuous = members[is_continuous[member_groups]]
+    if len(continuous):
+        # Determine basic descriptive statistics of the distribution that are required for the normalization
+        by_group = continuous.groupby("group")["raw"]
+        stats = by_group.agg(["min", "max"]).join(by_group.quantile([0.25, 0.75]).unstack().set_axis(["q1", "q3"], axis=1))
+        stats["iqr"] = stats["q3"] - stats["q1"]
+        # Values outside of the whiskers are outliers. They get the minimum or maximum score
+        upper_whisker = stats["q3"] + whisker_factor * stats["iqr"]
+        lower_whisker = stats["q1"] - whisker_factor * stats["iqr"]
+        stats["max_to_use"] = np.where(stats["max"] > upper_whisker, upper_whisker, stats["max"])
+        stats["min_to_use"] = np.where(stats["min"] < lower_whisker, lower_whisker, stats["min"])
+        stats["tot_range"] = stats["max_to_use"] - stats["min_to_use"]
+        # Some distributions are so heavily right skewed (e.g. S-188), that tot_range is 0 (because max_to_use is q3 * iqr, but q3 is zero)
+        # To avoid division by zero (i.e. when tot_range = 0), put in a infitisemal small value
+        zero_range = stats["tot_range"] == 0
+        if zero_range.any():
+            log.info(f"The total range of {int(zero_range.sum())} subgroups was 0, probably the distribution is too heavily skewed to the right. Setting it to 0.001")
+            stats.loc[zero_range, "tot_range"] = 0.001
+        if log_info:
+            print(" \n These are the values taken for the normalization: \n \n ")
+            print(stats)
+
+        codes = continuous["group"].to_numpy()
+        bounds = stats.reindex(codes)
+        score = maximum_score * (continuous["raw"].to_numpy() - bounds["min_to_use"].to_numpy()) / bounds["tot_range"].to_numpy()
+        score = np.where(is_inverted[codes], maximum_score - score, score)
+        # If outliers are present and max_to_use != max_value OR min_to_use != min_value
+        # Scores may be out of range [0; maximum_score], so must round them down
+        scaled[continuous.index] = np.clip(np.round(score, 2), 0, maximum_score)
+
+    # Categorical variables: Scores are calculated based of encoded raw data. The value 0 is "No Data".
+    # The other categories get the scores 0 to maximum_score in equal steps, in the order of their values
+    categorical = members[~is_continuous[member_groups] & (member_raw != 0) & ~np.isnan(member_raw)]
+    if len(categorical):
+        codes = categorical["group"].to_numpy()
+        by_group = categorical.groupby("group")["raw"]
+        category_count = by_group.nunique()
+        for group in category_count.index[category_count < 2]:
+            errors.setdefault(group, ZeroDivisionError("A categorical variable needs at least two categories besides 0"))
+        # Define the normalization type, e.g. 0-5-10, or 0 - 3.3 - 6.6 - 10
+        distance = maximum_score / (category_count.reindex(codes).to_numpy() - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled[categorical.index] = np.round(distance * (by_group.rank(method="dense").to_numpy() - 1), 2)
+
+    if errors:
+        scaled[np.isin(groups, list(errors))] = np.nan
+    return scaled, errors
+
 
 def normalizer(
     cleansed_data,
@@ -35,6 +198,9 @@ def normalizer(
     assign the corresponding scores. The value "0" (both as string or number) will always be
     encoded into "No Data".
 
+    Rows outside of the dimension-subgroup, older than 2010 or without raw value get no score.
+    The scores are assigned to the rows by their position, see normalize_groups.
+
     Parameters:
     cleansed_data (obj): Cleansed dataFrame, should be the return of Cleanser class and methods.
     sql_subset_query_string (str): String specifying for which dimension-subgroup the normalization should
@@ -51,239 +217,98 @@ def normalizer(
     Return:
     DataFrame with a new column called scaled_data_col_name containing the normalized (scaled) data
     """
-    #print("\n Calling function 'scaler'... \n")
     # Convert raw_ovs_value to numeric
+    cleansed_data = cleansed_data.reset_index(drop=True)
     cleansed_data[raw_data_col] = pd.to_numeric(cleansed_data[raw_data_col])
 
     # Create the relevant dimension-subgroup (mostly for continuous variables. However, even though unusual, some vategorical variables also habe dimension values)
-    if sql_subset_query_string:
-        cleansed_data_subset = cleansed_data.query(sql_subset_query_string)
-    else:
-        cleansed_data_subset = cleansed_data
-
-    # In some sources, e.g. S-161 and S-186 country_iso_3 "FSM" has two data points
-    # Simply take one of the values so as to not break the pipeline
-    # Calculate number of country_iso_3 codes without 'FSM', to avoid applying the below code of
-    # Dropping duplicats in cases whre there is actual duplicates, and not only FSM
-    # For readability: Create variables with conditions
-    temp_grouped_series = (
-        cleansed_data_subset.loc[
-            cleansed_data_subset[country_iso_3_col] != "FSM",
-            [country_iso_3_col, raw_data_col],
-        ]
-        .groupby(country_iso_3_col, as_index=True)
-        .count()[raw_data_col]
+    groups = np.where(subgroup_mask(cleansed_data, sql_subset_query_string), 0, -1)
+    scaled, errors = normalize_groups(
+        cleansed_data,
+        groups,
+        [variable_type],
+        [is_inverted],
+        whisker_factor=whisker_factor,
+        raw_data_col=raw_data_col,
+        maximum_score=maximum_score,
+        log_info=log_info,
+        country_iso_3_col=country_iso_3_col,
+        time_col=time_col,
     )
+    if errors:
+        raise errors[0]
+    cleansed_data[scaled_data_col_name] = scaled
 
-    # FSM double
-    fsm_double_len = len(
-        cleansed_data_subset.loc[
-            cleansed_data_subset[country_iso_3_col] == "FSM", country_iso_3_col
-        ]
-    )
-
-    # countries excluding FSM
-    countries_not_fsm = len(
-        cleansed_data_subset.loc[
-            cleansed_data_subset[country_iso_3_col] != "FSM", country_iso_3_col
-        ]
-    )
-
-    # Calucate average number of countries in subgroup without FSM --> Should be 1
-    average_country_number = sum(temp_grouped_series) / len(temp_grouped_series)
-
-    if ((fsm_double_len == 2) & (average_country_number == 1)) | (
-        (fsm_double_len == 2) & (countries_not_fsm == 194)
-    ):
-        print(
-            "Dataset contains two values for Federated States of Micronesia (ISO3 code 'FSM'). Now taking the first value for FSM to proceed with normalizer."
-        )
-
-        # Drop duplicate
-        cleansed_data_subset = cleansed_data_subset.drop_duplicates(
-            subset=country_iso_3_col
-        )
-    # End of section to check if its a double-FSM (and only FSM-double)dataset
-
-    # Exclude observations older than 10 years
-    cleansed_data_subset = cleansed_data_subset[cleansed_data_subset[time_col] >= 2010]
-
-    # Check that there aren't duplicates, which would imply that the dimension-subgroups have not been properly defined and a row in the subset is not unqiuely defined by the dimensions and country
-    # If to establish Breakpoint 
-    
-    assert (
-        sum(cleansed_data_subset[country_iso_3_col].duplicated()) == 0
-    ), f"There are duplicated countries in the defined dimension-subgroup dataframe."
-
-    if variable_type != "Continuous variable":
-        # Build conditions array
-        unique_values = cleansed_data_subset[raw_data_col].unique()
-
-        conditions = []
-        for value in sorted(unique_values):
-            conditions += [cleansed_data_subset[raw_data_col] == value]
-
-        # Assign variable for readability purpose
-        length_unique_values = len(cleansed_data_subset[raw_data_col].unique())
-
-        # Build norm values array, where 0 =< norm_values => 10
-        norm_values = []
-        divisor = 1
+    cleansed_data.loc[_no_data(cleansed_data[raw_data_col], variable_type != CONTINUOUS_VARIABLE), "OBS_STATUS"] = "O"
+    return cleansed_data
 
-        # In the encoding, the value 0 means "No Data/ no reponse/ not answered/ ..."
-        if (0 in list(unique_values)) | ("0" in list(unique_values)):
-            norm_values += [
-                np.nan
-            ]  # This is into what "0" is encoded into OBS_SCALED_VALUE
-            length_unique_values -= 1
 
-        # Define the normalization type, e.g. 0-5-10, or 0 - 3.3 - 6.6 - 10
-        distance = maximum_score / (length_unique_values - divisor)
+def _no_data(raw, is_categorical):
+    """
+    Rows without raw value and, for categorical variables, with the value 0. Their OBS_STATUS is O
+    """
+    return (raw.isna() | (is_categorical & (raw == 0))).to_numpy()
 
-        for value in range(length_unique_values):
-            norm_values += [round(distance * float(value), 2)]
 
-        # store normalized scores in SCALED_OBS_VALUE
-        cleansed_data_subset[scaled_data_col_name] = np.select(conditions, norm_values)
+def normalize_sources(
+    data,
+    source_config,
+    whisker_factor=1.5,
+    raw_data_col="RAW_OBS_VALUE",
+    scaled_data_col_name="SCALED_OBS_VALUE",
+    maximum_score=10,
+    country_iso_3_col="COUNTRY_ISO_3",
+    time_col="TIME_PERIOD",
+):
+    """
+    Normalize all sources of a combined dataset in one call, e.g. with another whisker factor or maximum score.
 
-        # join normalized data to original dataframe
-        cleansed_data = cleansed_data.merge(right=cleansed_data_subset, how="outer")
+    Every source is normalized with the dimension-subgroup, variable type and inversion of its row in the source config.
+    Sources which are not in the source config or can't be normalized keep their former scores (NaN without former scores).
 
-        # For categorical variables, the value 0 also means No data, so update OBS_STATUS
-        cleansed_data.loc[
-            (cleansed_data[raw_data_col] == "0") | (cleansed_data[raw_data_col] == 0),
-            "OBS_STATUS",
-        ] = "O"
+    Parameters:
+    data (obj): Combined dataframe with the columns SOURCE_ID and raw_data_col
+    source_config (obj): Source config with the columns SOURCE_ID, DIMENSION_VALUES_NORMALIZATION, VALUE_LABELS and INVERT_NORMALIZATION
 
-    elif variable_type == "Continuous variable":
-        # Determine basic descriptive statistics of the distribution that are required for the normalization
-        min_val = np.nanmin(cleansed_data_subset[raw_data_col].astype("float"))
-        max_val = np.nanmax(cleansed_data_subset[raw_data_col].astype("float"))
-        q1 = cleansed_data_subset[raw_data_col].astype("float").quantile(q=0.25)
-        q3 = cleansed_data_subset[raw_data_col].astype("float").quantile(q=0.75)
-        iqr = q3 - q1
-
-        # Define what max value to use for the normalization
-        if max_val > q3 + whisker_factor * iqr:
-            max_to_use = q3 + whisker_factor * iqr
-            if log_info == True:
-                print(
-                    "The distribution of the raw data values this subgroup contains outliers or is too skewed on the upper end. The maximum value to be used for the normalisation is: 3rd quartile or distribution + {} * IQR. It is: {} \n See histogram printed below for info. \n".format(
-                        whisker_factor, max_to_use
-                    )
-                )
-        else:
-            max_to_use = max_val
-            if log_info == True:
-                print(
-                    "The distribution of the raw data for this subgroup does not contain outliers on the upper end. It is also not too skewed on the upper end. The maximum value used for the normalisation is the maximum value in the dataset, which is {}. This value corresponds to country: {} \n".format(
-                        max_to_use,
-                        cleansed_data_subset[
-                            cleansed_data_subset[raw_data_col].astype("float")
-                            == max_val
-                        ],
-                    )
-                )
-
-        # Define what min value to use for the normalization
-        if min_val < q1 - whisker_factor * iqr:
-            min_to_use = q1 - whisker_factor * iqr
-            if log_info == True:
-                print(
-                    "The distribution of the raw data values for this subgroup contains outliers or is too skewed on the lower end. The minimum value to be used for the normalisation is 1st quartile or distribution - {} * IQR. It is: {} \n See histogram printed below for info. \n".format(
-                        whisker_factor, min_to_use
-                    )
-                )
-        else:
-            min_to_use = min_val
-            if log_info == True:
-                print(
-                    "The distribution of the raw data for this subgroup does not contain outliers or is too skewed on the lower end. The minimum value used for the normalisation is the minimum value in the dataset, which is {}. This value corresponds to country: {} \n".format(
-                        min_to_use,
-                        cleansed_data_subset[
-                            cleansed_data_subset[raw_data_col].astype("float")
-                            == min_val
-                        ],
-                    )
-                )
-
-        # If there are outliers or a skewed distribution, print the distribution for the user.
-        if log_info == True:
-            if (min_val < q1 - whisker_factor * iqr) or (
-                max_val > q3 + whisker_factor * iqr
-            ):
-                print("\n This is the distribution of the raw data of the indicator.")
-                print(pd.to_numeric(cleansed_data_subset[raw_data_col]).hist(bins=30))
-
-        # Define the value range that is used for the scaling (normalization)
-        tot_range = max_to_use - min_to_use
+    Return:
+    DataFrame with the normalized data in scaled_data_col_name
+    """
+    data = data.reset_index(drop=True)
+    data[raw_data_col] = pd.to_numeric(data[raw_data_col], errors="coerce")
+    source_config = source_config.drop_duplicates(subset="SOURCE_ID").set_index("SOURCE_ID")
+
+    groups = np.full(len(data), -1, dtype=np.int64)
+    sources = []
+    for source_id, rows in data.groupby("SOURCE_ID", sort=False).indices.items():
+        if source_id not in source_config.index:
+            log.warning(f"Source {source_id} not in the source config, its scores are kept")
+            continue
+        try:
+            mask = subgroup_mask(data.iloc[rows], source_config.at[source_id, "DIMENSION_VALUES_NORMALIZATION"])
+        except Exception as ex:
+            log.warning(f"Source {source_id} not normalized, its scores are kept: {ex!r}")
+            continue
+        groups[rows[mask]] = len(sources)
+        sources.append(source_id)
+
+    scaled, errors = normalize_groups(
+        data,
+        groups,
+        source_config.loc[sources, "VALUE_LABELS"].tolist(),
+        source_config.loc[sources, "INVERT_NORMALIZATION"].tolist(),
+        whisker_factor=whisker_factor,
+        raw_data_col=raw_data_col,
+        maximum_score=maximum_score,
+        country_iso_3_col=country_iso_3_col,
+        time_col=time_col,
+    )
+    for group, ex in errors.items():
+        log.warning(f"Source {sources[group]} not normalized, its scores are kept: {ex!r}")
 
-        # Some distributions are so heavily right skewed (e.g. S-188), that tot_range is 0 (because max_to_use is q3 * iqr, but q3 is zero)
-        # To avoid division by zero (i.e. when tot_range = 0), put in a infitisemal small value
-        if tot_range == 0:
-            tot_range = 0.001
-            print(
-                "The total range was 0. This is probably because the distribution is too heavily skewed to the right. Now setting tot_range to 0.01 to allow for the algorithm to work."
-            )
-
-        # Log info
-        if log_info == True:
-            print(" \n These are the values taken for the normalization: \n \n ")
-            print(f"Max Score: {maximum_score}")
-            print(f"Min to use: {min_to_use}")
-            print(f"tot range: {tot_range}")
-            print("Trying out apply function")
-            print(f"max value: {max_val}")
-            print(f"min value: {min_val}")
-            print(f"max to use: {max_to_use}")
-            print(f"q1: {q1}")
-            print(f"q3: {q3}")
-            print(f"iqr: {iqr}")
-
-        # Compute the normalized value of the raw data
-        # Distinguish between indicators, whose value must be inverted
-        if is_inverted == "inverted":
-            # # # Create SCALED_OBS_VALUE
-            cleansed_data_subset[scaled_data_col_name] = round(
-                maximum_score
-                - maximum_score
-                * (cleansed_data_subset[raw_data_col].astype("float") - min_to_use)
-                / tot_range,
-                2,
-            )
-        elif is_inverted == "not inverted":
-            # # # Create SCALED_OBS_VALUE
-            cleansed_data_subset[scaled_data_col_name] = round(
-                maximum_score
-                * (cleansed_data_subset[raw_data_col].astype("float") - min_to_use)
-                / tot_range,
-                2,
-            )
-        else:
-            raise ValueError(
-                "This is a numeric indicator, so you must specify whether or not it is inverted"
-            )
+    normalized = data["SOURCE_ID"].isin([source for group, source in enumerate(sources) if group not in errors]).to_numpy()
+    former = data[scaled_data_col_name].to_numpy(dtype="float64", na_value=np.nan) if scaled_data_col_name in data.columns else np.nan
+    data[scaled_data_col_name] = np.where(normalized, scaled, former)
 
-        # If outliers are present and max_to_use != max_value OR min_to_use != min_value
-        # Scores may be out of range [0; 10], so must round them down
-        cleansed_data_subset.loc[
-            cleansed_data_subset[scaled_data_col_name] < 0, scaled_data_col_name
-        ] = 0
-        cleansed_data_subset.loc[
-            cleansed_data_subset[scaled_data_col_name] > 10, scaled_data_col_name
-        ] = 10
-
-        # join normalized data to original dataframe
-        cleansed_data = cleansed_data.merge(right=cleansed_data_subset, how="outer")
-
-    ######## AAdd OBS STATUS
-    cleansed_data.loc[
-        (cleansed_data["RAW_OBS_VALUE"].isna())
-        | (cleansed_data["RAW_OBS_VALUE"].isnull())
-        | (cleansed_data["RAW_OBS_VALUE"] == "NaN")
-        | (cleansed_data["RAW_OBS_VALUE"] == np.nan),
-        "OBS_STATUS",
-    ] = "O"
-
-    # Return result
-    return cleansed_data
\ No newline at end of file
+    categorical = data["SOURCE_ID"].map(source_config["VALUE_LABELS"]).ne(CONTINUOUS_VARIABLE).to_numpy()
+    data.loc[normalized & _no_data(data[raw_data_col], categorical), "OBS_STATUS"] = "O"
+    return data
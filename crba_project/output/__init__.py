@@ -0,0 +1,152 @@
+"""
+Writers of the datasets of a run.
+
+* csv: Semicolon separated CSV, the format of the former runs
+* parquet: Columnar Parquet file (snappy or zstd compressed). Needs pyarrow. Keeps the dtypes and is much faster to load
+
+All datasets are written with the same schema, derived from the SDMX columns of the column mapping (see apply_schema).
+read_output loads a dataset regardless of the format it was written in.
+"""
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+PARQUET_COMPRESSIONS = ["snappy", "zstd", "gzip", "none"]
+
+# Numeric columns added by the normalization which are not part of the SDMX columns
+VALUE_COLUMNS = ["OBS_VALUE", "SCALED_OBS_VALUE"]
+
+
+def _to_numeric(series: pd.Series) -> pd.Series:
+    try:
+        return pd.to_numeric(series).astype("float64")
+    except (ValueError, TypeError):
+        log.debug(f"Column {series.name} is not numeric, written as string")
+        return series.astype("string")
+
+
+def _string_categories(series: pd.Series) -> pd.Series:
+    """
+    The categorical with its categories as strings. Arrow can't store categories mixing numbers and strings
+    """
+    labels = series.cat.categories.astype(str)
+    categories = pd.Index(labels.unique())
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes < 0, -1, categories.get_indexer(labels)[codes])
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index, name=series.name)
+
+
+def apply_schema(dataframe: pd.DataFrame, sdmx_columns) -> pd.DataFrame:
+    """
+    Give the columns stable dtypes, independent of the data of the run.
+
+    * Time and value columns: float64
+    * Other SDMX columns (country, dimensions, attributes): string. Also when all values are NaN
+    * Categorical columns with object categories which are not all strings: Categories as strings
+    * Other categorical, numeric, bool and datetime columns keep their dtype
+    * All other object columns: string
+
+    Parameters:
+    dataframe (pd.DataFrame): Dataset to write
+    sdmx_columns (list): sdmx_df_columns_all of the column mapping
+
+    Return:
+    pd.DataFrame with the converted columns. The data of the input is not copied
+    """
+    numeric_columns = set(VALUE_COLUMNS) | {"TIME_PERIOD"}
+    # RAW_OBS_VALUE mixes numbers and text, so it is a string column as well
+    string_columns = set(sdmx_columns) - numeric_columns
+
+    converted = {}
+    for column in dataframe.columns:
+        series = dataframe[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # e.g. the object fallback of concat_sources
+            categories = series.cat.categories
+            if categories.dtype == object and pd.api.types.infer_dtype(categories, skipna=True) != "string":
+                converted[column] = _string_categories(series)
+            continue
+        if column in numeric_columns:
+            if not pd.api.types.is_float_dtype(series.dtype):
+                converted[column] = _to_numeric(series)
+        elif (column in string_columns or series.dtype == object) and series.dtype != "string":
+            converted[column] = series.astype("string")
+    if not converted:
+        return dataframe
+    return dataframe.assign(**converted)
+
+
+class CsvWriter:
+    suffix = ".csv"
+
+    def write(self, dataframe: pd.DataFrame, path, **to_csv_kwargs):
+        """
+        :param path: Path of the file without suffix
+        :param to_csv_kwargs: Passed to DataFrame.to_csv, e.g. quoting or index
+        """
+        path = Path(path).with_suffix(self.suffix)
+        dataframe.to_csv(path_or_buf=path, sep=";", **to_csv_kwargs)
+        return path
+
+
+class ParquetWriter:
+    suffix = ".parquet"
+
+    def __init__(self, sdmx_columns=(), compression="snappy"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as ex:
+            raise ImportError("The parquet output needs pyarrow. Install it with: pip install pyarrow") from ex
+        self.sdmx_columns = list(sdmx_columns)
+        self.compression = None if compression == "none" else compression
+
+    def write(self, dataframe: pd.DataFrame, path, index=True, **to_csv_kwargs):
+        """
+        :param path: Path of the file without suffix
+        :param index: If the index is written
+        :param to_csv_kwargs: Only used by the CsvWriter. Ignored
+        """
+        path = Path(path).with_suffix(self.suffix)
+        apply_schema(dataframe, self.sdmx_columns).to_parquet(
+            path, engine="pyarrow", compression=self.compression, index=index
+        )
+        return path
+
+
+def create_writer(output_format="csv", sdmx_columns=(), compression=None):
+    """
+    Create the writer of the datasets of a run
+
+    Parameters:
+    output_format (str): One of OUTPUT_FORMATS
+    sdmx_columns (list): sdmx_df_columns_all of the column mapping. Defines the schema of the parquet files
+    compression (str): One of PARQUET_COMPRESSIONS. Default snappy. Only used by parquet
+
+    Return:
+    CsvWriter or ParquetWriter
+    """
+    if output_format == "csv":
+        return CsvWriter()
+    if output_format == "parquet":
+        return ParquetWriter(sdmx_columns, compression=compression or "snappy")
+    raise ValueError(f"Unknown output format:{output_format}. Choose one of {OUTPUT_FORMATS}")
+
+
+def read_output(path, **read_csv_kwargs) -> pd.DataFrame:
+    """
+    Load a dataset of a run, e.g. in the notebooks.
+
+    :param path: Path with or without suffix. Without suffix the parquet file is preferred
+    """
+    path = Path(path)
+    if path.suffix not in (CsvWriter.suffix, ParquetWriter.suffix):
+        parquet_path = path.with_suffix(ParquetWriter.suffix)
+        path = parquet_path if parquet_path.exists() else path.with_suffix(CsvWriter.suffix)
+    if path.suffix == ParquetWriter.suffix:
+        return pd.read_parquet(path)
+    return pd.read_csv(path, sep=";", **read_csv_kwargs)
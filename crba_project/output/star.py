@@ -0,0 +1,189 @@
+"""
+Star schema layout of crba_final.
+
+crba_final repeats the attributes of the indicator and source (description, explanation, methodology, API link, title)
+and the aggregated scores in every row. The star layout writes them once, in dimension tables with integer keys:
+
+* facts: One row per observation. Keys of the dimensions plus the columns of the observation
+  (dimensions, TIME_PERIOD, RAW_OBS_VALUE, SCALED_OBS_VALUE, OBS_STATUS, ...)
+* countries: COUNTRY_KEY, COUNTRY_ISO_3. Plus the names and ISO2 codes of the CRBA country list
+* indicators: INDICATOR_KEY, code, name, index, issue, category and the indicator attributes
+* sources: SOURCE_KEY, SOURCE_ID and the source attributes. Plus some columns of the source config
+* scores: SCORE_KEY, the category, issue, index and overall scores and risk categories
+
+The tables are written to a folder with layout.json, which records the columns of each table and the column order
+of crba_final. read_wide rebuilds crba_final from the folder.
+"""
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from crba_project.output import read_output
+
+log = logging.getLogger(__name__)
+
+OUTPUT_LAYOUTS = ["wide", "star", "both"]
+LAYOUT_FILE = "layout.json"
+FACT_TABLE = "facts"
+
+SCORE_GROUP_COLUMNS = ["COUNTRY_ISO_3", "INDICATOR_INDEX", "INDICATOR_ISSUE", "INDICATOR_CATEGORY"]
+# Table name -> key column, columns moved from the facts to the table
+DIMENSIONS = {
+    "countries": ("COUNTRY_KEY", ["COUNTRY_ISO_3"]),
+    "indicators": (
+        "INDICATOR_KEY",
+        [
+            "INDICATOR_CODE",
+            "INDICATOR_NAME",
+            "INDICATOR_INDEX",
+            "INDICATOR_ISSUE",
+            "INDICATOR_CATEGORY",
+            "ATTR_INDICATOR_DESCRIPTION",
+            "ATTR_INDICATOR_EXPLANATION",
+            "ATTR_UNIT_MEASURE",
+        ],
+    ),
+    "sources": (
+        "SOURCE_KEY",
+        [
+            "SOURCE_ID",
+            "ATTR_SOURCE",
+            "ATTR_SOURCE_BODY",
+            "ATTR_SOURCE_TITLE",
+            "ATTR_API_ENDPOINT_URL",
+            "ATTR_DATA_EXTRACTION_METHDOLOGY",
+            "CRBA_RELEASE_YEAR",
+        ],
+    ),
+    "scores": (
+        "SCORE_KEY",
+        [
+            "CATEGORY_ISSUE_SCORE",
+            "ISSUE_INDEX_SCORE",
+            "ISSUE_INDEX_RISK_CATEGORY",
+            "INDEX_SCORE",
+            "INDEX_RISK_CATEGORY",
+            "OVERALL_SCORE",
+        ],
+    ),
+}
+# Descriptive columns of the dimension tables, which are not part of crba_final
+COUNTRY_LIST_COLUMNS = ["COUNTRY_NAME", "COUNTRY_ISO_2"]
+SOURCE_CONFIG_COLUMNS = ["SOURCE_TYPE", "INDICATOR_ID", "VALUE_LABELS", "INVERT_NORMALIZATION"]
+
+
+def _dimension(crba_final, key, columns, identity_columns=()):
+    """
+    Integer key per row and the table of the distinct values of the columns
+
+    :param identity_columns: Further columns which tell the rows of the dimension apart, but are not moved
+    """
+    group_columns = list(identity_columns) + columns
+    # Combine the codes of the columns one by one. Missing values are a value of their own
+    keys = np.zeros(len(crba_final), dtype=np.int64)
+    for column in group_columns:
+        codes, uniques = pd.factorize(crba_final[column], use_na_sentinel=False)
+        keys, _ = pd.factorize(keys * len(uniques) + codes)
+    first = ~pd.Series(keys).duplicated().to_numpy()
+    table = crba_final.loc[first, group_columns].reset_index(drop=True)
+    table.insert(0, key, keys[first])
+    return keys, table.sort_values(key, ignore_index=True)
+
+
+def build_star(crba_final: pd.DataFrame, source_config=None, country_list=None):
+    """
+    Split crba_final into the fact and dimension tables
+
+    Parameters:
+    crba_final (pd.DataFrame): crba_final of the run, see aggregate_scores
+    source_config (pd.DataFrame): Optional. SOURCE_CONFIG_COLUMNS get added to the sources table
+    country_list (pd.DataFrame): Optional, e.g. the CRBA country list. COUNTRY_LIST_COLUMNS get added to the countries table
+
+    Return:
+    Tuple of the tables (name -> pd.DataFrame) and the layout (see LAYOUT_FILE)
+    """
+    tables = {}
+    layout = {"columns": list(crba_final.columns), "tables": {}}
+    moved = []
+    key_columns = {}
+    for name, (key, columns) in DIMENSIONS.items():
+        columns = [column for column in columns if column in crba_final.columns]
+        if not columns:
+            continue
+        # The scores belong to the group of the country, index, issue and category
+        identity_columns = [column for column in SCORE_GROUP_COLUMNS if column in crba_final.columns] if name == "scores" else []
+        key_columns[key], tables[name] = _dimension(crba_final, key, columns, identity_columns)
+        layout["tables"][name] = {"key": key, "columns": columns}
+        moved += columns
+
+    if "countries" in tables and country_list is not None:
+        tables["countries"] = tables["countries"].merge(
+            country_list[["COUNTRY_ISO_3"] + [column for column in COUNTRY_LIST_COLUMNS if column in country_list.columns]]
+            .drop_duplicates(subset="COUNTRY_ISO_3"),
+            on="COUNTRY_ISO_3",
+            how="left",
+        )
+    if "sources" in tables and source_config is not None and "SOURCE_ID" in tables["sources"].columns:
+        tables["sources"] = tables["sources"].merge(
+            source_config[["SOURCE_ID"] + [column for column in SOURCE_CONFIG_COLUMNS if column in source_config.columns]]
+            .drop_duplicates(subset="SOURCE_ID"),
+            on="SOURCE_ID",
+            how="left",
+        )
+
+    fact_columns = [column for column in crba_final.columns if column not in moved]
+    facts = pd.concat([pd.DataFrame(key_columns), crba_final[fact_columns].reset_index(drop=True)], axis=1)
+    tables = {FACT_TABLE: facts, **tables}
+    layout["tables"][FACT_TABLE] = {"columns": list(facts.columns)}
+    return tables, layout
+
+
+def wide_view(tables, layout):
+    """
+    Rebuild crba_final from the tables of build_star or read_star
+    """
+    facts = tables[FACT_TABLE]
+    columns = {column: facts[column] for column in facts.columns}
+    for name, table_layout in layout["tables"].items():
+        if name == FACT_TABLE:
+            continue
+        key = table_layout["key"]
+        # Align the rows of the dimension with the keys of the facts
+        dimension = tables[name].set_index(key)[table_layout["columns"]].reindex(facts[key].to_numpy())
+        for column in table_layout["columns"]:
+            columns[column] = dimension[column].set_axis(facts.index)
+    return pd.DataFrame({column: columns[column] for column in layout["columns"]})
+
+
+def write_star(writer, tables, layout, directory):
+    """
+    Write the tables with the writer of the run (csv or parquet) and the layout to the directory
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        writer.write(table, directory / name, index=False)
+    with open(directory / LAYOUT_FILE, "w") as file:
+        json.dump(layout, file, indent=2)
+    log.info(f"Star layout of crba_final written to {directory}: {', '.join(f'{name} {table.shape}' for name, table in tables.items())}")
+    return directory
+
+
+def read_star(directory):
+    """
+    Load the tables and the layout written by write_star, e.g. in the notebooks
+    """
+    directory = Path(directory)
+    with open(directory / LAYOUT_FILE) as file:
+        layout = json.load(file)
+    return {name: read_output(directory / name) for name in layout["tables"]}, layout
+
+
+def read_wide(directory):
+    """
+    crba_final rebuilt from the star layout
+    """
+    return wide_view(*read_star(directory))
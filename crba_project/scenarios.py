@@ -0,0 +1,241 @@
+"""
+Scenario batch mode: Evaluate many aggregation variants over the data of one run.
+
+The combined_normalized dataset of a former run is loaded once. Every scenario changes some of
+
+* the aggregation schema: category_weights, issue_weights, index_weights, mean, risk_quantiles
+  (see crba_project.aggregate.schema). Keys which are not set are taken from the schema of the Input_Lists sheet
+* excluded_sources: Source ids whose indicators are left out
+* whisker_factor and maximum_score: The indicators get normalized again from RAW_OBS_VALUE with these settings.
+  The normalization parameters of the sources are taken from the source_config.csv of the run
+
+The scenarios are evaluated in parallel in a process pool and compared to the baseline (the scores of the run
+with the schema of the Input_Lists sheet). Usage:
+
+    python -m crba_project scenarios scenarios.json --run latest
+
+with a JSON list of scenarios, e.g.
+
+    [
+        {"name": "whisker_3", "whisker_factor": 3},
+        {"name": "geometric", "mean": "geometric"},
+        {"name": "without_S-1", "excluded_sources": ["S-1"]}
+    ]
+"""
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from crba_project.aggregate import ScoreAggregator
+from crba_project.aggregate.schema import AggregationSchema
+from crba_project.normalize import scaler
+from crba_project.output import read_output
+
+log = logging.getLogger(__name__)
+
+BASELINE = "baseline"
+# Settings of the normalization in the extractors
+WHISKER_FACTOR = 1.5
+MAXIMUM_SCORE = 10
+SCHEMA_KEYS = ["category_weights", "issue_weights", "index_weights", "mean", "risk_quantiles"]
+SCENARIO_KEYS = ["name", "excluded_sources", "whisker_factor", "maximum_score"] + SCHEMA_KEYS
+
+
+class Scenario:
+    def __init__(self, name, schema: AggregationSchema, excluded_sources=(), whisker_factor=WHISKER_FACTOR, maximum_score=MAXIMUM_SCORE):
+        self.name = name
+        self.schema = schema
+        self.excluded_sources = frozenset(excluded_sources)
+        self.whisker_factor = whisker_factor
+        self.maximum_score = maximum_score
+
+    @property
+    def renormalize(self):
+        return self.whisker_factor != WHISKER_FACTOR or self.maximum_score != MAXIMUM_SCORE
+
+    @classmethod
+    def from_dict(cls, spec, base_schema=None):
+        """
+        :param spec: Keys of SCENARIO_KEYS
+        :param base_schema: AggregationSchema the keys of the schema which are not set are taken from
+        """
+        unknown = set(spec) - set(SCENARIO_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown keys of scenario {spec.get('name')}: {sorted(unknown)}. Choose of {SCENARIO_KEYS}")
+        if "name" not in spec:
+            raise ValueError(f"Scenario without name: {spec}")
+        schema = AggregationSchema.from_dict(
+            {key: value for key, value in spec.items() if key in SCHEMA_KEYS},
+            base=base_schema,
+        )
+        schema.name = spec["name"]
+        return cls(
+            spec["name"],
+            schema,
+            excluded_sources=spec.get("excluded_sources", ()),
+            whisker_factor=float(spec.get("whisker_factor", WHISKER_FACTOR)),
+            maximum_score=float(spec.get("maximum_score", MAXIMUM_SCORE)),
+        )
+
+    def to_dict(self):
+        return {
+            **self.schema.to_dict(),
+            # Not the name of the schema: the baseline uses the schema of the config
+            "name": self.name,
+            "excluded_sources": sorted(self.excluded_sources),
+            "whisker_factor": self.whisker_factor,
+            "maximum_score": self.maximum_score,
+        }
+
+
+def load_scenarios(path, base_schema=None):
+    """
+    Read the JSON list of scenarios. The names must be unique
+    """
+    with open(path) as file:
+        specs = json.load(file)
+    scenarios = [Scenario.from_dict(spec, base_schema=base_schema) for spec in specs]
+    names = [scenario.name for scenario in scenarios]
+    duplicates = sorted({name for name in names if names.count(name) > 1} | ({BASELINE} & set(names)))
+    if duplicates:
+        raise ValueError(f"Scenario names must be unique and not {BASELINE}: {duplicates}")
+    return scenarios
+
+
+def resolve_run_dir(output_dir, run):
+    """
+    :param run: Directory of the run or run id inside the output_dir (e.g. latest)
+    """
+    run_dir = Path(run)
+    if not run_dir.is_dir():
+        run_dir = Path(output_dir) / run
+    if not run_dir.is_dir():
+        raise FileNotFoundError(f"Run {run} not found in {output_dir}")
+    return run_dir
+
+
+# State of the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(combined_normalized, source_config, crba_country_list):
+    _worker["combined_normalized"] = combined_normalized
+    _worker["source_config"] = source_config
+    _worker["crba_country_list"] = crba_country_list
+
+
+def evaluate_scenario(scenario: Scenario) -> pd.Series:
+    """
+    Overall score per country of the scenario. Runs in a worker process
+    """
+    combined_normalized = _worker["combined_normalized"]
+    if scenario.excluded_sources or scenario.renormalize:
+        if scenario.excluded_sources:
+            combined_normalized = combined_normalized[~combined_normalized["SOURCE_ID"].isin(scenario.excluded_sources)]
+        if scenario.renormalize:
+            combined_normalized = scaler.normalize_sources(
+                combined_normalized,
+                _worker["source_config"],
+                whisker_factor=scenario.whisker_factor,
+                maximum_score=scenario.maximum_score,
+            )
+        aggregator = ScoreAggregator(combined_normalized, _worker["crba_country_list"])
+    else:
+        # The group codes of the unchanged dataset are shared by all scenarios of the worker
+        if "aggregator" not in _worker:
+            _worker["aggregator"] = ScoreAggregator(combined_normalized, _worker["crba_country_list"])
+        aggregator = _worker["aggregator"]
+    scores = aggregator.aggregated_scores(scenario.schema)
+    return scores.drop_duplicates(subset="COUNTRY_ISO_3").set_index("COUNTRY_ISO_3")["OVERALL_SCORE"].rename(scenario.name)
+
+
+def compare(scores: pd.DataFrame):
+    """
+    Rank changes of the countries against the baseline
+
+    Parameters:
+    scores (pd.DataFrame): Overall score per country (index) and scenario (columns), the first column is the baseline
+
+    Return:
+    Tuple of the ranks (1 is the highest score) and of the compact comparison table: Baseline score and rank,
+    the rank change per scenario (positive: the country moved up) and the largest absolute rank change
+    """
+    ranks = scores.rank(ascending=False, method="min").astype("Int64")
+    baseline = scores.columns[0]
+    changes = ranks.drop(columns=baseline).rsub(ranks[baseline], axis=0)
+    comparison = pd.concat(
+        [
+            scores[baseline].rename("BASELINE_SCORE"),
+            ranks[baseline].rename("BASELINE_RANK"),
+            changes,
+            changes.abs().max(axis=1).astype("Int64").rename("MAX_ABS_RANK_CHANGE"),
+        ],
+        axis=1,
+    ).sort_values("BASELINE_RANK")
+    comparison.index.name = "COUNTRY_ISO_3"
+    return ranks, comparison
+
+
+def run(config, run, scenarios_path, jobs=None):
+    """
+    Evaluate the scenarios against the combined_normalized dataset of the run.
+    The results are written to the run dir of the config:
+
+    * scenarios.json: The resolved scenarios
+    * scenario_scores: Overall score and rank per country and scenario
+    * scenario_rank_changes: The compact comparison table, see compare
+
+    :param run: Directory or run id (e.g. latest) of the run with the combined_normalized dataset
+    :param jobs: Number of worker processes. Default the number of CPUs
+    """
+    run_dir = resolve_run_dir(config.output_dir, run)
+    scenarios = load_scenarios(scenarios_path, base_schema=config.aggregation_schema)
+    baseline = Scenario(BASELINE, config.aggregation_schema)
+
+    combined_normalized = read_output(run_dir / "combined_normalized")
+    source_config = config.source_config
+    if (run_dir / "source_config.csv").exists():
+        # The normalization parameters the run was made with
+        source_config = pd.read_csv(run_dir / "source_config.csv", sep=";", index_col=0, keep_default_na=False)
+    log.log(level=25, msg=f"Evaluating {len(scenarios)} scenarios on {combined_normalized.shape} rows of {run_dir}")
+
+    jobs = min(jobs or os.cpu_count(), len(scenarios) + 1)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(combined_normalized, source_config, config.country_crba_list),
+    ) as executor:
+        scores = pd.concat(list(executor.map(evaluate_scenario, [baseline] + scenarios)), axis=1)
+
+    ranks, comparison = compare(scores)
+
+    with open(config.output_dir / config.run_id / "scenarios.json", "w") as file:
+        json.dump({"run": str(run_dir), "scenarios": [scenario.to_dict() for scenario in [baseline] + scenarios]}, file, indent=2)
+    scenario_scores = pd.concat(
+        [scores.stack(dropna=False).rename("OVERALL_SCORE"), ranks.stack(dropna=False).rename("RANK")], axis=1
+    ).rename_axis(["COUNTRY_ISO_3", "SCENARIO"]).reset_index()
+    config.output_writer.write(
+        scenario_scores,
+        config.output_dir / config.run_id / "scenario_scores",
+        index=False,
+        quoting=csv.QUOTE_ALL,
+    )
+    config.output_writer.write(
+        comparison.reset_index(),
+        config.output_dir / config.run_id / "scenario_rank_changes",
+        index=False,
+        quoting=csv.QUOTE_ALL,
+    )
+
+    for scenario in scenarios:
+        changes = comparison[scenario.name].abs()
+        log.log(
+            level=25,
+            msg=f"Scenario {scenario.name}: {int((changes > 0).sum())} countries changed rank, mean {changes.mean():.2f}, max {changes.max()}",
+        )
+    return comparison
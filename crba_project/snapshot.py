@@ -0,0 +1,124 @@
+"""
+Snapshots of the reference data the Config derives from the Excel files of the input dir.
+
+Parsing the Excel files with openpyxl takes most of the startup time. The derived dataframes
+are stored as Feather files (pickle for frames pyarrow can't store, e.g. columns mixing numbers and strings)
+and only rebuilt when one of their input files or the code of the package changed.
+
+A snapshot is valid if size and modification time of all inputs are unchanged. If only the modification time
+changed, the content hash decides, so touching or copying a file does not rebuild the snapshot.
+"""
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from crba_project.incremental import code_digest, file_digest
+
+log = logging.getLogger(__name__)
+
+INDEX_COLUMN = "__snapshot_index__"
+
+
+class SnapshotCache:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            import pyarrow  # noqa: F401
+            self.feather = True
+        except ImportError:
+            self.feather = False
+
+    @staticmethod
+    def _stat(path):
+        stat = Path(path).stat()
+        return {"path": str(Path(path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _is_valid(self, manifest, inputs):
+        if manifest.get("code") != code_digest() or len(manifest.get("inputs", [])) != len(inputs):
+            return False
+        for stored, path in zip(manifest["inputs"], inputs):
+            current = self._stat(path)
+            if stored["path"] != current["path"] or stored["size"] != current["size"]:
+                return False
+            if stored["mtime_ns"] != current["mtime_ns"] and stored["sha256"] != file_digest(path):
+                return False
+        return True
+
+    def load(self, name, inputs, build) -> pd.DataFrame:
+        """
+        The snapshot of the dataframe. Built with build() if missing or outdated
+
+        :param name: Name of the snapshot
+        :param inputs: Paths of the files build() reads
+        :param build: Function without arguments returning the dataframe
+        """
+        manifest_path = self.directory / f"{name}.json"
+        try:
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+            if self._is_valid(manifest, inputs):
+                dataframe = self._read(self.directory / manifest["file"])
+                log.info(f"Loaded snapshot {name}")
+                return dataframe
+        except Exception as ex:
+            # A missing or damaged snapshot (e.g. a truncated pickle) is rebuilt
+            log.debug(f"No valid snapshot {name}: {ex}")
+
+        dataframe = build()
+        try:
+            file_name = self._write(name, dataframe)
+            manifest = {
+                "file": file_name,
+                "code": code_digest(),
+                "inputs": [dict(self._stat(path), sha256=file_digest(path)) for path in inputs],
+            }
+            self._write_atomic(manifest_path, json.dumps(manifest, indent=2).encode())
+        except Exception as ex:
+            # The snapshot only saves time. The run works without it
+            log.warning(f"Storing snapshot {name} failed: {ex}")
+        return dataframe
+
+    @staticmethod
+    def _feather_compatible(dataframe):
+        # Feather would turn object columns holding numbers into float columns
+        return all(
+            pd.api.types.infer_dtype(dataframe[column], skipna=True) in ("string", "empty")
+            for column in dataframe.columns[dataframe.dtypes == object]
+        )
+
+    def _write(self, name, dataframe):
+        # The index is stored as column. Some frames have gaps in their index (drop_duplicates)
+        if self.feather and self._feather_compatible(dataframe):
+            try:
+                file_name = f"{name}.feather"
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                os.close(fd)
+                dataframe.rename_axis(INDEX_COLUMN).reset_index().to_feather(tmp_path)
+                os.replace(tmp_path, self.directory / file_name)
+                return file_name
+            except Exception as ex:
+                os.remove(tmp_path)
+                log.debug(f"Snapshot {name} can't be stored as feather, use pickle: {ex}")
+        file_name = f"{name}.pkl"
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        dataframe.to_pickle(tmp_path)
+        os.replace(tmp_path, self.directory / file_name)
+        return file_name
+
+    @staticmethod
+    def _read(path):
+        if path.suffix == ".feather":
+            return pd.read_feather(path).set_index(INDEX_COLUMN).rename_axis(None)
+        return pd.read_pickle(path)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
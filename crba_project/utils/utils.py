@@ -1,10 +1,55 @@
-import nltk
+import functools
+import logging
 import re
+from importlib.resources import files
+from pathlib import Path
+
+import nltk
+
+log = logging.getLogger(__name__)
+
+# Stopwords of all languages of the nltk corpus, one per line. Create it with vendor_stopwords
+STOPWORDS_RESOURCE = "stopwords.txt"
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_nltk_resource(resource_path, package):
+    """
+    Download the nltk data package only if it is not installed yet. Never called at import time
+    """
+    try:
+        nltk.data.find(resource_path)
+    except LookupError:
+        log.info(f"Download nltk data {package}")
+        nltk.download(package, quiet=True)
 
-nltk.download("punkt")
-nltk.download("stopwords")
+
+@functools.lru_cache(maxsize=None)
+def stopwords():
+    """
+    Set of the stopwords of all languages. Loaded once from the vendored resource,
+    if not present from the nltk corpus
+    """
+    resource = files("crba_project.resources").joinpath(STOPWORDS_RESOURCE)
+    if resource.is_file():
+        return frozenset(resource.read_text(encoding="utf-8").splitlines())
+    ensure_nltk_resource("corpora/stopwords", "stopwords")
+    return frozenset(nltk.corpus.stopwords.words())
+
+
+def vendor_stopwords(path=None):
+    """
+    Write the stopwords of the nltk corpus into the resources of the package, so runs don't need the nltk data
+
+    :param path: Default crba_project/resources/stopwords.txt
+    """
+    ensure_nltk_resource("corpora/stopwords", "stopwords")
+    path = Path(path) if path else Path(__file__).parent.parent / "resources" / STOPWORDS_RESOURCE
+    path.write_text("\n".join(sorted(set(nltk.corpus.stopwords.words()))) + "\n", encoding="utf-8")
+    return path
 
 
+@functools.lru_cache(maxsize=None)
 def create_ind_code(indicator_name):
     """Create 6-digit indicator code suffic from indicator name
 
@@ -27,12 +72,14 @@ def create_ind_code(indicator_name):
     # Remove characters
     ind_nam_charfree = re.sub("[,.\-;')(]", "", indicator_name)
 
-    # Tokenize indicator name
-    ind_name_tok = nltk.tokenize.word_tokenize(ind_nam_charfree)
+    # Tokenize indicator name. Without the sentence split, which needs the punkt data. The names have no sentence
+    # ending punctuation left, so the tokens are the same
+    ind_name_tok = nltk.tokenize.word_tokenize(ind_nam_charfree, preserve_line=True)
 
     # Remove stopwords
+    stopword_set = stopwords()
     in_nam_tok_ns = [
-        word for word in ind_name_tok if not word in nltk.corpus.stopwords.words()
+        word for word in ind_name_tok if not word in stopword_set
     ]
 
     # Create indicator code
@@ -74,4 +121,4 @@ def create_ind_code(indicator_name):
         )
 
     # Return result
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,144 @@
+"""
+Validation of the extracted sources against the expectation suite sdmx_indicator_suite.
+
+Each source is validated as soon as it is extracted, in a background thread. Failures show up in the log
+during the run and the batch is released right after its validation, instead of keeping all dataframes
+until the end of the run.
+
+Modes (--validation):
+* off: No validation
+* sample: A random sample of at most SAMPLE_SIZE rows per source
+* full: All rows
+
+Validators (--validator):
+* native: The expectations of the suite are evaluated with pandas, see crba_project.expectations.
+  Great Expectations is only loaded for expectation types without a native implementation
+* gx: The Great Expectations checkpoint. Stores the results and updates the data docs
+"""
+import concurrent.futures
+import logging
+
+from crba_project.expectations import ExpectationSuite, describe
+
+log = logging.getLogger(__name__)
+
+VALIDATION_MODES = ["off", "sample", "full"]
+SAMPLE_SIZE = 1000
+VALIDATORS = ["native", "gx"]
+CHECKPOINT_NAME = "indicator_sdmx_checkpoint"
+EXPECTATION_SUITE_NAME = "sdmx_indicator_suite"
+
+
+class SourceValidator:
+    """
+    Usage:
+
+        with SourceValidator(config, mode="full") as validator:
+            validator.submit(source_id, dataframe)
+        validator.results  # source id -> True/False
+    """
+
+    def __init__(self, config, mode="full", sample_size=SAMPLE_SIZE, validator="native"):
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode:{mode}. Choose one of {VALIDATION_MODES}")
+        if validator not in VALIDATORS:
+            raise ValueError(f"Unknown validator:{validator}. Choose one of {VALIDATORS}")
+        self.config = config
+        self.mode = mode
+        self.validator = validator
+        self.suite = ExpectationSuite.load(EXPECTATION_SUITE_NAME) if validator == "native" and mode != "off" else None
+        self.sample_size = sample_size
+        self.results = {}
+        self._futures = {}
+        # One thread. The Great Expectations context is not thread safe
+        self._executor = (
+            concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="validation")
+            if mode != "off" else None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, source_id, dataframe):
+        """
+        Schedule the validation of the source. Returns at once
+        """
+        if self._executor is None or dataframe is None:
+            return
+        if self.mode == "sample" and len(dataframe) > self.sample_size:
+            dataframe = dataframe.sample(n=self.sample_size, random_state=0)
+        self._futures[source_id] = self._executor.submit(self._validate, source_id, dataframe)
+
+    def _validate(self, source_id, dataframe):
+        if self.suite is None:
+            return self._validate_gx(source_id, dataframe)
+
+        failed = self.suite.validate(dataframe)
+        if failed:
+            log.warning(f"Validation of source {source_id} failed: {[describe(expectation) for expectation in failed]}")
+        success = not failed
+        if self.suite.unsupported:
+            success = self._validate_gx(source_id, dataframe, expectations=self.suite.unsupported) and success
+        return success
+
+    def _batch_request(self, source_id, dataframe):
+        # Imported here like the context (Config.ge_context). Great Expectations is only loaded when it is used
+        from great_expectations.core.batch import RuntimeBatchRequest
+        return RuntimeBatchRequest(
+            datasource_name="default_datasource",
+            data_connector_name="default_runtime_data_connector",
+            data_asset_name=source_id,
+            runtime_parameters={"batch_data": dataframe},
+            batch_identifiers={"default_identifier_name": "default_identifier"},
+        )
+
+    def _validate_gx(self, source_id, dataframe, expectations=None):
+        """
+        Validate with Great Expectations. The checkpoint, or only the given expectations of the suite
+        """
+        try:
+            batch_request = self._batch_request(source_id, dataframe)
+            if expectations is None:
+                result = self.config.ge_context.run_checkpoint(
+                    checkpoint_name=CHECKPOINT_NAME,
+                    validations=[{"batch_request": batch_request}],
+                    run_name=f"{self.config.run_id}-{source_id}",
+                )
+            else:
+                from great_expectations.core import ExpectationConfiguration
+                from great_expectations.core import ExpectationSuite as GxExpectationSuite
+                suite = GxExpectationSuite(
+                    expectation_suite_name=f"{EXPECTATION_SUITE_NAME}_unsupported",
+                    expectations=[
+                        ExpectationConfiguration(expectation_type=expectation["expectation_type"], kwargs=expectation["kwargs"])
+                        for expectation in expectations
+                    ],
+                )
+                result = self.config.ge_context.get_validator(
+                    batch_request=batch_request, expectation_suite=suite
+                ).validate()
+        except Exception as ex:
+            # e.g. gx.exceptions.CheckpointError. A broken validation must not fail the run
+            log.warning(f"Validation of source {source_id} failed by exception:{ex}", exc_info=ex)
+            return False
+        if not result["success"]:
+            log.warning(f"Validation of source {source_id} failed")
+        return result["success"]
+
+    def close(self):
+        """
+        Wait for the pending validations and collect their results
+        """
+        if self._executor is None:
+            return self.results
+        for source_id, future in self._futures.items():
+            self.results[source_id] = future.result()
+        self._futures = {}
+        self._executor.shutdown()
+        failed = sorted(source_id for source_id, success in self.results.items() if not success)
+        if failed:
+            log.warning(f"Validation failed for {len(failed)} of {len(self.results)} sources: {failed}")
+        return self.results
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def country_full_list():
+    return pd.DataFrame(
+        {
+            "COUNTRY_NAME": ["Niger", "Nigeria", "Federal Republic of Nigeria", "France", "French Republic", "Germany", "Mali", "Chad"],
+            "COUNTRY_ISO_2": ["NE", "NG", "NG", "FR", "FR", "DE", "ML", "TD"],
+            "COUNTRY_ISO_3": ["NER", "NGA", "NGA", "FRA", "FRA", "DEU", "MLI", "TCD"],
+        }
+    )
+
+
+@pytest.fixture
+def crba_country_list():
+    return pd.DataFrame(
+        {
+            "COUNTRY_ISO_3": ["FRA", "NER", "NGA", "DEU", "MLI"],
+            "COUNTRY_NAME": ["France", "Niger", "Nigeria", "Germany", "Mali"],
+            "COUNTRY_ISO_2": ["FR", "NE", "NG", "DE", "ML"],
+        }
+    )
@@ -0,0 +1,169 @@
+"""
+Aggregation of the scores against the implementation it replaced.
+
+old_aggregate is the former implementation, reduced to what the comparison needs.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.aggregate import ScoreAggregator, aggregate_scores, grouped_mean
+from crba_project.aggregate.schema import AggregationSchema
+
+SCORE_KEYS = ["COUNTRY_ISO_3", "INDICATOR_CATEGORY", "INDICATOR_ISSUE", "INDICATOR_INDEX"]
+
+
+def _risk_category(scores, column):
+    lower, upper = scores[column].quantile(0.333), scores[column].quantile(0.667)
+    scores.loc[scores[column] < lower, f"{column[:-6]}_RISK_CATEGORY"] = "High risk"
+    scores.loc[scores[column] > upper, f"{column[:-6]}_RISK_CATEGORY"] = "Low risk"
+    scores.loc[(scores[column] > lower) & (scores[column] < upper), f"{column[:-6]}_RISK_CATEGORY"] = "Medium risk"
+
+
+def old_aggregate(combined_normalized, crba_country_list):
+    category = (
+        combined_normalized.loc[
+            combined_normalized["COUNTRY_ISO_3"] != "XKX",
+            ["COUNTRY_ISO_3", "SCALED_OBS_VALUE", "INDICATOR_INDEX", "INDICATOR_ISSUE", "INDICATOR_CATEGORY"],
+        ]
+        .groupby(by=SCORE_KEYS, as_index=False)
+        .mean()
+        .rename(columns={"SCALED_OBS_VALUE": "CATEGORY_ISSUE_SCORE"})
+    )
+    # Outcome and enforcement count double
+    category = pd.concat([category, category[category["INDICATOR_CATEGORY"].isin(["Outcome", "Enforcement"])]])
+    issue = (
+        category.groupby(by=["COUNTRY_ISO_3", "INDICATOR_ISSUE", "INDICATOR_INDEX"], as_index=False)
+        .mean(numeric_only=True)
+        .rename(columns={"CATEGORY_ISSUE_SCORE": "ISSUE_INDEX_SCORE"})
+        .drop_duplicates()
+    )
+    _risk_category(issue, "ISSUE_INDEX_SCORE")
+    index = (
+        issue.groupby(by=["COUNTRY_ISO_3", "INDICATOR_INDEX"], as_index=False)
+        .mean(numeric_only=True)
+        .rename(columns={"ISSUE_INDEX_SCORE": "INDEX_SCORE"})
+    )
+    _risk_category(index, "INDEX_SCORE")
+    overall = (
+        index.groupby(by=["COUNTRY_ISO_3"], as_index=False).mean(numeric_only=True).rename(columns={"INDEX_SCORE": "OVERALL_SCORE"})
+    )
+    aggregated_scores = (
+        category.merge(right=issue, on=["COUNTRY_ISO_3", "INDICATOR_ISSUE", "INDICATOR_INDEX"])
+        .merge(right=index, on=["COUNTRY_ISO_3", "INDICATOR_INDEX"])
+        .merge(right=overall, on=["COUNTRY_ISO_3"])
+        .merge(right=crba_country_list, on="COUNTRY_ISO_3")
+        .drop(["COUNTRY_NAME", "COUNTRY_ISO_2"], axis=1)
+    )
+    crba_final = combined_normalized.merge(right=aggregated_scores, on=SCORE_KEYS, how="left").drop_duplicates()
+    return aggregated_scores, crba_final
+
+
+@pytest.fixture
+def combined_normalized():
+    rng = np.random.default_rng(7)
+    indices = {"Workplace": ["Child labour", "Decent work"], "Marketplace": ["Product safety"]}
+    categories = ["Outcome", "Enforcement", "Legal framework", "Policy"]
+    rows = []
+    for country in ["FRA", "NER", "NGA", "DEU", "TCD", "XKX"]:
+        for index, issues in indices.items():
+            for issue, category, indicator in itertools.product(issues, categories, ["A", "B"]):
+                rows.append((country, index, issue, category, f"{issue} {category} {indicator}", rng.uniform(0, 10)))
+    data = pd.DataFrame(rows, columns=["COUNTRY_ISO_3", "INDICATOR_INDEX", "INDICATOR_ISSUE", "INDICATOR_CATEGORY", "INDICATOR_CODE", "SCALED_OBS_VALUE"])
+    data.loc[rng.random(len(data)) < 0.15, "SCALED_OBS_VALUE"] = np.nan
+    # Duplicate rows
+    return pd.concat([data, data.iloc[:5]], ignore_index=True)
+
+
+def test_aggregate_scores_equals_old(combined_normalized, crba_country_list):
+    old_scores, old_final = old_aggregate(combined_normalized, crba_country_list)
+    scores, crba_final = aggregate_scores(combined_normalized, crba_country_list)
+    # The old scores had the rows of outcome and enforcement twice
+    old_scores = old_scores.drop_duplicates().sort_values(["COUNTRY_ISO_3", "INDICATOR_INDEX", "INDICATOR_ISSUE", "INDICATOR_CATEGORY"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(scores, old_scores[scores.columns])
+    pd.testing.assert_frame_equal(crba_final.reset_index(drop=True), old_final.reset_index(drop=True)[crba_final.columns])
+
+
+def test_score_aggregator_reuses_codes(combined_normalized, crba_country_list):
+    aggregator = ScoreAggregator(combined_normalized, crba_country_list)
+    scores = aggregator.scores()
+    pd.testing.assert_frame_equal(aggregator.aggregated_scores(scores=scores), aggregate_scores(combined_normalized, crba_country_list)[0])
+    # The countries which are not part of the CRBA are aggregated, but not part of the output
+    assert "TCD" in set(scores["COUNTRY_ISO_3"])
+    assert "TCD" not in set(aggregator.aggregated_scores(scores=scores)["COUNTRY_ISO_3"])
+    assert "XKX" not in set(scores["COUNTRY_ISO_3"])
+
+
+def test_schema_weights_and_mean(combined_normalized, crba_country_list):
+    schema = AggregationSchema(
+        category_weights={"Outcome": 3, "Policy": 0},
+        issue_weights={"Decent work": 2},
+        index_weights={"Marketplace": 0.5},
+        mean="geometric",
+    )
+    scores, _ = aggregate_scores(combined_normalized, crba_country_list, schema=schema)
+
+    data = combined_normalized[combined_normalized["COUNTRY_ISO_3"] != "XKX"].dropna(subset=["SCALED_OBS_VALUE"])
+    log_values = np.log(data["SCALED_OBS_VALUE"])
+    category = log_values.groupby([data[key] for key in SCORE_KEYS]).mean().reset_index()
+    category["WEIGHT"] = category["INDICATOR_CATEGORY"].map(schema.category_weights).fillna(1.0)
+
+    def weighted(frame, keys, weight_column, value_column):
+        frame = frame.assign(WEIGHTED=frame[value_column] * frame[weight_column])
+        sums = frame.groupby(keys)[["WEIGHTED", weight_column]].sum()
+        return (sums["WEIGHTED"] / sums[weight_column]).rename(value_column).reset_index()
+
+    issue = weighted(category, ["COUNTRY_ISO_3", "INDICATOR_ISSUE", "INDICATOR_INDEX"], "WEIGHT", "SCALED_OBS_VALUE")
+    issue["WEIGHT"] = issue["INDICATOR_ISSUE"].map(schema.issue_weights).fillna(1.0)
+    index = weighted(issue, ["COUNTRY_ISO_3", "INDICATOR_INDEX"], "WEIGHT", "SCALED_OBS_VALUE")
+    index["WEIGHT"] = index["INDICATOR_INDEX"].map(schema.index_weights).fillna(1.0)
+    overall = weighted(index, ["COUNTRY_ISO_3"], "WEIGHT", "SCALED_OBS_VALUE").set_index("COUNTRY_ISO_3")["SCALED_OBS_VALUE"]
+
+    expected = np.exp(overall[scores["COUNTRY_ISO_3"]]).to_numpy()
+    np.testing.assert_allclose(scores["OVERALL_SCORE"].to_numpy(), expected)
+
+
+def test_grouped_mean():
+    codes = np.array([0, 0, 1, 1, -1, 2])
+    values = np.array([0.0, 4.0, 2.0, np.nan, 5.0, 3.0])
+    np.testing.assert_allclose(grouped_mean(codes, values, 4), [2.0, 2.0, 3.0, np.nan])
+    np.testing.assert_allclose(grouped_mean(codes, values, 4, weights=[1, 3, 0, 1, 1, 0]), [3.0, np.nan, np.nan, np.nan])
+    # The geometric mean of a group containing 0 is 0
+    np.testing.assert_allclose(grouped_mean(codes, values, 4, mean="geometric"), [0.0, 2.0, 3.0, np.nan])
+    with pytest.raises(ValueError):
+        grouped_mean(codes, values, 4, mean="harmonic")
+
+
+def test_schema_from_input_lists():
+    input_lists = pd.DataFrame(
+        {
+            "CATEGORY": ["Outcome", "Policy", "Enforcement", ""],
+            "CATEGORY_WEIGHT": [3, "", 1, ""],
+            "ISSUE": ["Child labour", "", "", ""],
+            "ISSUE_WEIGHT": [0.5, "", "", ""],
+            "AGGREGATION_MEAN": ["Geometric ", "", "", ""],
+            "RISK_QUANTILE_HIGH": [0.25, "", "", ""],
+        }
+    )
+    schema = AggregationSchema.from_input_lists(input_lists)
+    assert schema.category_weights == {"Outcome": 3.0, "Enforcement": 1.0}
+    assert schema.issue_weights == {"Child labour": 0.5}
+    assert schema.index_weights == {}
+    assert schema.mean == "geometric"
+    assert schema.risk_quantiles == (0.25, 0.667)
+    # Without the columns the former weights apply
+    assert AggregationSchema.from_input_lists(pd.DataFrame({"CATEGORY": ["Outcome"]})).to_dict() == {
+        **AggregationSchema().to_dict(),
+        "name": "Input_Lists",
+    }
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"mean": "median"}, {"risk_quantiles": (0.7, 0.3)}, {"risk_quantiles": (0.2, 1.5)}, {"issue_weights": {"Child labour": -1}}],
+)
+def test_invalid_schema(kwargs):
+    with pytest.raises(ValueError):
+        AggregationSchema(**kwargs)
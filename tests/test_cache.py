@@ -0,0 +1,137 @@
+"""
+PayloadCache: hits, revalidation with ETag/Last-Modified, the cache modes and the LRU eviction.
+
+The requests go to a FakeSession, nothing is downloaded.
+"""
+import os
+
+import pytest
+import requests
+
+from crba_project.extractor.cache import CacheMiss, PayloadCache
+
+URL = "https://api.example.org/data"
+
+
+def response(status_code=200, content=b"", headers=None):
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = content
+    result.headers.update(headers or {})
+    return result
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append((url, params, headers))
+        return self.responses.pop(0)
+
+
+def payload(session, cache, url=URL, **kwargs):
+    return cache.fetch(session, url, **kwargs).content
+
+
+def test_miss_then_hit(tmp_path):
+    cache = PayloadCache(tmp_path)
+    session = FakeSession(response(content=b'{"a": 1}', headers={"Content-Type": "application/json", "ETag": '"v1"'}))
+    assert payload(session, cache, params={"page": 1}) == b'{"a": 1}'
+
+    hit = cache.fetch(session, URL, params={"page": 1})
+    assert hit.json() == {"a": 1}
+    assert hit.headers["content-type"] == "application/json"
+    assert len(session.calls) == 1
+    assert dict(cache.stats) == {"miss": 1, "stored": 1, "hit": 1}
+    # Other params are another entry
+    session.responses.append(response(content=b'{"a": 2}'))
+    assert payload(session, cache, params={"page": 2}) == b'{"a": 2}'
+    assert len(session.calls) == 2
+
+
+def test_stale_entry_is_revalidated(tmp_path):
+    cache = PayloadCache(tmp_path, default_ttl=0)
+    session = FakeSession(
+        response(content=b"v1", headers={"ETag": '"v1"', "Last-Modified": "Mon, 02 Jan 2023 10:00:00 GMT"}),
+        response(304),
+        response(content=b"v2", headers={"ETag": '"v2"'}),
+    )
+    assert payload(session, cache, headers={"Accept": "text/csv"}) == b"v1"
+    assert payload(session, cache, headers={"Accept": "text/csv"}) == b"v1"
+    assert session.calls[1][2] == {
+        "Accept": "text/csv",
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 02 Jan 2023 10:00:00 GMT",
+    }
+    assert cache.stats["revalidated"] == 1
+
+    # Changed payload
+    assert payload(session, cache, headers={"Accept": "text/csv"}) == b"v2"
+    assert payload(session, cache, headers={"Accept": "text/csv"}, ttl=1) == b"v2"
+    assert len(session.calls) == 3
+
+
+def test_errors_are_not_stored(tmp_path):
+    cache = PayloadCache(tmp_path)
+    session = FakeSession(response(503, b"unavailable"), response(content=b"ok"))
+    assert cache.fetch(session, URL).status_code == 503
+    assert payload(session, cache) == b"ok"
+    assert payload(session, cache) == b"ok"
+    assert len(session.calls) == 2
+
+
+def test_refresh_mode(tmp_path):
+    PayloadCache(tmp_path).fetch(FakeSession(response(content=b"v1")), URL)
+    cache = PayloadCache(tmp_path, mode="refresh")
+    session = FakeSession(response(content=b"v2"))
+    assert payload(session, cache) == b"v2"
+    assert payload(FakeSession(), PayloadCache(tmp_path)) == b"v2"
+
+
+def test_offline_mode(tmp_path):
+    PayloadCache(tmp_path).fetch(FakeSession(response(content=b"v1")), URL)
+    cache = PayloadCache(tmp_path, mode="offline", default_ttl=0)
+    session = FakeSession()
+    # Stale entries are served as they are
+    assert payload(session, cache) == b"v1"
+    with pytest.raises(CacheMiss):
+        cache.fetch(session, URL + "/other")
+    assert session.calls == []
+
+
+def test_unknown_mode(tmp_path):
+    for mode in ["off", "write"]:
+        with pytest.raises(ValueError):
+            PayloadCache(tmp_path, mode=mode)
+
+
+def test_payloads_are_stored_once(tmp_path):
+    cache = PayloadCache(tmp_path)
+    session = FakeSession(response(content=b"same"), response(content=b"same"))
+    payload(session, cache, url=URL + "/a")
+    payload(session, cache, url=URL + "/b")
+    assert len(list(cache.entries_dir.glob("*.json"))) == 2
+    assert len(list(cache.objects_dir.glob("*.gz"))) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PayloadCache(tmp_path)
+    # Random payloads don't compress, so two of them fit, but not three
+    cache.max_size = 2500
+    payloads = {name: os.urandom(1000) for name in "abc"}
+    session = FakeSession(*[response(content=content) for content in payloads.values()])
+    payload(session, cache, url=URL + "/a")
+    payload(session, cache, url=URL + "/b")
+    # a is used again, b is the least recently used entry
+    assert payload(session, cache, url=URL + "/a") == payloads["a"]
+    payload(session, cache, url=URL + "/c")
+    assert cache.stats["evicted"] == 1
+    assert len(list(cache.objects_dir.glob("*.gz"))) == 2
+
+    offline = PayloadCache(tmp_path, mode="offline")
+    assert payload(session, offline, url=URL + "/a") == payloads["a"]
+    assert payload(session, offline, url=URL + "/c") == payloads["c"]
+    with pytest.raises(CacheMiss):
+        offline.fetch(session, URL + "/b")
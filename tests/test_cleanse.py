@@ -0,0 +1,189 @@
+"""
+Cleanser steps against the implementations they replaced.
+
+The old_* functions are the former implementations, reduced to what the comparison needs.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.cleanse import Cleanser
+
+UNMAPPED = "UNMAPPED VALUE - PLEASE MAP"
+VALUE_MAPPER = {
+    "DIM_SEX": {"FEMALE": ["F", "female", "both"], "MALE": ["M", "male", "both"], "_T": ["Total"]},
+    "DIM_AGE": {"Y0T4": ["0-4"], "Y5T9": ["5-9"]},
+    "DIM_NOT_IN_SOURCE": {"X": ["x"]},
+}
+DIM_COLS = ["DIM_SEX", "DIM_AGE"]
+COUNTRY_COLS = ["COUNTRY_ISO_2", "COUNTRY_ISO_3", "COUNTRY_NAME"]
+TIME_COLS = ["TIME_PERIOD"]
+ATTR_COLS = ["ATTR_FOOTNOTE_OF_SOURCE"]
+
+
+def old_map_values(cleansed_data, value_mapping_dict):
+    for key in value_mapping_dict:
+        if key not in cleansed_data.columns:
+            continue
+        original_values = []
+        mapped_values = []
+        for sub_key in value_mapping_dict[key]:
+            for list_element in range(len(value_mapping_dict[key][sub_key])):
+                original_values += [cleansed_data[key] == value_mapping_dict[key][sub_key][list_element]]
+            mapped_values += len(value_mapping_dict[key][sub_key]) * [sub_key]
+        original_values += [cleansed_data[key].isnull()]
+        original_values += [cleansed_data[key] == ""]
+        original_values += [cleansed_data[key] == "_T"]
+        mapped_values += [np.nan, np.nan, "_T"]
+        cleansed_data[key] = np.select(original_values, mapped_values, UNMAPPED)
+    return cleansed_data
+
+
+@pytest.fixture
+def raw_values():
+    return pd.DataFrame(
+        {
+            "DIM_SEX": ["F", "male", "both", "", np.nan, "_T", "Total", "unknown"],
+            "DIM_AGE": ["0-4", "5-9", "", "0-4", "90+", np.nan, "_T", "0-4"],
+            "RAW_OBS_VALUE": np.arange(8, dtype=float),
+        }
+    )
+
+
+def test_compile_value_mapping():
+    lookup = Cleanser.compile_value_mapping(VALUE_MAPPER)
+    assert set(lookup) == set(VALUE_MAPPER)
+    # The first target of a value wins
+    assert lookup["DIM_SEX"]["both"] == "FEMALE"
+    assert lookup["DIM_SEX"]["Total"] == "_T"
+    assert np.isnan(lookup["DIM_AGE"][""])
+    assert lookup["DIM_AGE"]["_T"] == "_T"
+    # Unless mapped explicitly
+    assert Cleanser.compile_value_mapping({"DIM_SEX": {"_Z": ["", "_T"]}})["DIM_SEX"] == {"": "_Z", "_T": "_Z"}
+
+
+def test_map_values(raw_values):
+    mapped = Cleanser.map_values(raw_values.copy(), VALUE_MAPPER)
+    assert mapped["DIM_SEX"].tolist()[:3] == ["FEMALE", "MALE", "FEMALE"]
+    assert mapped["DIM_SEX"].tolist()[5:] == ["_T", "_T", UNMAPPED]
+    assert mapped["DIM_AGE"].tolist()[:2] == ["Y0T4", "Y5T9"]
+    assert mapped["DIM_AGE"].tolist()[4] == UNMAPPED
+    # Empty and missing values are NaN, not the string "nan"
+    assert mapped["DIM_SEX"][[3, 4]].isna().all()
+    assert mapped["DIM_AGE"][[2, 5]].isna().all()
+    # Columns without mapping are unchanged, mapped columns which are not in the source are skipped
+    pd.testing.assert_series_equal(mapped["RAW_OBS_VALUE"], raw_values["RAW_OBS_VALUE"])
+    assert "DIM_NOT_IN_SOURCE" not in mapped.columns
+
+
+def test_map_values_equals_old(raw_values):
+    lookup = Cleanser.compile_value_mapping(VALUE_MAPPER)
+    new = Cleanser.map_values(raw_values.copy(), value_lookup=lookup)
+    old = old_map_values(raw_values.copy(), VALUE_MAPPER)
+    # np.select turned the NaN targets into the string "nan"
+    assert (old["DIM_SEX"] == "nan").sum() == 2
+    pd.testing.assert_frame_equal(new, old.replace("nan", np.nan))
+    pd.testing.assert_frame_equal(new, Cleanser.map_values(raw_values.copy(), VALUE_MAPPER))
+
+
+def test_missing_values_get_total(raw_values):
+    def fill_cells(data):
+        return Cleanser.add_cols_fill_cells(
+            data,
+            dim_cols=["DIM_SEX", "DIM_AGE"],
+            time_cols=["TIME_PERIOD"],
+            indicator_name_string="Indicator",
+            index_name_string="Workplace",
+            issue_name_string="Child labour",
+            category_name_string="Outcome",
+            indicator_code_string="WP_CL_OC_INDICA",
+            indicator_source_string="https://example.org",
+            indicator_source_body_string="ILO",
+            indicator_description_string="Description",
+            source_title_string="Title",
+            indicator_explanation_string="Explanation",
+            indicator_data_extraction_methodology_string="Methodology",
+            source_api_link_string="https://api.example.org",
+            attribute_unit_string="Percentage",
+        )
+
+    new = fill_cells(Cleanser.map_values(raw_values.copy(), VALUE_MAPPER))
+    old = fill_cells(old_map_values(raw_values.copy(), VALUE_MAPPER))
+    # The empty and missing values are _T now. Before, they stayed "nan"
+    assert new["DIM_SEX"].astype(object).tolist()[3:5] == ["_T", "_T"]
+    assert old["DIM_SEX"].astype(object).tolist()[3:5] == ["nan", "nan"]
+    assert new["DIM_AGE"].astype(object).tolist()[2] == "_T"
+
+
+def old_retrieve_latest_observation(renamed_data, dim_cols, country_cols, time_cols, attr_cols, obs_val_col="RAW_OBS_VALUE"):
+    available_dims_list = [col for col in renamed_data.columns if col in dim_cols]
+    available_time_list = [col for col in renamed_data.columns if col in time_cols]
+    available_country_list = [col for col in renamed_data.columns if col in country_cols]
+    available_attr_list = [col for col in renamed_data.columns if col in attr_cols]
+    renamed_data[available_dims_list] = renamed_data[available_dims_list].astype(str)
+    renamed_data[available_attr_list] = renamed_data[available_attr_list].astype(str)
+    renamed_data = renamed_data.dropna(subset=[obs_val_col])
+    return renamed_data[
+        renamed_data[available_time_list[0]]
+        == renamed_data.groupby(by=available_dims_list + available_country_list)[available_time_list[0]].transform("max")
+    ]
+
+
+@pytest.fixture
+def observations():
+    # Two dimensions, several years per group. The latest row of ("FRA", "F", "Y0T4") has no value
+    rows = []
+    for country, sex, age in itertools.product(["FRA", "NER", "NGA"], ["F", "M"], ["Y0T4", "Y5T9"]):
+        for year in [2016, 2018, 2017]:
+            rows.append((country, sex, age, year, float(year - 2000 + len(rows)), f"{country} {year}"))
+    data = pd.DataFrame(rows, columns=["COUNTRY_ISO_3", "DIM_SEX", "DIM_AGE", "TIME_PERIOD", "RAW_OBS_VALUE", "ATTR_FOOTNOTE_OF_SOURCE"])
+    data.loc[(data["COUNTRY_ISO_3"] == "FRA") & (data["DIM_SEX"] == "F") & (data["DIM_AGE"] == "Y0T4") & (data["TIME_PERIOD"] == 2018), "RAW_OBS_VALUE"] = np.nan
+    return data
+
+
+def _latest(data, keep="last"):
+    return Cleanser.retrieve_latest_observation(data.copy(), DIM_COLS, COUNTRY_COLS, TIME_COLS, ATTR_COLS, keep=keep)
+
+
+def test_latest_observation_equals_old(observations):
+    new = _latest(observations)
+    old = old_retrieve_latest_observation(observations.copy(), DIM_COLS, COUNTRY_COLS, TIME_COLS, ATTR_COLS)
+    pd.testing.assert_frame_equal(new, old)
+    # The latest row without value is skipped
+    assert new.loc[(new["COUNTRY_ISO_3"] == "FRA") & (new["DIM_SEX"] == "F") & (new["DIM_AGE"] == "Y0T4"), "TIME_PERIOD"].item() == 2017
+
+
+def test_latest_observation_time_ties(observations):
+    tie = observations[observations["TIME_PERIOD"] == 2018].assign(RAW_OBS_VALUE=-1.0)
+    data = pd.concat([observations, tie], ignore_index=True)
+    old = old_retrieve_latest_observation(data.copy(), DIM_COLS, COUNTRY_COLS, TIME_COLS, ATTR_COLS)
+    keys = DIM_COLS + ["COUNTRY_ISO_3"]
+    # The old implementation kept all tied rows, the new one the last (or first) in the order of the raw data
+    assert old.duplicated(subset=keys).any()
+    pd.testing.assert_frame_equal(_latest(data), old[~old.duplicated(subset=keys, keep="last")])
+    pd.testing.assert_frame_equal(_latest(data, keep="first"), old[~old.duplicated(subset=keys, keep="first")])
+    with pytest.raises(ValueError):
+        _latest(data, keep="max")
+
+
+def test_latest_observation_missing_dimensions(observations):
+    data = observations.copy()
+    data.loc[data["DIM_AGE"] == "Y5T9", "DIM_AGE"] = np.nan
+    new = _latest(data)
+    old = old_retrieve_latest_observation(data.copy(), DIM_COLS, COUNTRY_COLS, TIME_COLS, ATTR_COLS)
+    # Missing values are one group of their own, like the string "nan" the old implementation grouped by
+    assert new["DIM_AGE"].isna().any() and not (new["DIM_AGE"] == "nan").any()
+    keys = DIM_COLS + ["COUNTRY_ISO_3"]
+    old = old[~old.duplicated(subset=keys, keep="last")].replace({"DIM_AGE": {"nan": np.nan}})
+    pd.testing.assert_frame_equal(new, old)
+
+
+def test_latest_observation_unhashable_values(observations):
+    data = observations.copy()
+    data["ATTR_FOOTNOTE_OF_SOURCE"] = [[value] for value in data["ATTR_FOOTNOTE_OF_SOURCE"]]
+    data["DIM_SEX"] = [[value] for value in data["DIM_SEX"]]
+    new = _latest(data)
+    old = old_retrieve_latest_observation(data.copy(), DIM_COLS, COUNTRY_COLS, TIME_COLS, ATTR_COLS)
+    pd.testing.assert_frame_equal(new, old)
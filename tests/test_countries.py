@@ -0,0 +1,120 @@
+"""
+Country resolution against the implementations it replaced.
+
+The old_* functions are the former implementations, reduced to what the comparison needs.
+add_and_discard_countries also sets the ISO2 code of the countries it adds to sources with country names now.
+"""
+from statistics import median
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.cleanse import Cleanser
+from crba_project.cleanse.countries import CountryIndex, CountryNameMatcher
+
+
+def old_add_and_discard_countries(grouped_data, crba_country_list, country_list_full):
+    country_col_right_join = [col for col in crba_country_list.columns if col in grouped_data.columns]
+    if len(country_col_right_join) == 1:
+        country_col_right_join = country_col_right_join[0]
+    med_country_col_len = median(crba_country_list[country_col_right_join].apply(lambda x: len(x)))
+    if (med_country_col_len > 1.5) & (med_country_col_len < 3.5):
+        grouped_data_iso_filt = grouped_data.merge(
+            right=crba_country_list[[country_col_right_join]],
+            how="right",
+            on=country_col_right_join,
+            indicator=True,
+            validate="many_to_one",
+            suffixes=("_source_data", None),
+        )
+    else:
+        grouped_data["COUNTRY_NAME"] = grouped_data["COUNTRY_NAME"].astype(str).apply(lambda x: x.strip())
+        grouped_data_iso = grouped_data.merge(right=country_list_full, how="left", on="COUNTRY_NAME", validate="many_to_one")
+        grouped_data_iso_filt = grouped_data_iso.merge(
+            right=crba_country_list[["COUNTRY_ISO_3"]],
+            how="right",
+            on="COUNTRY_ISO_3",
+            indicator=True,
+            validate="many_to_one",
+        )
+    if "COUNTRY_ISO_3" not in grouped_data_iso_filt.columns:
+        grouped_data_iso_filt = grouped_data_iso_filt.merge(
+            right=crba_country_list[["COUNTRY_ISO_2", "COUNTRY_ISO_3"]], on="COUNTRY_ISO_2", how="left", indicator=False
+        )
+    return grouped_data_iso_filt
+
+
+def old_extract_country_name(cell, country_name_list):
+    subset_list = [x in cell for x in country_name_list]
+    if sum(subset_list) == 0:
+        return ""
+    if sum(subset_list) == 1:
+        return country_name_list[subset_list].item()
+    return max(country_name_list[subset_list], key=len)
+
+
+@pytest.mark.parametrize(
+    "cell",
+    [
+        "Niger",
+        "Nigeria",
+        "Nigeria (ratified 2012)",
+        "Niger - Federal Republic of Nigeria",
+        "The French Republic: denounced",
+        "Atlantis",
+        "",
+    ],
+)
+def test_country_name_matcher_equals_old(cell, country_full_list):
+    names = country_full_list["COUNTRY_NAME"]
+    assert CountryNameMatcher(names).find(cell) == old_extract_country_name(cell, names)
+
+
+def test_country_name_matcher_niger_nigeria():
+    matcher = CountryNameMatcher(["Niger", "Nigeria"])
+    assert matcher.find("Nigeria") == "Nigeria"
+    assert matcher.find("Niger") == "Niger"
+    assert matcher.find("Republic of Niger, not Nigeria") == "Nigeria"
+    assert matcher.find(np.nan) == ""
+
+
+def _without_categoricals(dataframe):
+    return dataframe.astype({col: object for col in dataframe.columns if isinstance(dataframe[col].dtype, pd.CategoricalDtype)})
+
+
+@pytest.mark.parametrize(
+    "country_col,values",
+    [
+        ("COUNTRY_ISO_3", ["NGA", "WLD", "FRA", "NER", "TCD", "FRA"]),
+        ("COUNTRY_ISO_2", ["NG", "XX", "FR", "NE", "TD", "FR"]),
+        ("COUNTRY_NAME", ["Federal Republic of Nigeria", "World", " French Republic", "Niger", "Chad", "France "]),
+    ],
+)
+def test_add_and_discard_countries_equals_old(country_col, values, country_full_list, crba_country_list):
+    data = pd.DataFrame({country_col: values, "RAW_OBS_VALUE": np.arange(len(values), dtype=float)})
+    old = old_add_and_discard_countries(data.copy(), crba_country_list, country_full_list)
+    index = CountryIndex(country_full_list, crba_country_list)
+    for new in [
+        Cleanser.add_and_discard_countries(data.copy(), country_index=index),
+        Cleanser.add_and_discard_countries(data.copy(), crba_country_list, country_full_list),
+    ]:
+        new = _without_categoricals(new)
+        expected = _without_categoricals(old)
+        if country_col == "COUNTRY_NAME":
+            # The ISO2 code of the added countries is set now
+            added = expected["_merge"] == "right_only"
+            expected.loc[added, "COUNTRY_ISO_2"] = crba_country_list.set_index("COUNTRY_ISO_3")["COUNTRY_ISO_2"][expected.loc[added, "COUNTRY_ISO_3"]].to_numpy()
+        pd.testing.assert_frame_equal(new[expected.columns], expected, check_dtype=False)
+
+
+def test_country_index(country_full_list, crba_country_list):
+    index = CountryIndex(country_full_list, crba_country_list)
+    ids = index.resolve(["NGA", "NG", "Nigeria", " Federal Republic of Nigeria ", "Chad", "World", None])
+    assert list(index.iso3[ids[:5]]) == ["NGA"] * 4 + ["TCD"]
+    assert list(ids[5:]) == [-1, -1]
+    # Chad is known, but no CRBA country
+    assert ids[4] >= index.n_crba
+    rows, country_ids = index.crba_rows(ids)
+    assert list(index.iso3[country_ids]) == ["FRA", "NER", "NGA", "NGA", "NGA", "NGA", "DEU", "MLI"]
+    assert list(rows) == [-1, -1, 0, 1, 2, 3, -1, -1]
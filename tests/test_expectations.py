@@ -0,0 +1,132 @@
+"""
+Native expectations against Great Expectations, on the expectations of the sdmx_indicator_suite.
+"""
+import inspect
+
+import great_expectations as ge
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.expectations import NATIVE_EXPECTATIONS, ExpectationSuite, describe, load_expectation_suite
+
+SUITE = load_expectation_suite("sdmx_indicator_suite")
+
+
+def ge_success(dataset, expectation_type, kwargs):
+    """
+    Result of the legacy Great Expectations dataset. It rejects the arguments which don't apply,
+    e.g. mostly of table expectations, which the stored suite contains. Values it can't compare fail the expectation
+    """
+    method = getattr(dataset, expectation_type)
+    parameters = inspect.signature(method).parameters
+    return method(**{key: value for key, value in kwargs.items() if key in parameters}, catch_exceptions=True).success
+
+
+def expectation(expectation_type, column=None):
+    return next(
+        expectation
+        for expectation in SUITE["expectations"]
+        if expectation["expectation_type"] == expectation_type and expectation["kwargs"].get("column") == column
+    )
+
+
+@pytest.fixture
+def valid_data():
+    kwargs = {expectation["expectation_type"]: expectation["kwargs"] for expectation in SUITE["expectations"]}
+    countries = sorted(set(expectation("expect_column_values_to_be_in_set", "COUNTRY_ISO_3")["kwargs"]["value_set"]))
+    rows = kwargs["expect_table_row_count_to_equal"]["value"]
+    data = pd.DataFrame({column: "value" for column in kwargs["expect_table_columns_to_match_set"]["column_set"]}, index=range(rows))
+    return data.assign(
+        COUNTRY_ISO_3=countries[:rows],
+        INDICATOR_INDEX="Workplace",
+        INDICATOR_ISSUE="Child labour",
+        INDICATOR_CATEGORY="Outcome",
+        TIME_PERIOD=2020,
+        CRBA_RELEASE_YEAR=2023,
+        RAW_OBS_VALUE=np.linspace(0, 100, rows),
+        SCALED_OBS_VALUE=np.linspace(0, 10, rows),
+    )
+
+
+def defects(data):
+    """
+    Frames with one defect each
+    """
+    yield data.iloc[:-1]
+    yield data.drop(columns="ATTR_SOURCE")
+    yield data.assign(EXTRA=1)
+    for column, value in [
+        ("COUNTRY_ISO_3", "XXX"),
+        ("INDICATOR_INDEX", None),
+        ("INDICATOR_CATEGORY", "Policy"),
+        ("TIME_PERIOD", 2011),
+        ("TIME_PERIOD", "2020"),
+        ("CRBA_RELEASE_YEAR", 2025),
+        ("SCALED_OBS_VALUE", 10.5),
+        ("SCALED_OBS_VALUE", np.nan),
+        ("INDICATOR_NAME", np.nan),
+    ]:
+        defective = data.copy()
+        defective[column] = defective[column].astype(object)
+        defective.loc[7, column] = value
+        yield defective
+    yield data.assign(RAW_OBS_VALUE=data["RAW_OBS_VALUE"].astype(object).where(data.index != 3, "12"))
+    yield data.assign(RAW_OBS_VALUE=data["RAW_OBS_VALUE"].astype("float32"))
+
+
+def test_suite_is_evaluated_natively():
+    suite = ExpectationSuite(SUITE)
+    assert suite.name == "sdmx_indicator_suite"
+    assert suite.unsupported == []
+    assert len(suite.expectations) == len(SUITE["expectations"])
+
+
+def test_expectations_equal_great_expectations(valid_data):
+    frames = [valid_data, *defects(valid_data)]
+    for data in frames:
+        dataset = ge.from_pandas(data)
+        for expectation in SUITE["expectations"]:
+            kwargs = expectation["kwargs"]
+            if "column" in kwargs and kwargs["column"] not in data.columns:
+                continue
+            expected = ge_success(dataset, expectation["expectation_type"], kwargs)
+            assert NATIVE_EXPECTATIONS[expectation["expectation_type"]](data, **kwargs) == expected, describe(expectation)
+
+
+def test_mostly_and_nulls():
+    data = pd.DataFrame({"A": [1, 2, 3, None, 50], "B": ["x", "y", "x", "x", None]})
+    dataset = ge.from_pandas(data)
+    for expectation_type, kwargs in [
+        ("expect_column_values_to_be_between", dict(column="A", min_value=0, max_value=10)),
+        ("expect_column_values_to_be_between", dict(column="A", min_value=0, max_value=10, mostly=0.75)),
+        ("expect_column_values_to_be_between", dict(column="A", min_value=1, max_value=50, strict_min=True)),
+        ("expect_column_values_to_be_in_set", dict(column="B", value_set=["x", "y"])),
+        ("expect_column_values_to_not_be_in_set", dict(column="B", value_set=["y"], mostly=0.7)),
+        ("expect_column_values_to_not_be_null", dict(column="B", mostly=0.8)),
+        ("expect_column_values_to_be_null", dict(column="A", mostly=0.5)),
+        ("expect_compound_columns_to_be_unique", dict(column_list=["A", "B"])),
+        ("expect_compound_columns_to_be_unique", dict(column_list=["B"], mostly=0.2)),
+        ("expect_table_columns_to_match_set", dict(column_set=["A"], exact_match=False)),
+    ]:
+        expected = ge_success(dataset, expectation_type, kwargs)
+        assert NATIVE_EXPECTATIONS[expectation_type](data, **kwargs) == expected, (expectation_type, kwargs)
+
+
+def test_validate_reports_the_failed_expectations(valid_data):
+    suite = ExpectationSuite(SUITE)
+    assert suite.validate(valid_data) == []
+
+    failed = suite.validate(valid_data.drop(columns="INDICATOR_NAME").assign(TIME_PERIOD=2000))
+    assert [describe(expectation) for expectation in failed] == [
+        "expect_table_columns_to_match_set()",
+        "expect_column_values_to_be_between(TIME_PERIOD)",
+        "expect_column_values_to_not_be_null(INDICATOR_NAME)",
+    ]
+
+
+def test_unsupported_expectations():
+    unsupported = {"expectation_type": "expect_column_kl_divergence_to_be_less_than", "kwargs": {"column": "A"}}
+    suite = ExpectationSuite({"expectation_suite_name": "suite", "expectations": [unsupported]})
+    assert suite.unsupported == [unsupported]
+    assert suite.validate(pd.DataFrame({"A": [1]})) == []
@@ -0,0 +1,162 @@
+"""
+Normalizer against the implementation it replaced.
+
+old_normalizer is the former implementation, reduced to what the comparison needs (no FSM handling, no logging).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.normalize.scaler import normalize_sources, normalizer
+
+COUNTRIES = [f"C{number:02d}" for number in range(20)]
+
+
+def old_normalizer(cleansed_data, sql_subset_query_string, variable_type="Continuous variable", is_inverted="not inverted", whisker_factor=1.5, maximum_score=10):
+    cleansed_data["RAW_OBS_VALUE"] = pd.to_numeric(cleansed_data["RAW_OBS_VALUE"])
+    if sql_subset_query_string:
+        cleansed_data_subset = cleansed_data.query(sql_subset_query_string)
+    else:
+        cleansed_data_subset = cleansed_data
+    cleansed_data_subset = cleansed_data_subset[cleansed_data_subset["TIME_PERIOD"] >= 2010].copy()
+    assert sum(cleansed_data_subset["COUNTRY_ISO_3"].duplicated()) == 0
+
+    raw = cleansed_data_subset["RAW_OBS_VALUE"]
+    if variable_type != "Continuous variable":
+        unique_values = raw.unique()
+        conditions = [raw == value for value in sorted(unique_values)]
+        length_unique_values = len(unique_values)
+        norm_values = []
+        if 0 in list(unique_values):
+            norm_values += [np.nan]
+            length_unique_values -= 1
+        distance = maximum_score / (length_unique_values - 1)
+        norm_values += [round(distance * float(value), 2) for value in range(length_unique_values)]
+        cleansed_data_subset["SCALED_OBS_VALUE"] = np.select(conditions, norm_values)
+    else:
+        min_val, max_val = np.nanmin(raw), np.nanmax(raw)
+        q1, q3 = raw.quantile(q=0.25), raw.quantile(q=0.75)
+        iqr = q3 - q1
+        max_to_use = q3 + whisker_factor * iqr if max_val > q3 + whisker_factor * iqr else max_val
+        min_to_use = q1 - whisker_factor * iqr if min_val < q1 - whisker_factor * iqr else min_val
+        tot_range = (max_to_use - min_to_use) or 0.001
+        score = maximum_score * (raw - min_to_use) / tot_range
+        if is_inverted == "inverted":
+            score = maximum_score - score
+        cleansed_data_subset["SCALED_OBS_VALUE"] = round(score, 2).clip(0, 10)
+    return cleansed_data.merge(right=cleansed_data_subset, how="outer")
+
+
+def raw_data(values, sex=None, time_period=2020):
+    return pd.DataFrame(
+        {
+            "COUNTRY_ISO_3": COUNTRIES[: len(values)],
+            "DIM_SEX": sex or ["_T"] * len(values),
+            "TIME_PERIOD": time_period,
+            "RAW_OBS_VALUE": values,
+            "OBS_STATUS": "A",
+        }
+    )
+
+
+def scores(data):
+    return data.set_index(["COUNTRY_ISO_3", "DIM_SEX"]).sort_index()["SCALED_OBS_VALUE"]
+
+
+@pytest.fixture
+def continuous_data():
+    rng = np.random.default_rng(17)
+    values = np.concatenate([rng.lognormal(2, 1, 17), [0.0, 250.0, np.nan]])
+    data = pd.concat([raw_data(values), raw_data(values[::-1] * 2, sex=["F"] * len(values))], ignore_index=True)
+    # Older observations are not normalized
+    data.loc[3, "TIME_PERIOD"] = 2005
+    return data
+
+
+@pytest.mark.parametrize("is_inverted", ["not inverted", "inverted"])
+@pytest.mark.parametrize("whisker_factor", [0.5, 1.5, 3])
+@pytest.mark.parametrize("query", ["DIM_SEX == '_T'", "DIM_SEX == 'F'"])
+def test_continuous_groups_equal_old(continuous_data, query, is_inverted, whisker_factor):
+    kwargs = dict(is_inverted=is_inverted, whisker_factor=whisker_factor)
+    new = normalizer(continuous_data.copy(), query, **kwargs)
+    old = old_normalizer(continuous_data.copy(), query, **kwargs)
+    pd.testing.assert_series_equal(scores(new), scores(old))
+    # The rows are kept in their order
+    pd.testing.assert_frame_equal(new.drop(columns="SCALED_OBS_VALUE"), continuous_data.assign(OBS_STATUS=np.where(continuous_data["RAW_OBS_VALUE"].isna(), "O", "A")))
+
+
+def test_categorical_groups_equal_old():
+    data = raw_data([1, 2, 3, 2, 0, 1, 3, 0])
+    new = normalizer(data.copy(), None, variable_type="Categorical")
+    old = old_normalizer(data.copy(), None, variable_type="Categorical")
+    pd.testing.assert_series_equal(scores(new), scores(old))
+    np.testing.assert_array_equal(scores(new).to_numpy(), [0, 5, 10, 5, np.nan, 0, 10, np.nan])
+    assert new.loc[new["RAW_OBS_VALUE"] == 0, "OBS_STATUS"].eq("O").all()
+
+
+@pytest.mark.parametrize(
+    "values,old_scores",
+    [
+        ([1, 2, 3, np.nan], [0, 3.33, 6.67, 0]),
+        ([np.nan, 1, 2, 3], [0, 3.33, 6.67, 10]),
+        ([2, np.nan, 1, 3], [0, 0, 6.67, 10]),
+    ],
+)
+def test_categorical_scores_without_raw_value(values, old_scores):
+    data = raw_data(values)
+    old = old_normalizer(data.copy(), None, variable_type="Categorical")
+    new = normalizer(data.copy(), None, variable_type="Categorical")
+    # The missing value counted as a category, the scores depended on the order of the rows
+    assert old["SCALED_OBS_VALUE"].tolist() == pytest.approx(old_scores)
+    # Now the rows without value get no score and the other categories 0, 5 and 10
+    expected = pd.Series(values).map({1: 0.0, 2: 5.0, 3: 10.0})
+    np.testing.assert_array_equal(new["SCALED_OBS_VALUE"].to_numpy(), expected.to_numpy())
+    assert new.loc[pd.isna(values), "OBS_STATUS"].eq("O").all()
+
+
+def test_categorical_scores_with_no_data_and_raw_value():
+    data = raw_data([np.nan, 0, 1, 2, 3])
+    old = old_normalizer(data.copy(), None, variable_type="Categorical")
+    new = normalizer(data.copy(), None, variable_type="Categorical")
+    assert old["SCALED_OBS_VALUE"].tolist() == pytest.approx([0, 0, 3.33, 6.67, 10])
+    np.testing.assert_array_equal(new["SCALED_OBS_VALUE"].to_numpy(), [np.nan, np.nan, 0, 5, 10])
+
+
+def test_normalizer_errors():
+    with pytest.raises(AssertionError):
+        normalizer(raw_data([1.0, 2.0]).assign(COUNTRY_ISO_3="C00"), None)
+    with pytest.raises(ValueError):
+        normalizer(raw_data([1.0, 2.0]), None, is_inverted="")
+
+
+def test_normalize_sources_equals_normalizer(continuous_data):
+    categorical = raw_data([1, 2, 3, 0, np.nan, 2])
+    data = pd.concat(
+        [
+            continuous_data.assign(SOURCE_ID="S-1"),
+            continuous_data.assign(SOURCE_ID="S-2"),
+            categorical.assign(SOURCE_ID="S-3"),
+            categorical.assign(SOURCE_ID="S-4", SCALED_OBS_VALUE=7.0),
+        ],
+        ignore_index=True,
+    )
+    source_config = pd.DataFrame(
+        {
+            "SOURCE_ID": ["S-1", "S-2", "S-3"],
+            "DIMENSION_VALUES_NORMALIZATION": ["DIM_SEX == '_T'", "DIM_SEX == 'F'", None],
+            "VALUE_LABELS": ["Continuous variable", "Continuous variable", "Categorical"],
+            "INVERT_NORMALIZATION": ["inverted", "not inverted", None],
+        }
+    )
+    normalized = normalize_sources(data, source_config, whisker_factor=3)
+    for source_id, query, variable_type, is_inverted in source_config.itertuples(index=False):
+        expected = normalizer(
+            data[data["SOURCE_ID"] == source_id].drop(columns="SCALED_OBS_VALUE"),
+            query,
+            variable_type=variable_type,
+            is_inverted=is_inverted,
+            whisker_factor=3,
+        )
+        np.testing.assert_array_equal(normalized.loc[normalized["SOURCE_ID"] == source_id, "SCALED_OBS_VALUE"].to_numpy(), expected["SCALED_OBS_VALUE"].to_numpy())
+    # Sources which are not in the source config keep their scores
+    assert normalized.loc[normalized["SOURCE_ID"] == "S-4", "SCALED_OBS_VALUE"].eq(7.0).all()
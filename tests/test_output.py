@@ -0,0 +1,133 @@
+"""
+Writers of the run outputs: the schema of the parquet files, the round trip through read_output and the star layout.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.aggregate import aggregate_scores
+from crba_project.output import CsvWriter, ParquetWriter, apply_schema, create_writer, read_output
+from crba_project.output.star import FACT_TABLE, LAYOUT_FILE, SCORE_GROUP_COLUMNS, build_star, read_wide, wide_view, write_star
+
+SDMX_COLUMNS = ["COUNTRY_ISO_3", "DIM_SEX", "TIME_PERIOD", "RAW_OBS_VALUE", "OBS_STATUS", "ATTR_UNIT_MEASURE"]
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame(
+        {
+            "COUNTRY_ISO_3": ["FRA", "NER", "NGA", "DEU"],
+            "DIM_SEX": [np.nan, "F", "M", np.nan],
+            "TIME_PERIOD": [2019, 2020, 2021, 2020],
+            "RAW_OBS_VALUE": [1.5, "yes", 3, np.nan],
+            "SCALED_OBS_VALUE": [0, 10, 5, np.nan],
+            "OBS_STATUS": "A",
+            "ATTR_UNIT_MEASURE": np.nan,
+            # Categories mixing numbers and strings
+            "DIM_AGE": pd.Categorical([15, "Y15T17", np.nan, 15]),
+        }
+    )
+
+
+def test_apply_schema(dataset):
+    converted = apply_schema(dataset, SDMX_COLUMNS)
+    assert converted["TIME_PERIOD"].dtype == "float64"
+    assert converted["SCALED_OBS_VALUE"].dtype == "float64"
+    for column in ["COUNTRY_ISO_3", "DIM_SEX", "RAW_OBS_VALUE", "ATTR_UNIT_MEASURE"]:
+        assert converted[column].dtype == "string", column
+    assert converted["ATTR_UNIT_MEASURE"].isna().all()
+    # The categories become strings, the codes are kept
+    assert list(converted["DIM_AGE"].cat.categories) == ["15", "Y15T17"]
+    assert converted["DIM_AGE"].astype(object).tolist() == ["15", "Y15T17", np.nan, "15"]
+    # The input is not changed
+    assert dataset["TIME_PERIOD"].dtype == "int64"
+
+
+def test_parquet_round_trip(tmp_path, dataset):
+    pytest.importorskip("pyarrow")
+    writer = create_writer("parquet", SDMX_COLUMNS, compression="zstd")
+    path = writer.write(dataset, tmp_path / "combined_normalized", index=False)
+    assert path == tmp_path / "combined_normalized.parquet"
+    pd.testing.assert_frame_equal(read_output(tmp_path / "combined_normalized"), apply_schema(dataset, SDMX_COLUMNS))
+
+
+def test_csv_round_trip(tmp_path, dataset):
+    dataset = dataset.drop(columns="DIM_AGE")
+    path = create_writer().write(dataset, tmp_path / "crba_final", index=False)
+    assert path == tmp_path / "crba_final.csv"
+    pd.testing.assert_frame_equal(read_output(tmp_path / "crba_final"), read_output(path))
+    assert read_output(path)["COUNTRY_ISO_3"].tolist() == dataset["COUNTRY_ISO_3"].tolist()
+
+
+def test_create_writer():
+    assert isinstance(create_writer(), CsvWriter)
+    with pytest.raises(ValueError):
+        create_writer("xlsx")
+
+
+def test_parquet_writer_compression():
+    pytest.importorskip("pyarrow")
+    assert ParquetWriter(compression="none").compression is None
+
+
+@pytest.fixture
+def crba_final():
+    rng = np.random.default_rng(22)
+    countries = ["FRA", "NER", "NGA", "DEU", "MLI"]
+    sources = []
+    for number, (index, issue, category) in enumerate(
+        [("Workplace", "Child labour", "Outcome"), ("Workplace", "Decent work", "Policy"), ("Marketplace", "Product Safety", "Enforcement")]
+    ):
+        for sex in ["F", "M", np.nan]:
+            sources.append(
+                pd.DataFrame(
+                    {
+                        "COUNTRY_ISO_3": countries,
+                        "SOURCE_ID": f"S-{number}",
+                        "INDICATOR_CODE": f"WP_CL_OC_IND{number}",
+                        "INDICATOR_NAME": f"Indicator {number}",
+                        "INDICATOR_INDEX": index,
+                        "INDICATOR_ISSUE": issue,
+                        "INDICATOR_CATEGORY": category,
+                        "ATTR_INDICATOR_DESCRIPTION": f"A long description of indicator {number}",
+                        "ATTR_SOURCE_BODY": "ILO",
+                        "CRBA_RELEASE_YEAR": 2023,
+                        "DIM_SEX": sex,
+                        "TIME_PERIOD": 2020.0,
+                        "RAW_OBS_VALUE": rng.lognormal(0, 1, len(countries)),
+                        "OBS_STATUS": "A",
+                    }
+                )
+            )
+    combined_normalized = pd.concat(sources, ignore_index=True)
+    combined_normalized["SCALED_OBS_VALUE"] = np.round(rng.uniform(0, 10, len(combined_normalized)), 2)
+    _, crba_final = aggregate_scores(combined_normalized, pd.DataFrame({"COUNTRY_ISO_3": countries}))
+    return crba_final
+
+
+def test_build_star(crba_final):
+    country_list = pd.DataFrame({"COUNTRY_ISO_3": ["FRA", "NER", "NGA", "DEU", "MLI"], "COUNTRY_NAME": ["France", "Niger", "Nigeria", "Germany", "Mali"]})
+    tables, layout = build_star(crba_final, source_config=pd.DataFrame({"SOURCE_ID": ["S-0"], "SOURCE_TYPE": ["API"]}), country_list=country_list)
+    assert list(tables) == [FACT_TABLE, "countries", "indicators", "sources", "scores"]
+    assert len(tables[FACT_TABLE]) == len(crba_final)
+    assert len(tables["countries"]) == 5
+    assert len(tables["indicators"]) == 3
+    assert tables["sources"]["SOURCE_TYPE"].tolist() == ["API", np.nan, np.nan]
+    # One row of scores per country, index, issue and category
+    assert len(tables["scores"]) == len(crba_final.drop_duplicates(subset=SCORE_GROUP_COLUMNS))
+    assert "ATTR_INDICATOR_DESCRIPTION" not in tables[FACT_TABLE].columns
+    assert tables["countries"].set_index("COUNTRY_ISO_3")["COUNTRY_NAME"]["NER"] == "Niger"
+
+    pd.testing.assert_frame_equal(wide_view(tables, layout), crba_final.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("writer", ["csv", "parquet"])
+def test_star_round_trip(tmp_path, crba_final, writer):
+    if writer == "parquet":
+        pytest.importorskip("pyarrow")
+    writer = create_writer(writer, SDMX_COLUMNS)
+    writer.write(crba_final, tmp_path / "crba_final", index=False)
+    write_star(writer, *build_star(crba_final), tmp_path / "star")
+    assert (tmp_path / "star" / LAYOUT_FILE).exists()
+    # The same dataset as the wide file
+    pd.testing.assert_frame_equal(read_wide(tmp_path / "star"), read_output(tmp_path / "crba_final"))
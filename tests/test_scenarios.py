@@ -0,0 +1,163 @@
+"""
+Scenarios: the scenario specs, the rank comparison and the evaluation against the baseline of a run.
+"""
+import csv
+import json
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project import scenarios
+from crba_project.aggregate import aggregate_scores
+from crba_project.aggregate.schema import AggregationSchema
+from crba_project.normalize import scaler
+from crba_project.output import CsvWriter, read_output
+from crba_project.scenarios import BASELINE, Scenario
+
+COUNTRIES = [f"C{number:02d}" for number in range(30)]
+SOURCES = [
+    ("S-0", "Workplace", "Child labour", "Outcome", "not inverted"),
+    ("S-1", "Workplace", "Decent work", "Policy", "inverted"),
+    ("S-2", "Marketplace", "Product Safety", "Enforcement", "not inverted"),
+    ("S-3", "Marketplace", "Child labour", "Outcome", "not inverted"),
+]
+
+
+@pytest.fixture
+def source_config():
+    return pd.DataFrame(
+        {
+            "SOURCE_ID": [source_id for source_id, *_ in SOURCES],
+            "DIMENSION_VALUES_NORMALIZATION": "",
+            "VALUE_LABELS": "Continuous variable",
+            "INVERT_NORMALIZATION": [is_inverted for *_, is_inverted in SOURCES],
+        }
+    )
+
+
+@pytest.fixture
+def combined_normalized(source_config):
+    rng = np.random.default_rng(19)
+    sources = []
+    for source_id, index, issue, category, is_inverted in SOURCES:
+        source = pd.DataFrame(
+            {
+                "SOURCE_ID": source_id,
+                "COUNTRY_ISO_3": COUNTRIES,
+                "INDICATOR_INDEX": index,
+                "INDICATOR_ISSUE": issue,
+                "INDICATOR_CATEGORY": category,
+                "RAW_OBS_VALUE": rng.lognormal(0, 1, len(COUNTRIES)),
+                "TIME_PERIOD": 2020,
+                "OBS_STATUS": "A",
+            }
+        )
+        sources.append(scaler.normalizer(source, None, is_inverted=is_inverted))
+    return pd.concat(sources, ignore_index=True)
+
+
+@pytest.fixture
+def crba_country_list():
+    return pd.DataFrame({"COUNTRY_ISO_3": COUNTRIES})
+
+
+def overall_scores(combined_normalized, crba_country_list, schema=None):
+    scores, _ = aggregate_scores(combined_normalized, crba_country_list, schema=schema)
+    return scores.drop_duplicates(subset="COUNTRY_ISO_3").set_index("COUNTRY_ISO_3")["OVERALL_SCORE"]
+
+
+def test_scenario_from_dict():
+    base_schema = AggregationSchema(category_weights={"Outcome": 2}, mean="geometric")
+    scenario = Scenario.from_dict({"name": "w3", "whisker_factor": 3, "issue_weights": {"Child labour": 0.5}}, base_schema=base_schema)
+    assert scenario.schema.category_weights == {"Outcome": 2}
+    assert scenario.schema.issue_weights == {"Child labour": 0.5}
+    assert scenario.schema.mean == "geometric"
+    assert scenario.schema.name == "w3"
+    assert scenario.renormalize
+    assert not Scenario.from_dict({"name": "geo", "excluded_sources": ["S-1"]}).renormalize
+
+    with pytest.raises(ValueError):
+        Scenario.from_dict({"name": "typo", "whisker": 3})
+    with pytest.raises(ValueError):
+        Scenario.from_dict({"mean": "geometric"})
+
+
+def test_load_scenarios(tmp_path):
+    path = tmp_path / "scenarios.json"
+    path.write_text(json.dumps([{"name": "a"}, {"name": "b", "mean": "geometric"}]))
+    assert [scenario.name for scenario in scenarios.load_scenarios(path)] == ["a", "b"]
+    for names in [["a", "a"], ["a", BASELINE]]:
+        path.write_text(json.dumps([{"name": name} for name in names]))
+        with pytest.raises(ValueError):
+            scenarios.load_scenarios(path)
+
+
+def test_compare():
+    scores = pd.DataFrame(
+        {BASELINE: [9.0, 5.0, 1.0, np.nan], "up": [1.0, 5.0, 9.0, np.nan], "same": [8.0, 4.0, 2.0, 1.0]},
+        index=pd.Index(["A", "B", "C", "D"], name="COUNTRY_ISO_3"),
+    )
+    ranks, comparison = scenarios.compare(scores)
+    assert ranks[BASELINE].tolist() == [1, 2, 3, pd.NA]
+    assert comparison.loc["C", "up"] == 2
+    assert comparison.loc["A", "up"] == -2
+    assert comparison["same"].dropna().eq(0).all()
+    assert comparison.loc[["A", "B", "C"], "MAX_ABS_RANK_CHANGE"].tolist() == [2, 0, 2]
+
+
+def test_evaluate_scenario(combined_normalized, source_config, crba_country_list):
+    scenarios._init_worker(combined_normalized, source_config, crba_country_list)
+    try:
+        schema = AggregationSchema(mean="geometric")
+        geometric = scenarios.evaluate_scenario(Scenario("geo", schema))
+        pd.testing.assert_series_equal(geometric, overall_scores(combined_normalized, crba_country_list, schema).rename("geo"))
+
+        without = scenarios.evaluate_scenario(Scenario("without", AggregationSchema(), excluded_sources=["S-1"]))
+        expected = overall_scores(combined_normalized[combined_normalized["SOURCE_ID"] != "S-1"], crba_country_list)
+        pd.testing.assert_series_equal(without, expected.rename("without"))
+
+        # Normalized again with the parameters of the source config
+        whisker = scenarios.evaluate_scenario(Scenario("w0", AggregationSchema(), whisker_factor=0.5, maximum_score=5))
+        renormalized = pd.concat(
+            [
+                scaler.normalizer(source.drop(columns="SCALED_OBS_VALUE"), None, is_inverted=is_inverted, whisker_factor=0.5, maximum_score=5)
+                for (source_id, source), (*_, is_inverted) in zip(combined_normalized.groupby("SOURCE_ID"), SOURCES)
+            ],
+            ignore_index=True,
+        )
+        pd.testing.assert_series_equal(whisker, overall_scores(renormalized, crba_country_list).rename("w0"))
+        assert not np.allclose(whisker, overall_scores(combined_normalized, crba_country_list))
+    finally:
+        scenarios._worker.clear()
+
+
+def test_run(tmp_path, combined_normalized, source_config, crba_country_list):
+    (tmp_path / "former").mkdir()
+    (tmp_path / "new").mkdir()
+    CsvWriter().write(combined_normalized, tmp_path / "former" / "combined_normalized", quoting=csv.QUOTE_NONNUMERIC)
+    source_config.to_csv(tmp_path / "former" / "source_config.csv", sep=";", quoting=csv.QUOTE_NONNUMERIC)
+    scenarios_path = tmp_path / "scenarios.json"
+    scenarios_path.write_text(json.dumps([{"name": "geo", "mean": "geometric"}, {"name": "without", "excluded_sources": ["S-0"]}]))
+    config = types.SimpleNamespace(
+        output_dir=tmp_path,
+        run_id="new",
+        aggregation_schema=AggregationSchema(),
+        source_config=source_config,
+        country_crba_list=crba_country_list,
+        output_writer=CsvWriter(),
+    )
+
+    comparison = scenarios.run(config, "former", scenarios_path, jobs=2)
+    assert list(comparison.columns) == ["BASELINE_SCORE", "BASELINE_RANK", "geo", "without", "MAX_ABS_RANK_CHANGE"]
+    np.testing.assert_allclose(
+        comparison["BASELINE_SCORE"].sort_index().to_numpy(),
+        overall_scores(combined_normalized, crba_country_list).sort_index().to_numpy(),
+    )
+
+    scenario_scores = read_output(tmp_path / "new" / "scenario_scores")
+    assert len(scenario_scores) == 3 * len(COUNTRIES)
+    resolved = json.loads((tmp_path / "new" / "scenarios.json").read_text())
+    assert [scenario["name"] for scenario in resolved["scenarios"]] == [BASELINE, "geo", "without"]
+    assert (tmp_path / "new" / "scenario_rank_changes.csv").exists()
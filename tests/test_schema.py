@@ -0,0 +1,99 @@
+"""
+Shared categorical dtypes of the SDMX columns and the concatenation of the sources.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from crba_project.aggregate import aggregate_scores
+from crba_project.cleanse import concat_sources
+from crba_project.cleanse.schema import TOTAL, UNMAPPED_VALUE, ColumnSchema
+
+COUNTRIES = ["FRA", "NER", "NGA", "DEU", "MLI"]
+VALUE_MAPPER = {"DIM_SEX": {"MALE": ["M"], "FEMALE": ["F"]}}
+
+
+@pytest.fixture
+def column_schema():
+    source_config = pd.DataFrame(
+        {
+            "SOURCE_ID": ["S-1", "S-2"],
+            "INDICATOR_CODE": ["WP_CL_OC_IND1", "MP_PS_EN_IND2"],
+            "INDEX": ["Workplace", "Marketplace"],
+            "ISSUE": ["Child labour", "Product Safety"],
+            "CATEGORY": ["Outcome", "Enforcement"],
+        }
+    )
+    return ColumnSchema.build(["DIM_SEX", "DIM_AGE"], VALUE_MAPPER, pd.DataFrame({"COUNTRY_ISO_3": COUNTRIES}), source_config)
+
+
+def source(source_id, index, issue, category, seed, dim_age=np.nan):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "SOURCE_ID": source_id,
+            "COUNTRY_ISO_3": np.repeat(COUNTRIES, 2),
+            "INDICATOR_INDEX": index,
+            "INDICATOR_ISSUE": issue,
+            "INDICATOR_CATEGORY": category,
+            "DIM_SEX": ["FEMALE", "MALE"] * len(COUNTRIES),
+            "DIM_AGE": dim_age,
+            "SCALED_OBS_VALUE": np.round(rng.uniform(0, 10, 2 * len(COUNTRIES)), 2),
+        }
+    )
+
+
+def test_build(column_schema):
+    dtypes = column_schema.dtypes
+    assert list(dtypes["DIM_SEX"].categories) == ["FEMALE", "MALE", UNMAPPED_VALUE, TOTAL]
+    assert list(dtypes["DIM_AGE"].categories) == [UNMAPPED_VALUE, TOTAL]
+    # Sorted, so the groupbys keep their order
+    assert list(dtypes["COUNTRY_ISO_3"].categories) == sorted(COUNTRIES)
+    assert list(dtypes["INDICATOR_INDEX"].categories) == ["Marketplace", "Workplace"]
+    assert list(dtypes["OBS_STATUS"].categories) == ["O"]
+
+
+def test_apply(column_schema):
+    data = source("S-1", "Workplace", "Child labour", "Outcome", 1, dim_age=["Y0T4", np.nan] * len(COUNTRIES))
+    data.loc[0, "COUNTRY_ISO_3"] = "XKX"
+    converted = column_schema.apply(data.copy())
+    assert converted["DIM_SEX"].dtype == column_schema.dtypes["DIM_SEX"]
+    # Values without shared category are added to the categories of the source
+    assert "XKX" in converted["COUNTRY_ISO_3"].cat.categories
+    assert list(converted["DIM_AGE"].cat.categories) == [UNMAPPED_VALUE, "Y0T4", TOTAL]
+    for column in ["COUNTRY_ISO_3", "DIM_SEX", "DIM_AGE", "SOURCE_ID"]:
+        pd.testing.assert_series_equal(converted[column].astype(object), data[column].astype(object), check_dtype=False)
+    # Applied again nothing changes. Categoricals with other categories get the shared ones
+    pd.testing.assert_frame_equal(column_schema.apply(converted.copy()), converted)
+    recoded = column_schema.apply(data.assign(DIM_SEX=pd.Categorical(data["DIM_SEX"])))
+    pd.testing.assert_series_equal(recoded["DIM_SEX"], converted["DIM_SEX"])
+
+
+def test_concat_sources(column_schema):
+    sources = [
+        column_schema.apply(source("S-1", "Workplace", "Child labour", "Outcome", 1)),
+        column_schema.apply(source("S-2", "Marketplace", "Product Safety", "Enforcement", 2, dim_age="Y0T4")),
+        # Without schema and without the DIM_AGE column
+        source("S-3", "Marketplace", "Child labour", "Outcome", 3).drop(columns="DIM_AGE"),
+        None,
+    ]
+    combined = concat_sources(sources)
+    assert len(combined) == 30
+    assert combined["COUNTRY_ISO_3"].dtype == column_schema.dtypes["COUNTRY_ISO_3"]
+    assert isinstance(combined["DIM_AGE"].dtype, pd.CategoricalDtype)
+    assert combined["DIM_AGE"].isna().sum() == 20
+    assert combined["SOURCE_ID"].astype(object).tolist() == ["S-1"] * 10 + ["S-2"] * 10 + ["S-3"] * 10
+
+
+def test_aggregation_equal_with_categoricals(column_schema):
+    sources = [
+        source("S-1", "Workplace", "Child labour", "Outcome", 1),
+        source("S-2", "Marketplace", "Product Safety", "Enforcement", 2),
+        source("S-3", "Marketplace", "Child labour", "Outcome", 3),
+    ]
+    crba_country_list = pd.DataFrame({"COUNTRY_ISO_3": COUNTRIES})
+    plain = aggregate_scores(pd.concat(sources, ignore_index=True), crba_country_list)
+    categorical = aggregate_scores(concat_sources([column_schema.apply(data.copy()) for data in sources]), crba_country_list)
+    for expected, result in zip(plain, categorical):
+        result = result.astype({column: object for column, dtype in result.dtypes.items() if dtype == "category"})
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,136 @@
+"""
+SessionManager: shared downloads, retain/release of the completed responses and the retry settings.
+
+The sessions are replaced by a FakeSession, nothing is downloaded.
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+from crba_project.extractor.session import RETRY_STATUS, SessionManager
+
+URL = "https://api.example.org/data"
+
+
+class FakeSession:
+    def __init__(self, error=None, wait=None):
+        """
+        :param error: Exception raised by every request
+        :param wait: threading.Event each request waits for
+        """
+        self.calls = []
+        self.error = error
+        self.wait = wait
+        self.started = threading.Event()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append((url, params, headers, timeout))
+        self.started.set()
+        if self.wait is not None:
+            self.wait.wait(5)
+        if self.error is not None:
+            raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = f"payload {len(self.calls)}".encode()
+        return response
+
+
+@pytest.fixture
+def manager():
+    return SessionManager(timeout=7)
+
+
+def fake(manager, **kwargs):
+    session = FakeSession(**kwargs)
+    manager.session = lambda url: session
+    return session
+
+
+def test_completed_responses_are_dropped(manager):
+    session = fake(manager)
+    assert manager.get(URL, params={"page": 1}).content == b"payload 1"
+    assert manager.get(URL, params={"page": 1}).content == b"payload 2"
+    assert session.calls == [(URL, {"page": 1}, None, 7)] * 2
+    assert manager._responses == {}
+
+
+def test_concurrent_requests_share_one_download(manager):
+    session = fake(manager, wait=threading.Event())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get(URL))) for _ in range(3)]
+    threads[0].start()
+    session.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # The other threads wait for the request in flight
+    time.sleep(0.2)
+    session.wait.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(session.calls) == 1
+    assert len(results) == 3 and all(result is results[0] for result in results)
+    assert manager._responses == {}
+
+
+def test_retained_responses_are_kept_until_released(manager):
+    session = fake(manager)
+    manager.retain([URL, URL])
+    first = manager.get(URL)
+    assert manager.get(URL) is first
+    manager.release([URL])
+    assert manager.get(URL) is first
+    manager.release([URL])
+    assert manager._responses == {} and not manager._retained
+    assert manager.get(URL) is not first
+    assert len(session.calls) == 2
+
+
+def test_release_before_download(manager):
+    session = fake(manager)
+    manager.retain([URL])
+    manager.release([URL])
+    manager.get(URL)
+    assert manager._responses == {}
+    assert len(session.calls) == 1
+
+
+def test_seeded_responses(manager):
+    session = fake(manager)
+    response = requests.Response()
+    manager.seed({URL: response})
+    assert manager.get(URL) is response
+    assert manager.get(URL) is response
+    manager.release([URL])
+    assert manager._responses == {}
+    assert manager.get(URL) is not response
+    assert len(session.calls) == 1
+
+
+def test_errors_are_shared_but_not_kept(manager):
+    session = fake(manager, error=requests.ConnectionError("refused"))
+    manager.retain([URL])
+    with pytest.raises(requests.ConnectionError):
+        manager.get(URL)
+    # The retained error is raised again, without another request
+    with pytest.raises(requests.ConnectionError):
+        manager.get(URL)
+    manager.release([URL])
+    with pytest.raises(requests.ConnectionError):
+        manager.get(URL)
+    assert len(session.calls) == 2
+
+
+def test_retry_settings():
+    manager = SessionManager(retries=3, backoff_factor=2, pool_maxsize=4)
+    session = manager.session(URL)
+    assert manager.session(URL + "/other") is session
+    assert manager.session("https://other.example.org") is not session
+    adapter = session.get_adapter(URL)
+    assert adapter.max_retries.total == 3
+    assert adapter.max_retries.backoff_factor == 2
+    assert set(adapter.max_retries.status_forcelist) == set(RETRY_STATUS)
+    assert adapter.max_retries.respect_retry_after_header
+    assert adapter._pool_maxsize == 4
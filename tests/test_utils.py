@@ -0,0 +1,49 @@
+"""
+Indicator codes and the vendored stopwords.
+"""
+import nltk
+import pytest
+
+from crba_project.utils import utils
+
+
+@pytest.fixture
+def without_nltk_data(monkeypatch):
+    """
+    Fail on any access to the nltk data
+    """
+
+    def fail(*args, **kwargs):
+        raise AssertionError("nltk data accessed")
+
+    monkeypatch.setattr(utils, "ensure_nltk_resource", fail)
+    monkeypatch.setattr(nltk.corpus, "stopwords", property(fail))
+    monkeypatch.setattr(nltk, "download", fail)
+    utils.stopwords.cache_clear()
+    utils.create_ind_code.cache_clear()
+    yield
+    utils.stopwords.cache_clear()
+    utils.create_ind_code.cache_clear()
+
+
+def test_stopwords_are_read_from_the_resource(without_nltk_data):
+    words = utils.stopwords()
+    assert isinstance(words, frozenset)
+    # All languages of the corpus, e.g. the Hinglish "use" and "people"
+    assert {"the", "of", "und", "use", "people"} <= words
+    assert "" not in words
+
+
+@pytest.mark.parametrize(
+    "indicator_name,code",
+    [
+        ("Operational policy on tobacco use", "OPPOTO"),
+        ("Number of people internally displaced by conflict and violence", "NUIDCV"),
+        ("Recruitment and use of children in hostilities", "RECHHO"),
+        ("Age limits off-premise alcohol sale", "AGLIOA"),
+        ("Child labour", "CHILAB"),
+    ],
+)
+def test_create_ind_code(indicator_name, code, without_nltk_data):
+    # The codes of earlier runs
+    assert utils.create_ind_code(indicator_name) == code